@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+"""
+Script to measure the memory saved against the CPU spent by compressing
+cached values.
+
+Run from the root of the repository with REDISCLOUD_URL pointing at a cache
+filled by the site to measure the values it actually holds, i.e. published
+guides, listings, rendered HTML, etc.:
+
+    python bin/benchmark_cache_compression.py
+
+Or measure files instead, i.e. guides from a clone of the guides repository:
+
+    python bin/benchmark_cache_compression.py published/*/*/article.md
+"""
+
+import argparse
+import os
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pskb_website import cache
+
+
+def main(filenames, min_size, levels, iterations):
+    if filenames:
+        values = read_files(filenames)
+    else:
+        values = read_cache()
+        if values is None:
+            print 'No cache available, set REDISCLOUD_URL or pass files'
+            return
+
+    count = len(values)
+    total = sum(len(value) for value in values)
+    values = [value for value in values if len(value) >= min_size]
+    size = sum(len(value) for value in values)
+
+    print '%d value(s), %d bytes, %d value(s) of %d+ bytes, %d bytes' % (
+            count, total, len(values), min_size, size)
+
+    if not values:
+        return
+
+    for level in levels:
+        report(level, values, total, iterations)
+
+
+def read_files(filenames):
+    """Get contents of all files"""
+
+    values = []
+    for filename in filenames:
+        with open(filename, 'rb') as file_obj:
+            values.append(file_obj.read())
+
+    return values
+
+
+def read_cache():
+    """Get all string values in the cache as they were saved"""
+
+    if not cache.is_enabled():
+        return None
+
+    values = []
+    for key in cache.redis_obj.scan_iter(count=1000):
+        if cache.redis_obj.type(key) != 'string':
+            continue
+
+        value = cache._decompress(cache.redis_obj.get(key))
+        if value is not None:
+            values.append(value)
+
+    return values
+
+
+def report(level, values, total, iterations):
+    """Print memory saved and time spent compressing at level"""
+
+    start = time.time()
+    for _ in xrange(iterations):
+        compressed = [zlib.compress(value, level) for value in values]
+    compress_time = (time.time() - start) / iterations
+
+    start = time.time()
+    for _ in xrange(iterations):
+        for value in compressed:
+            zlib.decompress(value)
+    decompress_time = (time.time() - start) / iterations
+
+    # Values that don't get smaller are saved as they are
+    saved = sum(max(len(value) - len(c) - len(cache.COMPRESSED_HEADER), 0)
+                for value, c in zip(values, compressed))
+
+    print ('level %d: saved %d bytes (%.1f%% of all values) '
+           '%.3f ms/save %.3f ms/read') % (
+            level, saved, saved * 100.0 / total,
+            compress_time * 1000 / len(values),
+            decompress_time * 1000 / len(values))
+
+
+def _parse_args():
+    """Parse args and get dictionary back"""
+
+    parser = argparse.ArgumentParser(description='Benchmark compressing cached values')
+    parser.add_argument('filenames', nargs='*',
+                        help='Files to measure instead of the values in the cache')
+    parser.add_argument('-m', '--min-size', action='store', type=int,
+                        default=cache.DEFAULT_COMPRESS_MIN_SIZE,
+                        dest='min_size',
+                        help='Only compress values of at least this many bytes (default: %d)' % (
+                            cache.DEFAULT_COMPRESS_MIN_SIZE))
+    parser.add_argument('-l', '--level', action='append', type=int,
+                        dest='levels',
+                        help='zlib level to measure, can be repeated (default: %d)' % (
+                            cache.COMPRESS_LEVEL))
+    parser.add_argument('-n', '--iterations', action='store', type=int,
+                        default=10,
+                        help='Number of times to compress each value (default: 10)')
+
+    # Turn odd argparse namespace object into a plain dict
+    return vars(parser.parse_args())
+
+
+if __name__ == '__main__':
+    args = _parse_args()
+    main(args['filenames'], args['min_size'],
+         args['levels'] or [cache.COMPRESS_LEVEL], args['iterations'])
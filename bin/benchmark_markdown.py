@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""
+Script to compare the speed of rendering markdown with the local renderer
+against the github markdown API.
+
+Run from the root of the repository with one or more markdown files:
+
+    python bin/benchmark_markdown.py guide.md other_guide.md
+
+Set the GITHUB_TOKEN environment variable to avoid the low unauthenticated
+rate limit when using --compare-github.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pskb_website import gfm
+
+GITHUB_MARKDOWN_URL = 'https://api.github.com/markdown'
+
+
+def main(filenames, iterations, compare_github=False):
+    texts = []
+    for filename in filenames:
+        with open(filename, 'r') as file_obj:
+            texts.append(unicode(file_obj.read(), encoding='utf-8'))
+
+    size = sum(len(text) for text in texts)
+    print 'Rendering %d file(s), %d characters, %d time(s)' % (len(texts),
+                                                              size, iterations)
+
+    elapsed = time_local(texts, iterations)
+    report('local', elapsed, len(texts) * iterations)
+
+    if compare_github:
+        elapsed = time_github(texts, iterations)
+        if elapsed is not None:
+            report('github', elapsed, len(texts) * iterations)
+
+
+def time_local(texts, iterations):
+    """Get number of seconds to render all texts iterations times locally"""
+
+    start = time.time()
+    for _ in xrange(iterations):
+        for text in texts:
+            gfm.render(text)
+
+    return time.time() - start
+
+
+def time_github(texts, iterations):
+    """
+    Get number of seconds to render all texts iterations times with the github
+    API or None if a request fails
+    """
+
+    headers = {}
+    token = os.environ.get('GITHUB_TOKEN')
+    if token:
+        headers['Authorization'] = 'token %s' % (token)
+
+    session = requests.Session()
+
+    start = time.time()
+    for _ in xrange(iterations):
+        for text in texts:
+            resp = session.post(GITHUB_MARKDOWN_URL, headers=headers,
+                                json={'text': text, 'mode': 'gfm'})
+            if resp.status_code != 200:
+                print 'Failed rendering with github, status_code: %d' % (
+                        resp.status_code)
+                return None
+
+    return time.time() - start
+
+
+def report(name, elapsed, renders):
+    """Print timing results"""
+
+    print '%8s: %8.3f seconds total %8.2f ms/render %8.1f renders/second' % (
+            name, elapsed, elapsed * 1000 / renders,
+            renders / elapsed if elapsed else float('inf'))
+
+
+def _parse_args():
+    """Parse args and get dictionary back"""
+
+    parser = argparse.ArgumentParser(description='Benchmark markdown rendering')
+    parser.add_argument('filenames', nargs='+',
+                        help='Markdown files to render')
+    parser.add_argument('-n', '--iterations', action='store', type=int,
+                        default=100,
+                        help='Number of times to render each file (default: 100)')
+    parser.add_argument('--compare-github', action='store_true',
+                        default=False, dest='compare_github',
+                        help='Also time rendering with the github markdown API')
+
+    # Turn odd argparse namespace object into a plain dict
+    return vars(parser.parse_args())
+
+
+if __name__ == '__main__':
+    args = _parse_args()
+    main(args['filenames'], args['iterations'], args['compare_github'])
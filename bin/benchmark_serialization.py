@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""
+Script to compare the speed and size of the compact format articles are
+cached in against the pretty-printed json they used to be cached in.
+
+Run from the root of the repository with one or more guide directories from a
+clone of the guides repository, i.e. directories with an article.md and
+details.json file:
+
+    python bin/benchmark_serialization.py published/*/*/
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pskb_website.models import article as article_mod
+from pskb_website.models import lib
+
+
+def main(directories, iterations):
+    articles = read_articles(directories)
+    if not articles:
+        print 'No guides found, pass directories with %s and %s files' % (
+                article_mod.ARTICLE_FILENAME,
+                article_mod.ARTICLE_METADATA_FILENAME)
+        return
+
+    print 'Serializing %d guide(s) %d time(s)' % (len(articles), iterations)
+
+    report('to_json', articles, iterations, lib.to_json,
+           article_mod.Article.from_json)
+    report('to_cache_json', articles, iterations, lib.to_cache_json,
+           lambda str_: lib.object_from_attrs(article_mod.Article,
+                                              lib.from_cache_json(str_)))
+
+
+def read_articles(directories):
+    """Get article objects filled out like the ones saved in the cache"""
+
+    articles = []
+    for directory in directories:
+        meta_data_path = os.path.join(directory,
+                                      article_mod.ARTICLE_METADATA_FILENAME)
+        article_path = os.path.join(directory, article_mod.ARTICLE_FILENAME)
+
+        if not os.path.exists(meta_data_path) or not os.path.exists(article_path):
+            continue
+
+        with open(meta_data_path, 'r') as file_obj:
+            article = article_mod.Article.from_json(file_obj.read())
+
+        with open(article_path, 'r') as file_obj:
+            article.content = unicode(file_obj.read(), encoding='utf-8')
+
+        articles.append(article)
+
+    return articles
+
+
+def report(name, articles, iterations, encode, decode):
+    """Print size and time spent encoding and decoding articles"""
+
+    start = time.time()
+    for _ in xrange(iterations):
+        encoded = [encode(article) for article in articles]
+    encode_time = (time.time() - start) / iterations
+
+    start = time.time()
+    for _ in xrange(iterations):
+        for str_ in encoded:
+            decode(str_)
+    decode_time = (time.time() - start) / iterations
+
+    print '%s: %d bytes %.3f ms/encode %.3f ms/decode' % (
+            name, sum(len(str_) for str_ in encoded),
+            encode_time * 1000 / len(articles),
+            decode_time * 1000 / len(articles))
+
+
+def _parse_args():
+    """Parse args and get dictionary back"""
+
+    parser = argparse.ArgumentParser(description='Benchmark serializing cached guides')
+    parser.add_argument('directories', nargs='+',
+                        help='Guide directories to read')
+    parser.add_argument('-n', '--iterations', action='store', type=int,
+                        default=100,
+                        help='Number of times to serialize each guide (default: 100)')
+
+    # Turn odd argparse namespace object into a plain dict
+    return vars(parser.parse_args())
+
+
+if __name__ == '__main__':
+    args = _parse_args()
+    main(args['directories'], args['iterations'])
@@ -18,7 +18,25 @@ HEROKU_ENV_REQUIREMENTS = ('HEROKU', 'SECRET_KEY', 'GITHUB_CLIENT_ID',
                            'DOMAIN', 'SOCIAL_DOMAIN', 'CELERY_BROKER_URL',
                            'CELERY_TASK_SERIALIZER', 'IGNORE_STATS_FOR',
                            'WEBHOOK_SECRET', 'ENABLE_HEARTING',
-                           'GITHUB_CALLBACK_URL', 'SUBFOLDER')
+                           'GITHUB_CALLBACK_URL', 'SUBFOLDER',
+                           'GITHUB_POOL_CONNECTIONS', 'GITHUB_POOL_MAXSIZE',
+                           'GITHUB_POOL_BLOCK', 'GITHUB_HTTP_TIMEOUT',
+                           'MARKDOWN_RENDERER', 'GIT_MIRROR_PATH',
+                           'GIT_MIRROR_MAX_AGE', 'GIT_MIRROR_LOCK_TIMEOUT',
+                           'GIT_BATCH_POOL_SIZE', 'GIT_WORKING_CLONE_PATH',
+                           'GIT_WORKING_CLONE_LOCK_TIMEOUT',
+                           'MAX_CONCURRENCY', 'CONTENT_CACHE_MAX_ENTRIES',
+                           'GITHUB_RATE_LIMIT_RESERVE',
+                           'GITHUB_BACKGROUND_MAX_WAIT',
+                           'SINGLE_FLIGHT_LEASE_TIMEOUT',
+                           'GITHUB_DEGRADED_RATE_LIMIT',
+                           'GITHUB_FAILURE_THRESHOLD',
+                           'GITHUB_UNHEALTHY_TIMEOUT', 'STALE_CACHE_TIMEOUT',
+                           'WARM_CACHE_INTERVAL', 'WARM_CACHE_MAX_ARTICLES',
+                           'LOCAL_CACHE_TIMEOUT', 'LOCAL_CACHE_MAX_ENTRIES',
+                           'CACHE_COMPRESS_MIN_SIZE',
+                           'CACHE_STATS_LOG_INTERVAL',
+                           'MISSING_FILE_CACHE_TIMEOUT')
 
 
 class Config(object):
@@ -35,6 +53,94 @@ class Config(object):
     REPO_NAME = None
     REPO_OWNER_ACCESS_TOKEN = None
 
+    # Connection pooling for all requests to github.  GITHUB_POOL_MAXSIZE is
+    # the number of keep-alive connections per host so it should be close to
+    # the number of concurrent requests each worker makes to github.
+    GITHUB_POOL_CONNECTIONS = 4
+    GITHUB_POOL_MAXSIZE = 32
+    GITHUB_POOL_BLOCK = False
+    GITHUB_HTTP_TIMEOUT = 30
+
+    # Requests from celery tasks and webhooks never use the last
+    # GITHUB_RATE_LIMIT_RESERVE requests of the github rate limit so page
+    # views always have some left.  Background requests wait up to
+    # GITHUB_BACKGROUND_MAX_WAIT seconds for the rate limit to reset before
+    # they are retried later instead.
+    GITHUB_RATE_LIMIT_RESERVE = 500
+    GITHUB_BACKGROUND_MAX_WAIT = 60
+
+    # Most seconds a worker waits on another worker making the same github
+    # request before making it too
+    SINGLE_FLIGHT_LEASE_TIMEOUT = 10
+
+    # Guides and listings are only served from the cache, stale or not, when
+    # fewer than GITHUB_DEGRADED_RATE_LIMIT requests are left or after
+    # GITHUB_FAILURE_THRESHOLD failed requests in a row.  Github is tried
+    # again after GITHUB_UNHEALTHY_TIMEOUT seconds.
+    GITHUB_DEGRADED_RATE_LIMIT = 50
+    GITHUB_FAILURE_THRESHOLD = 5
+    GITHUB_UNHEALTHY_TIMEOUT = 60
+
+    # Seconds to keep guides and listings in the cache after they expire so
+    # they can be served while they're refreshed in the background
+    STALE_CACHE_TIMEOUT = 24 * 60 * 60
+
+    # Seconds to remember a guide was not found on github so looking it up
+    # again, i.e. under every status, doesn't cost any requests.  Saving the
+    # guide or a push event adding it clears this right away.
+    MISSING_FILE_CACHE_TIMEOUT = 5 * 60
+
+    # Celery beat refreshes the most popular published guides, file listings
+    # and stats every WARM_CACHE_INTERVAL seconds before they expire
+    WARM_CACHE_INTERVAL = 5 * 60
+    WARM_CACHE_MAX_ARTICLES = 50
+
+    # Each process keeps up to LOCAL_CACHE_MAX_ENTRIES values it read from the
+    # cache in memory for LOCAL_CACHE_TIMEOUT seconds, set either to 0 to
+    # always read from redis
+    LOCAL_CACHE_TIMEOUT = 60
+    LOCAL_CACHE_MAX_ENTRIES = 1000
+
+    # Cached values at least this many bytes are compressed, 0 to disable.  See
+    # bin/benchmark_cache_compression.py for the memory saved and CPU spent.
+    CACHE_COMPRESS_MIN_SIZE = 1024
+
+    # Each process logs its cache hits, misses, etc. every
+    # CACHE_STATS_LOG_INTERVAL seconds, 0 to disable.  Collaborators can also
+    # see them at /cache_stats.
+    CACHE_STATS_LOG_INTERVAL = 10 * 60
+
+    # Render markdown with the built-in renderer ('local') or the github
+    # markdown API ('github').  The local renderer saves an API request for
+    # every rendered file.
+    MARKDOWN_RENDERER = 'local'
+
+    # Optional path to keep a bare clone of the main repo for reading guides
+    # without using the github API.  GIT_MIRROR_MAX_AGE is the most seconds to
+    # go without fetching from github in case we miss a push webhook.
+    GIT_MIRROR_PATH = ''
+    GIT_MIRROR_MAX_AGE = 5 * 60
+    GIT_MIRROR_LOCK_TIMEOUT = 60
+
+    # Max number of long-running git cat-file processes per process for
+    # reading objects out of the mirror
+    GIT_BATCH_POOL_SIZE = 4
+
+    # Working clone of the main repo kept around for moving guides between
+    # stacks and publish statuses.  Defaults to a directory in the system temp
+    # directory.
+    GIT_WORKING_CLONE_PATH = ''
+    GIT_WORKING_CLONE_LOCK_TIMEOUT = 5 * 60
+
+    # Max number of github API requests made at once when fanning out, i.e.
+    # reading subtrees of large repositories or metadata for every guide
+    MAX_CONCURRENCY = 8
+
+    # Max number of blobs and tree listings to keep in the cache.  These are
+    # keyed by git SHA so they never expire, the least recently used are
+    # evicted instead.
+    CONTENT_CACHE_MAX_ENTRIES = 20000
+
     CELERY_TASK_SERIALIZER = 'json'
     CELERY_BROKER_URL = None
 
@@ -7,6 +7,24 @@ if 'APP_SETTINGS' not in os.environ:
     os.environ['APP_SETTINGS'] = 'config.DevelopmentConfig'
 
 from pskb_website import app
+from pskb_website import cache
 
 manager = Manager(app)
+
+
+@manager.command
+def invalidate_cache(branch=None, status=None):
+    """Invalidate cached guides, listings and users"""
+
+    if branch is not None:
+        namespaces = [cache.branch_namespace(branch)]
+    elif status is not None:
+        namespaces = [cache.status_namespace(status)]
+    else:
+        namespaces = [cache.GLOBAL_NAMESPACE]
+
+    if not cache.bump_generation(*namespaces):
+        print 'Failed invalidating cache, is REDISCLOUD_URL set?'
+
+
 manager.run()
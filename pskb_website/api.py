@@ -15,7 +15,11 @@ from . import models
 from . import tasks
 from . import filters
 from . import remote
+from . import http_pool
+from . import singleflight
+from . import cache
 from .lib import login_required
+from .lib import collaborator_required
 
 
 @app.route('/api/save', methods=['POST'])
@@ -97,8 +101,7 @@ def api_save():
         # and title.  This would lead to duplicate URLs and we want to
         # prevent users from ever creating a clash instead of detecting this
         # change
-        article = models.search_for_article(title, stacks=stacks)
-        if article is not None:
+        if models.title_in_use(title, stacks=stacks):
             if stacks is None:
                 msg = u'Please try choosing a stack. The title "%s" is already used by a guide.' % (title)
             else:
@@ -233,6 +236,33 @@ def gh_rate_limit():
                     mimetype='application/json')
 
 
+@app.route('/gh_client_stats')
+@collaborator_required
+def gh_client_stats():
+    """
+    Debug request to view usage of connection pools to Github and how many
+    reads were coalesced
+    """
+
+    stats = {'pools': http_pool.pool_stats(),
+             'single_flight': singleflight.stats()}
+
+    return Response(response=json.dumps(stats), status=200,
+                    mimetype='application/json')
+
+
+@app.route('/cache_stats')
+@collaborator_required
+def cache_stats():
+    """
+    Debug request to view cache hits, misses and latency per family of keys
+    for the process handling the request
+    """
+
+    return Response(response=json.dumps(cache.stats()), status=200,
+                    mimetype='application/json')
+
+
 @app.route('/api/add-heart', methods=['POST'])
 @login_required
 def add_heart():
@@ -20,21 +20,162 @@ we could easily switch later without other layers needing changes.
 
 In addition, this layer knows how to turn arguments into cache keys.
 
+Use get_many(), save_many() and delete_many() when touching several keys at
+once so they cost a single round trip to redis instead of one per key.
+
+The exception is content keyed by git SHA, i.e. blobs and tree listings.
+These can never change so they are saved without a timeout.  Instead the least
+recently used entries are evicted once there are more than
+CONTENT_CACHE_MAX_ENTRIES of them.
+
+Files, i.e. guides and listings, have a soft and a hard expiry.  Their
+timeout is the soft expiry and a marker key saying the file is fresh expires
+with it.  The file itself is kept for STALE_CACHE_TIMEOUT seconds longer so it
+can be served stale while it's refreshed in the background or when github is
+unavailable.
+
+Every process also keeps the values it reads most often in memory for up to
+LOCAL_CACHE_TIMEOUT seconds so hot keys don't cost a round trip to redis.
+Saving or deleting a key broadcasts an invalidation over redis pub/sub so the
+other processes drop their copy.  Values are only kept in memory while the
+process is subscribed to invalidations.  Keys that must always be current,
+i.e. rate limits, are never kept in memory.
+
+Guides, listings and users are also saved under a generation of each
+namespace they belong to, i.e. the whole site, their branch and their publish
+status.  Bumping the generation of a namespace with bump_generation()
+invalidates every key in it at once without knowing what the keys are.  The
+entries saved under old generations are never read again and fall out of the
+cache once their timeout passes.  Generations are read like any other key so
+they're normally kept in memory and cost nothing to check.
+
+Values of CACHE_COMPRESS_MIN_SIZE bytes or more are compressed with zlib
+before they're saved.  Compressed values start with a byte nothing else we
+cache starts with so values saved uncompressed still read back as they are.
+See bin/benchmark_cache_compression.py to measure what this saves.
+
+The index of where each guide is on the master branch is kept in hashes
+without any timeout, see save_article_index().  It's rebuilt from scratch
+regularly instead.
+
+Reads and writes are counted per family of keys along with how long they
+take, see stats() and the cache_stats module.
+
 Note we can use the same database for caching and models.heart data so you
 should be careful to never clash keys unless you set the REDIS_HEARTS_DB_URL
 environment variable to another database than this module uses!
 """
 
 import functools
+import json
+import os
+import random
+import time
+import uuid
+import zlib
 
 from . import app
+from . import STATUSES
+from . import cache_stats
+from . import lru
 from . import utils
 
 # 8 minutes
 DEFAULT_CACHE_TIMEOUT = 8 * 60
 
+# Responses saved for conditional requests are always revalidated with github
+# before being used so they never go stale.  The timeout only exists to let
+# entries for URLs we stop requesting fall out of the cache.
+CONDITIONAL_RESPONSE_TIMEOUT = 24 * 60 * 60
+
+# Rendered markdown is keyed by the SHA of the text so it never changes.  The
+# timeout only exists to let entries for old versions fall out of the cache.
+RENDERED_MARKDOWN_TIMEOUT = 7 * 24 * 60 * 60
+
+# Files are kept this much longer than their timeout so they can be served
+# stale while they are refreshed or when github is unavailable
+DEFAULT_STALE_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Seconds to remember a guide was not found on github
+DEFAULT_MISSING_FILE_TIMEOUT = 5 * 60
+
+# Max number of entries keyed by git SHA to keep before evicting the least
+# recently used ones
+DEFAULT_CONTENT_CACHE_MAX_ENTRIES = 20000
+
+# Sorted set of keys for content keyed by git SHA scored by last access time
+CONTENT_LRU_KEY = 'content:lru'
+
+# Sorted set of published guides scored by how often they are read
+ARTICLE_ACCESS_KEY = 'access:articles'
+
+# Guides read less than this since the scores were last decayed are dropped
+MIN_ARTICLE_ACCESS_SCORE = 0.5
+
+# Hash per slug of title of guides mapping slugs of their stacks to where the
+# guide is, see save_article_index()
+ARTICLE_INDEX_KEY = 'index:article:%s'
+
+# Set of every title slug in the index of guides
+ARTICLE_INDEX_TITLES_KEY = 'index:articles'
+
+# Time the index of guides was last built from scratch, lookups return None
+# until it exists so callers know to fall back to searching
+ARTICLE_INDEX_BUILT_KEY = 'index:articles:built'
+
+# Seconds values are kept in memory of each process, 0 to disable
+DEFAULT_LOCAL_CACHE_TIMEOUT = 60
+
+# Max number of values kept in memory of each process
+DEFAULT_LOCAL_CACHE_MAX_ENTRIES = 1000
+
+# Values larger than this are only kept in redis
+LOCAL_CACHE_MAX_VALUE_SIZE = 256 * 1024
+
+# Pub/sub channel keys saved or deleted are broadcast on
+INVALIDATE_CHANNEL = 'cache:invalidate'
+
+# Seconds to wait before subscribing again after losing the connection
+RESUBSCRIBE_DELAY = 5
+
+# Namespace covering every guide, listing and user, see bump_generation()
+GLOBAL_NAMESPACE = 'global'
+
+# Generations are forgotten this long after they were last bumped so deleted
+# branches don't leave them behind forever.  Must be longer than any entry in
+# a namespace is kept.
+GENERATION_TIMEOUT = 30 * 24 * 60 * 60
+
+# Values at least this many bytes are compressed, 0 to disable
+DEFAULT_COMPRESS_MIN_SIZE = 1024
+
+# zlib compression level, 6 is zlib's own default balance of speed and size
+COMPRESS_LEVEL = 6
+
+# First byte of compressed values, JSON, HTML and markdown never start with it
+COMPRESSED_HEADER = '\x00'
+
+# Families of keys use of the cache is counted against, see stats()
+ARTICLE_FAMILY = 'article'
+FILE_FAMILY = 'file'
+LISTING_FAMILY = 'listing'
+USER_FAMILY = 'user'
+FEATURED_FAMILY = 'featured'
+GITHUB_FAMILY = 'github'
+RATE_LIMIT_FAMILY = 'ratelimit'
+GENERATION_FAMILY = 'generation'
+MISSING_FAMILY = 'missing'
+OTHER_FAMILY = 'other'
+
+# Fraction of their timeout keys are kept longer at random, see _save_all()
+TIMEOUT_JITTER = 0.1
+
 redis_obj = None
 
+# In memory cache for this process, see _local_cache()
+_local = {'pid': None, 'id': None, 'cache': None, 'subscribed': False,
+          'invalidations': 0}
+
 try:
     url = app.config['REDISCLOUD_URL']
 except KeyError:
@@ -48,13 +189,6 @@ else:
             app.logger.warning('No caching available, missing redis module')
 
 
-# Local cache of etags from API requests for file listing. Saving these here
-# b/c they are small and can be kept in RAM without having to do http request
-# to redis.
-# Keyed by (repo, sha, filename)
-FILE_LISTING_ETAGS = {}
-
-
 def is_enabled():
     """
     Determine if cache is enabled or not
@@ -80,61 +214,278 @@ def verify_redis_instance(func):
 
 
 @verify_redis_instance
-def save(key, value, timeout=DEFAULT_CACHE_TIMEOUT):
+def save(key, value, timeout=DEFAULT_CACHE_TIMEOUT, local=True, jitter=True,
+         family=OTHER_FAMILY):
     """
     Generic function to save a key/value pair
 
     :param key: Key to save
     :param value: Value to save
     :param timeout: Timeout in seconds to cache text, use None for no timeout
-    :returns: True or False if save succeeded, irrespective of setting the
-              timeout
+    :param local: False to skip keeping value in memory and broadcasting the
+                  change to other processes
+    :param jitter: False to expire value after exactly timeout seconds
+    :param family: Name of family of keys to count save against, see stats()
+    :returns: True or False if save succeeded
     """
 
-    try:
-        redis_obj.set(key, value)
-    except Exception:
-        app.logger.warning('Failed saving key "%s" to cache:', key,
-                           exc_info=True)
-        return False
+    return _save_all([(key, value, timeout)], local=local, jitter=jitter,
+                     family=family)
 
-    if timeout is not None:
-        try:
-            redis_obj.expire(key, timeout)
-        except Exception:
-            app.logger.warning('Failed setting key "%s", timeout: %d expiration in cache:',
-                               key, timeout, exc_info=True)
 
-    return True
+@verify_redis_instance
+def save_many(values, timeout=DEFAULT_CACHE_TIMEOUT, local=True,
+              family=OTHER_FAMILY):
+    """
+    Save several key/value pairs in a single round trip
+
+    :param values: Dictionary of key to value
+    :param timeout: Timeout in seconds to cache values, use None for no
+                    timeout
+    :param local: False to skip keeping values in memory and broadcasting the
+                  change to other processes
+    :param family: Name of family of keys to count saves against
+    :returns: True or False if save succeeded
+    """
+
+    return _save_all([(key, value, timeout)
+                      for key, value in values.iteritems()], local=local,
+                     family=family)
 
 
 @verify_redis_instance
-def get(key):
+def get(key, local=True, family=OTHER_FAMILY):
     """
     Look for cached value with given key
 
     :param key: Key data was cached with
+    :param local: False to always read value from redis
+    :param family: Name of family of keys to count read against, see stats()
     :returns: Value saved or None if not found or error
     """
 
+    return get_many([key], local=local, family=family)[0]
+
+
+@verify_redis_instance
+def get_many(keys, local=True, family=OTHER_FAMILY):
+    """
+    Look for cached values with given keys in a single round trip
+
+    :param keys: Iterable of keys data was cached with
+    :param local: False to always read values from redis
+    :param family: Name of family of keys to count reads against
+    :returns: List of values saved in same order as keys, None for each value
+              not found or all values not kept in memory on error
+    """
+
+    keys = list(keys)
+    return _get_many(keys, local, family, len(keys))
+
+
+def _get_many(keys, local, family, counted):
+    """
+    Look for cached values with given keys in a single round trip
+
+    :param keys: List of keys data was cached with
+    :param local: False to always read values from redis
+    :param family: Name of family of keys to count reads against
+    :param counted: Number of keys from the start of the list to count as hits
+                    or misses, the rest are markers like _fresh_key()
+    :returns: List of values, see get_many()
+    """
+
+    values = [None] * len(keys)
+    missing = []
+
+    local_cache = _local_cache() if local else None
+    for index, key in enumerate(keys):
+        if local_cache is not None:
+            values[index] = local_cache.get(_local_key(key))
+
+        if values[index] is None:
+            missing.append(index)
+
+    local_hits = len([i for i in xrange(counted) if values[i] is not None])
+
+    if not missing:
+        cache_stats.record(family, hits=local_hits, local_hits=local_hits)
+        return values
+
+    invalidations = _local['invalidations']
+    start = time.time()
+
+    try:
+        found = redis_obj.mget([keys[index] for index in missing])
+    except Exception:
+        app.logger.warning('Failed reading keys %s from cache:',
+                           [keys[index] for index in missing], exc_info=True)
+        cache_stats.record(family, hits=local_hits, local_hits=local_hits,
+                           misses=counted - local_hits, errors=1,
+                           seconds=time.time() - start)
+        return values
+
+    seconds = time.time() - start
+
+    # Skip keeping values if they could have changed while we were reading
+    keep = (local_cache is not None and
+            invalidations == _local['invalidations'])
+
+    bytes_read = 0
+    for index, value in zip(missing, found):
+        if value is not None:
+            bytes_read += len(value)
+
+        value = values[index] = _decompress(value)
+        if keep:
+            _save_local(keys[index], value)
+
+    hits = len([i for i in xrange(counted) if values[i] is not None])
+    cache_stats.record(family, hits=hits, local_hits=local_hits,
+                       misses=counted - hits, bytes_read=bytes_read,
+                       seconds=seconds)
+
+    return values
+
+
+@verify_redis_instance
+def delete_many(keys, family=OTHER_FAMILY):
+    """
+    Delete several keys in a single round trip
+
+    :param keys: Iterable of keys to delete
+    :param family: Name of family of keys to count deletes against
+    :returns: None
+    """
+
+    keys = list(keys)
+    if not keys:
+        return
+
+    start = time.time()
+
     try:
-        return redis_obj.get(key)
+        pipe = redis_obj.pipeline(transaction=False)
+        pipe.delete(*keys)
+        _publish_invalidations(pipe, keys)
+        pipe.execute()
     except Exception:
-        app.logger.warning('Failed reading key "%s" from cache:', key,
+        app.logger.warning('Failed deleting keys %s from cache:', keys,
                            exc_info=True)
-        return None
+        cache_stats.record(family, errors=1, seconds=time.time() - start)
+    else:
+        cache_stats.record(family, writes=len(keys),
+                           seconds=time.time() - start)
+
+    _delete_local(keys)
+
+
+@verify_redis_instance
+def _save_all(entries, local=True, jitter=True, family=OTHER_FAMILY):
+    """
+    Save key/value pairs with their own timeouts in a single round trip
+
+    :param entries: List of (key, value, timeout) tuples, timeout is in
+                    seconds or None for no timeout
+    :param local: False to skip keeping values in memory and broadcasting the
+                  change to other processes
+    :param jitter: False to expire values after exactly their timeout
+    :param family: Name of family of keys to count saves against
+    :returns: True or False if save succeeded
+
+    Timeouts are stretched by up to TIMEOUT_JITTER so keys saved together,
+    i.e. while warming the cache, don't all expire at the same moment.
+    """
+
+    if not entries:
+        return True
+
+    keys = [key for key, _, _ in entries]
+    bytes_written = 0
+    start = time.time()
+
+    try:
+        pipe = redis_obj.pipeline(transaction=False)
+        for key, value, timeout in entries:
+            if jitter and timeout:
+                timeout += random.randint(0, int(timeout * TIMEOUT_JITTER))
+
+            value = _compress(value)
+            if isinstance(value, basestring):
+                bytes_written += len(value)
+
+            pipe.set(key, value, ex=timeout)
+
+        if local:
+            _publish_invalidations(pipe, keys)
+
+        pipe.execute()
+    except Exception:
+        app.logger.warning('Failed saving keys %s to cache:', keys,
+                           exc_info=True)
+        cache_stats.record(family, errors=1, seconds=time.time() - start)
+        return False
+
+    cache_stats.record(family, writes=len(entries),
+                       bytes_written=bytes_written,
+                       seconds=time.time() - start)
+
+    if local:
+        _delete_local(keys)
+        for key, value, timeout in entries:
+            _save_local(key, value, timeout)
+
+    return True
 
 
-def read_file(path, branch):
+def stats():
+    """
+    Get counters and latency histograms of cache use in this process per
+    family of keys
+
+    :returns: Dictionary keyed by family, see cache_stats.stats()
+    """
+
+    return cache_stats.stats()
+
+
+def read_file(path, branch, allow_stale=False):
     """
     Look for text pointed to by given path and branch in cache
 
     :param path: Short path to file not including repo information
     :param branch: Name of branch file belongs to
+    :param allow_stale: True to return text even if its timeout has passed
     :returns: Text saved to cache or None if not found
     """
 
-    return get((path, branch))
+    text, fresh = read_file_entry(path, branch)
+    if not fresh and not allow_stale:
+        return None
+
+    return text
+
+
+def read_file_entry(path, branch):
+    """
+    Look for text pointed to by given path and branch in cache along with
+    whether or not its timeout has passed
+
+    :param path: Short path to file not including repo information
+    :param branch: Name of branch file belongs to
+    :returns: Tuple of (text, fresh) where text is None if not found and
+              fresh is False once the timeout text was saved with has passed
+    """
+
+    if not is_enabled():
+        return None, False
+
+    key = _file_key(path, branch)
+
+    # Only count the file itself, not its marker, as a hit or miss
+    text, fresh = _get_many([key, _fresh_key(key)], True, _file_family(path),
+                            1)
+    return text, fresh is not None and text is not None
 
 
 def save_file(path, branch, text, timeout=DEFAULT_CACHE_TIMEOUT):
@@ -146,12 +497,23 @@ def save_file(path, branch, text, timeout=DEFAULT_CACHE_TIMEOUT):
     :param text: Raw text to save
     :param timeout: Timeout in seconds to cache text, use None for no timeout
     :returns: True or False if save succeeded
+
+    Text is kept for STALE_CACHE_TIMEOUT seconds after its timeout so it can
+    still be served while it's refreshed or when github is unavailable.
     """
 
-    return save((path, branch), text, timeout=timeout)
+    key = _file_key(path, branch)
+
+    stale_timeout = None
+    if timeout is not None:
+        stale_timeout = timeout + utils.int_config('STALE_CACHE_TIMEOUT',
+                                                   DEFAULT_STALE_CACHE_TIMEOUT)
+
+    return bool(_save_all([(key, text, stale_timeout),
+                           (_fresh_key(key), '1', timeout)],
+                          family=_file_family(path)))
 
 
-@verify_redis_instance
 def delete_file(path, branch):
     """
     Delete file from cache
@@ -161,58 +523,1014 @@ def delete_file(path, branch):
     :returns: None
     """
 
-    redis_obj.delete((path, branch))
+    delete_files([(path, branch)])
 
 
-def save_user(username, user, timeout=DEFAULT_CACHE_TIMEOUT):
+def delete_files(files):
     """
-    Save user JSON in cache
+    Delete several files from cache in a single round trip
 
-    :param username: Username for user
-    :param user: Serialized representation of user to store in cache
+    :param files: Iterable of (path, branch) tuples, see delete_file()
+    :returns: None
+    """
+
+    files = list(files)
+    if not files:
+        return
+
+    keys = []
+    for key in _file_keys(files):
+        keys.extend((key, _fresh_key(key), _missing_key(key)))
+
+    delete_many(keys, family=_file_family(files[0][0]))
+
+
+def is_missing_file(path, branch):
+    """
+    Determine if file was recently not found, see save_missing_file()
+
+    :param path: Short path to file not including repo information
+    :param branch: Name of branch file belongs to
+    :returns: True or False
+    """
+
+    key = _missing_key(_file_key(path, branch))
+    return get(key, family=MISSING_FAMILY) is not None
+
+
+def save_missing_file(path, branch, timeout=None):
+    """
+    Remember file was not found so looking it up again doesn't cost any
+    requests to github
+
+    :param path: Short path to file not including repo information
+    :param branch: Name of branch file belongs to
+    :param timeout: Optional timeout in seconds, defaults to the
+                    MISSING_FILE_CACHE_TIMEOUT config value
     :returns: True or False if save succeeded
+
+    The marker is removed along with the file by delete_file(), i.e. when the
+    file is saved or shows up in a push event.
     """
 
-    return save(username, user, timeout=timeout)
+    if timeout is None:
+        timeout = utils.int_config('MISSING_FILE_CACHE_TIMEOUT',
+                                   DEFAULT_MISSING_FILE_TIMEOUT)
 
+    key = _missing_key(_file_key(path, branch))
+    return save(key, '1', timeout=timeout, family=MISSING_FAMILY)
 
-def read_user(username):
+
+def file_expires_in(path, branch):
     """
-    Read user from cache
+    Get seconds until file goes stale
 
-    :param username: Username for user
-    :returns: Serialized representation of user object or None if not found
+    :param path: Short path to file not including repo information
+    :param branch: Name of branch file belongs to
+    :returns: Seconds or None if file is not cached, already stale, or saved
+              without a timeout
     """
 
-    return get(username)
+    return expires_in(_fresh_key(_file_key(path, branch)))
 
 
-# These getter/setters only exist so we can move the cache location of these
-# items transparently of the other layers.
+@verify_redis_instance
+def expires_in(key):
+    """
+    Get seconds until key expires
+
+    :param key: Key to check
+    :returns: Seconds or None if key doesn't exist or has no timeout
+    """
+
+    try:
+        return redis_obj.ttl(key)
+    except Exception:
+        app.logger.warning('Failed reading timeout of key "%s" from cache:',
+                           key, exc_info=True)
+        return None
+
+
+@verify_redis_instance
+def record_article_access(path, branch):
+    """
+    Count read of published guide so the most popular ones can be refreshed
+    before they expire
+
+    :param path: Short path to guide not including repo information
+    :param branch: Name of branch guide belongs to
+    :returns: None
+    """
+
+    try:
+        redis_obj.zincrby(ARTICLE_ACCESS_KEY, json.dumps([path, branch]), 1)
+    except Exception:
+        app.logger.warning('Failed recording read of "%s" in cache:', path,
+                           exc_info=True)
+
+
+@verify_redis_instance
+def read_popular_articles(count):
+    """
+    Read most popular published guides
+
+    :param count: Max number of guides to return
+    :returns: List of (path, branch) tuples, most popular first
+    """
+
+    try:
+        members = redis_obj.zrevrange(ARTICLE_ACCESS_KEY, 0, count - 1)
+    except Exception:
+        app.logger.warning('Failed reading popular guides from cache:',
+                           exc_info=True)
+        return []
+
+    return [tuple(json.loads(member)) for member in members]
+
 
-def read_file_listing_etag(key):
+@verify_redis_instance
+def decay_article_access(factor):
+    """
+    Scale down read counts of all guides so recent reads count the most and
+    drop guides that are no longer read
+
+    :param factor: Number to multiply every count by
+    :returns: None
+    """
+
+    try:
+        pipe = redis_obj.pipeline()
+        pipe.zunionstore(ARTICLE_ACCESS_KEY, {ARTICLE_ACCESS_KEY: factor})
+        pipe.zremrangebyscore(ARTICLE_ACCESS_KEY, '-inf',
+                              '(%s' % (MIN_ARTICLE_ACCESS_SCORE))
+        pipe.execute()
+    except Exception:
+        app.logger.warning('Failed decaying guide reads in cache:',
+                           exc_info=True)
+
+
+@verify_redis_instance
+def read_article_index(title):
     """
-    Read etag from cache to do a file listing conditional API request
+    Read where guides with a title are
 
-    :param key: (repo, sha, filename)
-    :returns: etag from cache or None if no etag found
+    :param title: Slug of title
+    :returns: Dictionary of stack slug to location as saved with
+              save_article_index(), empty if no guide has the title, or None if
+              the index was never built
     """
 
     try:
-        return FILE_LISTING_ETAGS[key]
-    except KeyError:
+        pipe = redis_obj.pipeline(transaction=False)
+        pipe.exists(ARTICLE_INDEX_BUILT_KEY)
+        pipe.hgetall(ARTICLE_INDEX_KEY % (title))
+        built, locations = pipe.execute()
+    except Exception:
+        app.logger.warning('Failed reading index of guide "%s" from cache:',
+                           title, exc_info=True)
+        return None
+
+    if not built:
         return None
 
+    return locations
+
+
+@verify_redis_instance
+def save_article_index(entries, replace=False):
+    """
+    Save where guides are in index
+
+    :param entries: Iterable of (title slug, stack slug, location) tuples
+    :param replace: True to replace the whole index with entries and mark it
+                    built or False to add to it
+    :returns: True or False if save succeeded
+    """
+
+    titles = {}
+    for title, stack, location in entries:
+        titles.setdefault(title, {})[stack] = location
+
+    try:
+        old_titles = set()
+        if replace:
+            old_titles = redis_obj.smembers(ARTICLE_INDEX_TITLES_KEY)
+
+        # Readers never see a half built index
+        pipe = redis_obj.pipeline()
+
+        if replace:
+            pipe.delete(ARTICLE_INDEX_TITLES_KEY)
+            for title in old_titles:
+                pipe.delete(ARTICLE_INDEX_KEY % (title))
+
+        for title, locations in titles.iteritems():
+            pipe.hmset(ARTICLE_INDEX_KEY % (title), locations)
+
+        if titles:
+            pipe.sadd(ARTICLE_INDEX_TITLES_KEY, *titles.keys())
+
+        if replace:
+            pipe.set(ARTICLE_INDEX_BUILT_KEY, int(time.time()))
+
+        pipe.execute()
+    except Exception:
+        app.logger.warning('Failed saving index of %d guide title(s) in cache:',
+                           len(titles), exc_info=True)
+        return False
+
+    return True
+
 
-def save_file_listing_etag(key, etag):
+@verify_redis_instance
+def delete_article_index(title, stack):
     """
-    :param key: (repo, sha, filename)
-    :param etag: etag as returned by API request header
+    Delete guide from index
+
+    :param title: Slug of title
+    :param stack: Slug of stack
     :returns: None
     """
 
-    FILE_LISTING_ETAGS[key] = etag
+    try:
+        redis_obj.hdel(ARTICLE_INDEX_KEY % (title), stack)
+    except Exception:
+        app.logger.warning('Failed deleting guide "%s" from index in cache:',
+                           title, exc_info=True)
+
+
+def branch_namespace(branch):
+    """
+    Get namespace of everything cached for a branch
+
+    :param branch: Name of branch
+    :returns: Namespace to use with bump_generation()
+    """
+
+    return 'branch:%s' % (branch)
+
+
+def status_namespace(status):
+    """
+    Get namespace of everything cached for a publish status, i.e. its listing
+    and guides
+
+    :param status: PUBLISHED, IN_REVIEW or DRAFT
+    :returns: Namespace to use with bump_generation()
+    """
+
+    return 'status:%s' % (status)
+
+
+@verify_redis_instance
+def bump_generation(*namespaces):
+    """
+    Invalidate every key in namespaces at once
+
+    :param namespaces: Namespaces i.e. GLOBAL_NAMESPACE, branch_namespace() or
+                       status_namespace()
+    :returns: True or False if invalidation succeeded
+    """
+
+    keys = [_generation_key(namespace) for namespace in namespaces]
+
+    try:
+        pipe = redis_obj.pipeline(transaction=False)
+        for key in keys:
+            pipe.incr(key)
+            pipe.expire(key, GENERATION_TIMEOUT)
+
+        _publish_invalidations(pipe, keys)
+        pipe.execute()
+    except Exception:
+        app.logger.warning('Failed bumping generation of %s in cache:',
+                           namespaces, exc_info=True)
+        return False
 
+    _delete_local(keys)
+    app.logger.info('Invalidated cache for %s', ', '.join(namespaces))
+
+    return True
+
+
+def _generation_key(namespace):
+    """
+    Get key holding current generation of namespace
+
+    :param namespace: Namespace
+    :returns: Key
+    """
+
+    return 'gen:%s' % (namespace)
+
+
+def _versioned_keys(entries):
+    """
+    Get keys to save values with in the current generation of their namespaces
+
+    :param entries: List of (key, namespaces) tuples
+    :returns: List of keys in same order as entries
+
+    Generations for all entries are read in a single round trip, if they
+    aren't already in memory.
+    """
+
+    generation_keys = set()
+    for _, namespaces in entries:
+        generation_keys.update(_generation_key(ns) for ns in namespaces)
+
+    generation_keys = list(generation_keys)
+    generations = dict(zip(generation_keys,
+                           get_many(generation_keys,
+                                    family=GENERATION_FAMILY) or []))
+
+    keys = []
+    for key, namespaces in entries:
+        # A namespace that was never bumped is at generation 0
+        version = '.'.join(generations.get(_generation_key(ns)) or '0'
+                           for ns in namespaces)
+        keys.append('v%s:%s' % (version, _local_key(key)))
+
+    return keys
+
+
+def _file_key(path, branch):
+    """
+    Get key for file in the current generation of its namespaces
+
+    :param path: Short path to file not including repo information
+    :param branch: Name of branch file belongs to
+    :returns: Key
+    """
+
+    return _file_keys([(path, branch)])[0]
+
+
+def _file_keys(files):
+    """
+    Get keys for files in the current generation of their namespaces
+
+    :param files: Iterable of (path, branch) tuples
+    :returns: List of keys in same order as files
+    """
+
+    entries = []
+    for path, branch in files:
+        namespaces = [GLOBAL_NAMESPACE, branch_namespace(branch)]
+
+        status = path.split('/')[0]
+        if status in STATUSES:
+            namespaces.append(status_namespace(status))
+
+        entries.append(((path, branch), namespaces))
+
+    return _versioned_keys(entries)
+
+
+def _file_family(path):
+    """
+    Get family of keys file is counted against
+
+    :param path: Short path to file not including repo information
+    :returns: FILE_FAMILY for markdown files i.e. listings of guides or the
+              FAQ, ARTICLE_FAMILY otherwise
+    """
+
+    return FILE_FAMILY if path.endswith('.md') else ARTICLE_FAMILY
+
+
+def _listing_key(key):
+    """
+    Get key for file listing in the current generation of its namespaces
+
+    :param key: Key listing is saved with, a publish status or something
+                identifying a git tree
+    :returns: Key
+    """
+
+    namespaces = [GLOBAL_NAMESPACE]
+    if key in STATUSES:
+        namespaces.append(status_namespace(key))
+
+    return _versioned_keys([(key, namespaces)])[0]
+
+
+def _compress(value):
+    """
+    Compress value to save if it's at least CACHE_COMPRESS_MIN_SIZE bytes
+
+    :param value: Value to save
+    :returns: Value to send to redis
+    """
+
+    min_size = utils.int_config('CACHE_COMPRESS_MIN_SIZE',
+                                DEFAULT_COMPRESS_MIN_SIZE)
+
+    if (min_size <= 0 or not isinstance(value, basestring) or
+            len(value) < min_size):
+        return value
+
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+
+    compressed = COMPRESSED_HEADER + zlib.compress(value, COMPRESS_LEVEL)
+
+    # Not worth the CPU to decompress if it didn't get any smaller
+    if len(compressed) >= len(value):
+        return value
+
+    return compressed
+
+
+def _decompress(value):
+    """
+    Decompress value read from redis if it was compressed
+
+    :param value: Value read from redis or None
+    :returns: Value as it was saved
+    """
+
+    if value is None or not value.startswith(COMPRESSED_HEADER):
+        return value
+
+    try:
+        return zlib.decompress(value[len(COMPRESSED_HEADER):])
+    except zlib.error:
+        # Saved uncompressed, we can't tell binary values apart up front
+        return value
+
+
+def _fresh_key(key):
+    """
+    Get key marking a value as fresh, it expires at the value's timeout
+
+    :param key: Key of value
+    :returns: Key of marker
+    """
+
+    # Same way redis module turns tuple keys into strings
+    return 'fresh:%s' % (str(key))
+
+
+def _missing_key(key):
+    """
+    Get key marking a file as not found
+
+    :param key: Key of file
+    :returns: Key of marker
+    """
+
+    return 'missing:%s' % (str(key))
+
+
+def _local_key(key):
+    """
+    Get key for in memory cache matching the key redis saves value with
+
+    :param key: Key of value
+    :returns: Byte string key
+    """
+
+    if isinstance(key, unicode):
+        return key.encode('utf-8')
+
+    if not isinstance(key, str):
+        # Same way redis module turns tuple keys into strings
+        return str(key)
+
+    return key
+
+
+def _local_cache_enabled():
+    """
+    Determine if processes keep values in memory per the LOCAL_CACHE_TIMEOUT
+    and LOCAL_CACHE_MAX_ENTRIES config values
+
+    :returns: True or False
+    """
+
+    return (utils.int_config('LOCAL_CACHE_TIMEOUT',
+                             DEFAULT_LOCAL_CACHE_TIMEOUT) > 0 and
+            utils.int_config('LOCAL_CACHE_MAX_ENTRIES',
+                             DEFAULT_LOCAL_CACHE_MAX_ENTRIES) > 0)
+
+
+def _local_cache():
+    """
+    Get in memory cache for this process
+
+    :returns: lru.LRUCache object or None if disabled or not subscribed to
+              invalidations yet
+
+    The first call in a process, i.e. after gunicorn or celery forks a worker,
+    starts listening for invalidations in the background.
+    """
+
+    if not _local_cache_enabled():
+        return None
+
+    pid = os.getpid()
+    if _local['pid'] != pid:
+        _local['pid'] = pid
+        _local['id'] = uuid.uuid4().hex
+        _local['subscribed'] = False
+        _local['cache'] = lru.LRUCache(
+                utils.int_config('LOCAL_CACHE_MAX_ENTRIES',
+                                 DEFAULT_LOCAL_CACHE_MAX_ENTRIES),
+                utils.int_config('LOCAL_CACHE_TIMEOUT',
+                                 DEFAULT_LOCAL_CACHE_TIMEOUT))
+
+        utils.spawn(_listen_for_invalidations)
+
+    if not _local['subscribed']:
+        return None
+
+    return _local['cache']
+
+
+def _save_local(key, value, timeout=None):
+    """
+    Keep value in memory of this process
+
+    :param key: Key value was saved to redis with
+    :param value: Value to keep, None or large values are skipped
+    :param timeout: Optional seconds value expires in redis
+    :returns: None
+    """
+
+    if value is None or len(value) > LOCAL_CACHE_MAX_VALUE_SIZE:
+        return
+
+    local_cache = _local_cache()
+    if local_cache is not None:
+        local_cache.set(_local_key(key), value, timeout)
+
+
+def _delete_local(keys):
+    """
+    Drop keys from memory of this process
+
+    :param keys: Keys values were saved to redis with
+    :returns: None
+    """
+
+    # Reads already in progress could keep the old values otherwise
+    _local['invalidations'] += 1
+
+    local_cache = _local['cache']
+    if local_cache is not None and _local['pid'] == os.getpid():
+        local_cache.delete(*[_local_key(key) for key in keys])
+
+
+def _publish_invalidations(pipe, keys):
+    """
+    Add commands telling all other processes to drop keys from memory to a
+    pipeline
+
+    :param pipe: Redis pipeline to add commands to
+    :param keys: Keys values were saved to redis with
+    :returns: None
+    """
+
+    if not _local_cache_enabled():
+        return
+
+    sender = _local['id'] or ''
+    for key in keys:
+        pipe.publish(INVALIDATE_CHANNEL, '%s %s' % (sender, _local_key(key)))
+
+
+def _listen_for_invalidations():
+    """
+    Drop keys other processes broadcast as changed from memory of this
+    process, runs forever in the background
+
+    :returns: None
+    """
+
+    while True:
+        try:
+            pubsub = redis_obj.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATE_CHANNEL)
+
+            # Anything could have changed while we weren't listening
+            _local['invalidations'] += 1
+            _local['cache'].clear()
+            _local['subscribed'] = True
+
+            for message in pubsub.listen():
+                sender, _, key = message['data'].partition(' ')
+                if sender != _local['id']:
+                    _local['invalidations'] += 1
+                    _local['cache'].delete(key)
+        except Exception:
+            app.logger.warning('Lost subscription to cache invalidations:',
+                               exc_info=True)
+        finally:
+            _local['subscribed'] = False
+
+        time.sleep(RESUBSCRIBE_DELAY)
+
+
+def read_computed(key):
+    """
+    Read value of an expensive computation, i.e. stats aggregated from all
+    guides or github
+
+    :param key: Key identifying computation
+    :returns: Tuple of (value, seconds computation took, time value expires)
+              or None if not found
+
+    Values are kept STALE_CACHE_TIMEOUT seconds after they expire so they can
+    be served while the next value is computed.
+    """
+
+    entry = get('computed:%s' % (key), family=key)
+    if entry is None:
+        return None
+
+    try:
+        expires, delta, value = json.loads(entry)
+    except (TypeError, ValueError):
+        app.logger.warning('Failed parsing computed value of "%s" from cache',
+                           key)
+        return None
+
+    return value, delta, expires
+
+
+def save_computed(key, value, delta, timeout):
+    """
+    Save value of an expensive computation
+
+    :param key: Key identifying computation
+    :param value: JSON serializable value
+    :param delta: Seconds computation took
+    :param timeout: Seconds until value expires
+    :returns: True or False if save succeeded
+    """
+
+    entry = json.dumps([time.time() + timeout, delta, value])
+    stale_timeout = timeout + utils.int_config('STALE_CACHE_TIMEOUT',
+                                               DEFAULT_STALE_CACHE_TIMEOUT)
+
+    return save('computed:%s' % (key), entry, timeout=stale_timeout,
+                family=key)
+
+
+def computed_expires_in(key):
+    """
+    Get seconds until value of an expensive computation expires
+
+    :param key: Key identifying computation
+    :returns: Seconds or None if not found or already expired
+    """
+
+    entry = read_computed(key)
+    if entry is None:
+        return None
+
+    expires_in = entry[2] - time.time()
+    return expires_in if expires_in > 0 else None
+
+
+def save_user(username, user, timeout=DEFAULT_CACHE_TIMEOUT):
+    """
+    Save user JSON in cache
+
+    :param username: Username for user
+    :param user: Serialized representation of user to store in cache
+    :returns: True or False if save succeeded
+    """
+
+    key = _versioned_keys([(username, [GLOBAL_NAMESPACE])])[0]
+    return save(key, user, timeout=timeout, family=USER_FAMILY)
+
+
+def read_user(username):
+    """
+    Read user from cache
+
+    :param username: Username for user
+    :returns: Serialized representation of user object or None if not found
+    """
+
+    return get(_versioned_keys([(username, [GLOBAL_NAMESPACE])])[0],
+               family=USER_FAMILY)
+
+
+def read_conditional_response(key):
+    """
+    Read response saved from a previous API request so it can be revalidated
+    with a conditional request
+
+    :param key: Key identifying request i.e. URL, arguments, etc.
+    :returns: Serialized response or None if not found
+    """
+
+    # Use ':' to avoid clashing with any paths, which cannot contain ':'
+    return get('conditional:%s' % (key), family=GITHUB_FAMILY)
+
+
+def save_conditional_response(key, response,
+                              timeout=CONDITIONAL_RESPONSE_TIMEOUT):
+    """
+    Save response from an API request so the next request for it can be made
+    conditional
+
+    :param key: Key identifying request i.e. URL, arguments, etc.
+    :param response: Serialized response including etag and body
+    :param timeout: Timeout in seconds to cache response, use None for no
+                    timeout
+    :returns: True or False if save succeeded
+    """
+
+    return save('conditional:%s' % (key), response, timeout=timeout,
+                family=GITHUB_FAMILY)
+
+
+def read_rendered_markdown(sha, version):
+    """
+    Read HTML rendered from markdown text
+
+    :param sha: SHA of markdown text
+    :param version: Version of renderer that created HTML
+    :returns: HTML or None if not found
+    """
+
+    return get('rendered:%s:%s' % (version, sha), family=GITHUB_FAMILY)
+
+
+def save_rendered_markdown(sha, version, html,
+                           timeout=RENDERED_MARKDOWN_TIMEOUT):
+    """
+    Save HTML rendered from markdown text
+
+    :param sha: SHA of markdown text
+    :param version: Version of renderer that created HTML
+    :param html: Rendered HTML
+    :param timeout: Timeout in seconds to cache HTML, use None for no timeout
+    :returns: True or False if save succeeded
+    """
+
+    return save('rendered:%s:%s' % (version, sha), html, timeout=timeout,
+                family=GITHUB_FAMILY)
+
+
+def read_mirror_push_time():
+    """
+    Read time the local git mirrors were last marked out of date
+
+    :returns: Timestamp as string or None if not found
+    """
+
+    return get('mirror:pushed', local=False)
+
+
+def save_mirror_push_time(timestamp):
+    """
+    Save time the local git mirrors were marked out of date
+
+    :param timestamp: Seconds since epoch
+    :returns: True or False if save succeeded
+    """
+
+    return save('mirror:pushed', repr(timestamp), timeout=None, local=False)
+
+
+def read_rate_limit(key):
+    """
+    Read remaining github API rate limit for a token
+
+    :param key: Key identifying token, never the token itself
+    :returns: Serialized rate limit or None if not found
+    """
+
+    return get('ratelimit:%s' % (key), local=False, family=RATE_LIMIT_FAMILY)
+
+
+def save_rate_limit(key, rate_limit, timeout):
+    """
+    Save remaining github API rate limit for a token so all processes share it
+
+    :param key: Key identifying token, never the token itself
+    :param rate_limit: Serialized rate limit
+    :param timeout: Timeout in seconds, i.e. until the rate limit resets
+    :returns: True or False if save succeeded
+    """
+
+    return save('ratelimit:%s' % (key), rate_limit, timeout=timeout,
+                local=False, jitter=False, family=RATE_LIMIT_FAMILY)
+
+
+def read_tree_listing(sha):
+    """
+    Read listing of all files in a git tree
+
+    :param sha: SHA of tree
+    :returns: Serialized listing or None if not found
+    """
+
+    return _read_content('tree:%s' % (sha))
+
+
+def save_tree_listing(sha, listing):
+    """
+    Save listing of all files in a git tree
+
+    :param sha: SHA of tree
+    :param listing: Serialized listing
+    :returns: True or False if save succeeded
+    """
+
+    return _save_content('tree:%s' % (sha), listing)
+
+
+def read_blob(sha):
+    """
+    Read contents of file by git blob SHA
+
+    :param sha: SHA of blob
+    :returns: Contents as bytes or None if not found
+    """
+
+    return _read_content('blob:%s' % (sha))
+
+
+def save_blob(sha, contents):
+    """
+    Save contents of file by git blob SHA
+
+    :param sha: SHA of blob
+    :param contents: Contents as bytes
+    :returns: True or False if save succeeded
+    """
+
+    return _save_content('blob:%s' % (sha), contents)
+
+
+def _read_content(key):
+    """
+    Read content keyed by git SHA and mark it as recently used
+
+    :param key: Key content was saved with
+    :returns: Value saved or None if not found or error
+    """
+
+    value = get(key, family=GITHUB_FAMILY)
+    if value is not None:
+        _touch_content(key)
+
+    return value
+
+
+def _save_content(key, value):
+    """
+    Save content keyed by git SHA without a timeout and evict the least
+    recently used content if there's too much
+
+    :param key: Key to save
+    :param value: Value to save
+    :returns: True or False if save succeeded
+    """
+
+    if not save(key, value, timeout=None, family=GITHUB_FAMILY):
+        return False
+
+    _touch_content(key)
+    _evict_content()
+
+    return True
+
+
+@verify_redis_instance
+def _touch_content(key):
+    """
+    Mark content as recently used
+
+    :param key: Key content was saved with
+    :returns: None
+    """
+
+    try:
+        redis_obj.zadd(CONTENT_LRU_KEY, **{key: time.time()})
+    except Exception:
+        app.logger.warning('Failed marking key "%s" as used in cache:', key,
+                           exc_info=True)
+
+
+@verify_redis_instance
+def _evict_content():
+    """
+    Remove least recently used content once there are more entries than the
+    CONTENT_CACHE_MAX_ENTRIES config value
+
+    :returns: None
+    """
+
+    max_entries = utils.int_config('CONTENT_CACHE_MAX_ENTRIES',
+                                   DEFAULT_CONTENT_CACHE_MAX_ENTRIES)
+
+    try:
+        count = redis_obj.zcard(CONTENT_LRU_KEY)
+        if count <= max_entries:
+            return
+
+        keys = redis_obj.zrange(CONTENT_LRU_KEY, 0, count - max_entries - 1)
+        if not keys:
+            return
+
+        pipe = redis_obj.pipeline()
+        pipe.delete(*keys)
+        pipe.zrem(CONTENT_LRU_KEY, *keys)
+        pipe.execute()
+    except Exception:
+        app.logger.warning('Failed evicting content from cache:',
+                           exc_info=True)
+
+
+@verify_redis_instance
+def acquire_lease(key, token, timeout):
+    """
+    Acquire lease shared by all processes unless somebody else holds it
+
+    :param key: Key identifying lease
+    :param token: Unique token of holder, needed to release lease
+    :param timeout: Seconds until lease is released automatically
+    :returns: True if lease was acquired, False if somebody else holds it or
+              None if there's no cache to hold leases in
+    """
+
+    try:
+        return bool(redis_obj.set('lease:%s' % (key), token, nx=True,
+                                  ex=timeout))
+    except Exception:
+        app.logger.warning('Failed acquiring lease "%s" in cache:', key,
+                           exc_info=True)
+        return None
+
+
+@verify_redis_instance
+def release_lease(key, token):
+    """
+    Release lease if it's still held with token
+
+    :param key: Key identifying lease
+    :param token: Token lease was acquired with
+    :returns: None
+    """
+
+    key = 'lease:%s' % (key)
+
+    try:
+        if redis_obj.get(key) == token:
+            redis_obj.delete(key)
+    except Exception:
+        app.logger.warning('Failed releasing lease "%s" in cache:', key,
+                           exc_info=True)
+
+
+@verify_redis_instance
+def read_github_logins(emails):
+    """
+    Read github logins for email addresses
+
+    :param emails: List of lowercase email addresses
+    :returns: Dictionary of email address to login for all addresses found
+    """
+
+    try:
+        logins = redis_obj.hmget('mirror:logins', emails)
+    except Exception:
+        app.logger.warning('Failed reading github logins from cache:',
+                           exc_info=True)
+        return {}
+
+    return dict((email, login) for email, login in zip(emails, logins)
+                if login is not None)
+
+
+@verify_redis_instance
+def save_github_logins(logins):
+    """
+    Save github logins for email addresses
+
+    :param logins: Dictionary of lowercase email address to login
+    :returns: True or False if save succeeded
+    """
+
+    try:
+        redis_obj.hmset('mirror:logins', logins)
+    except Exception:
+        app.logger.warning('Failed saving github logins to cache:',
+                           exc_info=True)
+        return False
+
+    return True
+
+
+# These getter/setters only exist so we can move the cache location of these
+# items transparently of the other layers.
 
 def read_file_listing(key):
     """
@@ -222,7 +1540,7 @@ def read_file_listing(key):
     :returns: Iterable of files
     """
 
-    return get(key)
+    return get(_listing_key(key), family=LISTING_FAMILY)
 
 
 def save_file_listing(key, files, timeout=DEFAULT_CACHE_TIMEOUT):
@@ -236,4 +1554,5 @@ def save_file_listing(key, files, timeout=DEFAULT_CACHE_TIMEOUT):
     :returns: True or False if save succeeded
     """
 
-    return save(key, files, timeout=timeout)
+    return save(_listing_key(key), files, timeout=timeout,
+                family=LISTING_FAMILY)
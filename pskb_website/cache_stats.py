@@ -0,0 +1,136 @@
+"""
+Counters and latency histograms of cache use per family of keys
+
+Every read and write of the cache is counted against the family of keys it
+touches, i.e. article, listing, user, etc. so we can tell which timeouts pay
+off.  Counters are kept per process, like singleflight.stats().  Each process
+also logs them every CACHE_STATS_LOG_INTERVAL seconds.
+"""
+
+import bisect
+import collections
+import threading
+import time
+
+from . import app
+from . import utils
+
+# Seconds between logging stats, 0 to disable
+DEFAULT_LOG_INTERVAL = 10 * 60
+
+# Upper bounds in milliseconds of latency histogram buckets, anything slower
+# goes in a final bucket
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+COUNTERS = ('hits', 'local_hits', 'misses', 'errors', 'writes',
+            'bytes_read', 'bytes_written')
+
+_stats = {}
+_lock = threading.Lock()
+_last_log = {'time': time.time()}
+
+
+def _new_family():
+    """Get empty stats for a family"""
+
+    family = collections.OrderedDict((name, 0) for name in COUNTERS)
+    family['latency_ms'] = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    return family
+
+
+def record(family, hits=0, local_hits=0, misses=0, errors=0, writes=0,
+           bytes_read=0, bytes_written=0, seconds=None):
+    """
+    Count use of the cache
+
+    :param family: Name of family of keys used
+    :param hits: Number of keys found, including local_hits
+    :param local_hits: Number of keys found in memory of this process
+    :param misses: Number of keys not found
+    :param errors: Number of failed operations
+    :param writes: Number of keys saved or deleted
+    :param bytes_read: Bytes read from redis
+    :param bytes_written: Bytes sent to redis
+    :param seconds: Optional seconds the round trip to redis took
+    :returns: None
+    """
+
+    with _lock:
+        try:
+            stats_ = _stats[family]
+        except KeyError:
+            stats_ = _stats[family] = _new_family()
+
+        stats_['hits'] += hits
+        stats_['local_hits'] += local_hits
+        stats_['misses'] += misses
+        stats_['errors'] += errors
+        stats_['writes'] += writes
+        stats_['bytes_read'] += bytes_read
+        stats_['bytes_written'] += bytes_written
+
+        if seconds is not None:
+            bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)
+            stats_['latency_ms'][bucket] += 1
+
+    _log_periodically()
+
+
+def stats():
+    """
+    Get stats of this process
+
+    :returns: Dictionary keyed by family::
+
+        {'article': {'hits': 100,
+                     'local_hits': 80,
+                     'misses': 5,
+                     'errors': 0,
+                     'writes': 5,
+                     'bytes_read': 40000,
+                     'bytes_written': 10000,
+                     'latency_ms': {'1': 20, '2': 3, ..., '1000': 0,
+                                    'inf': 0}}}
+
+    Latencies are the number of round trips to redis that took at most the
+    number of milliseconds in the key.
+    """
+
+    bounds = [str(bound) for bound in LATENCY_BUCKETS_MS] + ['inf']
+
+    with _lock:
+        snapshot = {}
+        for family, stats_ in _stats.iteritems():
+            family_stats = dict((name, stats_[name]) for name in COUNTERS)
+            family_stats['latency_ms'] = collections.OrderedDict(
+                                            zip(bounds, stats_['latency_ms']))
+            snapshot[family] = family_stats
+
+    return snapshot
+
+
+def _log_periodically():
+    """
+    Log stats once CACHE_STATS_LOG_INTERVAL seconds passed since last time
+
+    :returns: None
+    """
+
+    interval = utils.int_config('CACHE_STATS_LOG_INTERVAL',
+                                DEFAULT_LOG_INTERVAL)
+    now = time.time()
+
+    if interval <= 0 or now - _last_log['time'] < interval:
+        return
+
+    _last_log['time'] = now
+
+    for family, stats_ in sorted(stats().iteritems()):
+        lookups = stats_['hits'] + stats_['misses']
+        hit_rate = 100.0 * stats_['hits'] / lookups if lookups else 0.0
+
+        app.logger.info('Cache stats family: %s hit_rate: %.1f%% %s', family,
+                        hit_rate,
+                        ' '.join('%s: %d' % (name, stats_[name])
+                                 for name in COUNTERS))
@@ -0,0 +1,353 @@
+"""
+Pool of long-running git cat-file processes
+
+Starting a git process for every object we read from a local repository
+costs far more than reading the object itself.  Instead we keep a small pool
+of `git cat-file --batch` processes per repository and send lookups to them
+over their stdin/stdout pipes.
+
+Readers are checked out of the pool for the duration of one lookup, so they
+are safe to share between threads and gevent greenlets as long as the
+standard library is monkey patched, which gunicorn does for gevent workers.
+The pool never holds more than GIT_BATCH_POOL_SIZE processes per repository;
+anyone else waits for a reader to be returned.
+
+Lookups accept anything git understands as an object name, i.e. a SHA or
+<ref>:<path>.
+"""
+
+import collections
+import contextlib
+import subprocess
+import threading
+import Queue
+
+from . import app
+from . import utils
+
+DEFAULT_POOL_SIZE = 4
+
+# Read blobs in chunks of this many bytes when streaming
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+object_header = collections.namedtuple('object_header', 'sha, type, size')
+
+tree_entry = collections.namedtuple('tree_entry', 'mode, type, sha, name')
+
+# Pools are keyed by (git_dir, check) where check is True for --batch-check
+# processes that only return headers.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class _Pool(object):
+    """
+    Pool of readers for a single repository
+    """
+
+    def __init__(self, git_dir, check, size):
+        self.git_dir = git_dir
+        self.check = check
+        self.idle = Queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+        # Bumped to retire every reader started before the repository changed
+        self.generation = 0
+
+
+class Reader(object):
+    """
+    Wrapper around a single git cat-file process
+    """
+
+    def __init__(self, git_dir, check=False, generation=0):
+        mode = '--batch-check' if check else '--batch'
+        self.generation = generation
+        self.proc = subprocess.Popen(['git', '--git-dir', git_dir, 'cat-file',
+                                      mode],
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     bufsize=-1)
+
+    def is_alive(self):
+        """Determine if process is still running"""
+
+        return self.proc.poll() is None
+
+    def close(self):
+        """Stop process"""
+
+        try:
+            self.proc.stdin.close()
+            self.proc.stdout.close()
+            self.proc.wait()
+        except (IOError, OSError):
+            app.logger.warning('Failed closing git cat-file process',
+                               exc_info=True)
+
+    def header(self, name):
+        """
+        Send lookup for object and read header describing it
+
+        :param name: Object name, i.e. SHA or <ref>:<path>
+        :returns: object_header namedtuple or None if object is missing
+
+        For --batch readers the object contents must be read with
+        read_contents() before the next lookup.
+        """
+
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+
+        self.proc.stdin.write('%s\n' % (name))
+        self.proc.stdin.flush()
+
+        line = self.proc.stdout.readline()
+        if not line:
+            raise IOError('git cat-file process exited')
+
+        tokens = line.split()
+
+        # Output is '<name> missing' or '<name> ambiguous'
+        if len(tokens) != 3:
+            return None
+
+        return object_header(tokens[0], tokens[1], int(tokens[2]))
+
+    def read_contents(self, size):
+        """
+        Read entire contents of object after header()
+
+        :param size: Size of object as reported in header
+        :returns: Bytes
+        """
+
+        contents = self.proc.stdout.read(size)
+
+        # Every object is followed by a newline
+        self.proc.stdout.read(1)
+
+        return contents
+
+    def iter_contents(self, size, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Iterate through contents of object after header() without reading it
+        all into memory
+
+        :param size: Size of object as reported in header
+        :param chunk_size: Max size of chunks to read
+        :returns: Generator of bytes
+
+        The remaining contents are read and thrown away if the caller stops
+        iterating early so the reader is ready for the next lookup.
+        """
+
+        remaining = size
+        try:
+            while remaining:
+                chunk = self.proc.stdout.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise IOError('git cat-file process exited')
+
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            while remaining:
+                chunk = self.proc.stdout.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+
+                remaining -= len(chunk)
+
+            self.proc.stdout.read(1)
+
+
+def _get_pool(git_dir, check):
+    """Get pool for repo, creating it on first use"""
+
+    key = (git_dir, check)
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            size = utils.int_config('GIT_BATCH_POOL_SIZE', DEFAULT_POOL_SIZE)
+            pool = _Pool(git_dir, check, max(size, 1))
+            _pools[key] = pool
+
+    return pool
+
+
+@contextlib.contextmanager
+def reader(git_dir, check=False):
+    """
+    Context manager to check out a reader from the pool
+
+    :param git_dir: Path to git directory of repo
+    :param check: True for a --batch-check reader that only returns headers
+    :returns: Reader object
+
+    A reader that raised an error is not put back into the pool since there's
+    no telling what's left in its pipes.
+    """
+
+    pool = _get_pool(git_dir, check)
+    pool.slots.acquire()
+
+    reader_ = None
+    try:
+        while reader_ is None:
+            try:
+                reader_ = pool.idle.get_nowait()
+            except Queue.Empty:
+                reader_ = Reader(git_dir, check=check,
+                                 generation=pool.generation)
+                break
+
+            if reader_.generation != pool.generation or not reader_.is_alive():
+                reader_.close()
+                reader_ = None
+
+        try:
+            yield reader_
+        except Exception:
+            reader_.close()
+            reader_ = None
+            raise
+    finally:
+        if reader_ is not None:
+            if reader_.generation == pool.generation:
+                pool.idle.put(reader_)
+            else:
+                reader_.close()
+
+        pool.slots.release()
+
+
+def reset(git_dir):
+    """
+    Retire all readers for a repo, i.e. after fetching new objects
+
+    :param git_dir: Path to git directory of repo
+    :returns: None
+
+    Readers checked out right now finish their lookup and are closed when
+    returned to the pool.
+    """
+
+    for check in (True, False):
+        pool = _get_pool(git_dir, check)
+        pool.generation += 1
+
+        while True:
+            try:
+                pool.idle.get_nowait().close()
+            except Queue.Empty:
+                break
+
+
+def read_header(git_dir, name):
+    """
+    Get type, size and SHA of object without reading it
+
+    :param git_dir: Path to git directory of repo
+    :param name: Object name, i.e. SHA or <ref>:<path>
+    :returns: object_header namedtuple or None if object is missing
+    """
+
+    with reader(git_dir, check=True) as reader_:
+        return reader_.header(name)
+
+
+def read_object(git_dir, name):
+    """
+    Read entire object
+
+    :param git_dir: Path to git directory of repo
+    :param name: Object name, i.e. SHA or <ref>:<path>
+    :returns: Tuple of (object_header, bytes) or None if object is missing
+    """
+
+    with reader(git_dir) as reader_:
+        header = reader_.header(name)
+        if header is None:
+            return None
+
+        return header, reader_.read_contents(header.size)
+
+
+def stream_object(git_dir, name, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Iterate through contents of object in chunks
+
+    :param git_dir: Path to git directory of repo
+    :param name: Object name, i.e. SHA or <ref>:<path>
+    :param chunk_size: Max size of chunks to read
+    :returns: Generator of bytes, which is empty if object is missing
+
+    The reader is held until the generator is exhausted or closed so don't
+    leave partially consumed generators lying around.
+    """
+
+    with reader(git_dir) as reader_:
+        header = reader_.header(name)
+        if header is None:
+            raise StopIteration
+
+        chunks = reader_.iter_contents(header.size, chunk_size=chunk_size)
+
+        # Close explicitly so leftovers are drained before the reader goes
+        # back to the pool.
+        try:
+            for chunk in chunks:
+                yield chunk
+        finally:
+            chunks.close()
+
+
+def read_tree(git_dir, name):
+    """
+    Read entries of a tree object
+
+    :param git_dir: Path to git directory of repo
+    :param name: Object name, i.e. SHA or <ref>:<path>
+    :returns: List of tree_entry namedtuples or None if tree is missing
+    """
+
+    obj = read_object(git_dir, name)
+    if obj is None or obj[0].type != 'tree':
+        return None
+
+    return parse_tree(obj[1])
+
+
+def parse_tree(data):
+    """
+    Parse raw tree object
+
+    :param data: Bytes of tree object as returned by cat-file
+    :returns: List of tree_entry namedtuples
+    """
+
+    entries = []
+    pos = 0
+
+    # Each entry is '<mode> <name>\0<20 byte binary sha>'
+    while pos < len(data):
+        space = data.index(' ', pos)
+        null = data.index('\0', space)
+
+        mode = data[pos:space]
+        name = unicode(data[space + 1:null], encoding='utf-8')
+        sha = data[null + 1:null + 21].encode('hex')
+
+        if mode == '40000':
+            type_ = 'tree'
+        elif mode == '160000':
+            type_ = 'commit'
+        else:
+            type_ = 'blob'
+
+        entries.append(tree_entry(mode, type_, sha, name))
+        pos = null + 21
+
+    return entries
@@ -0,0 +1,1002 @@
+"""
+Render Github flavored markdown to HTML
+
+This is a small, dependency-free markdown renderer that understands the parts
+of Github flavored markdown our guides use:
+
+    - ATX and setext headings with Github style anchors
+    - Fenced and indented code blocks
+    - Tables with column alignment
+    - Ordered, unordered and task lists
+    - Block quotes and horizontal rules
+    - Inline code, emphasis, strikethrough, links, images, reference links
+    - Autolinks for <url> and bare http://, https:// and www. URLs
+
+It exists so we don't have to spend a rate-limited github API request and a
+network round trip every time we need rendered text.  The output follows the
+markup github produces closely enough for our stylesheets, but it is not a
+byte-for-byte replacement.
+
+Raw HTML is passed through like github does, but only the tags, attributes
+and URL schemes in the allowlists below.  Other tags are escaped so they show
+up as text and other attributes are dropped.
+"""
+
+import cgi
+import htmlentitydefs
+import re
+import unicodedata
+
+# Bump this whenever the output changes so any rendered text saved with an
+# older version is not reused.
+VERSION = 3
+
+# Used to hide already rendered chunks of HTML from the rest of the inline
+# processing.  These characters are removed from the input text.
+_STASH_START = u'\x02'
+_STASH_END = u'\x03'
+_STASH_RE = re.compile(u'%s(\\d+)%s' % (_STASH_START, _STASH_END))
+
+_BLANK_RE = re.compile(r'^\s*$')
+_FENCE_RE = re.compile(r'^( {0,3})(`{3,}|~{3,})\s*([^`\s]*)[^`]*$')
+_ATX_RE = re.compile(r'^ {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$')
+_SETEXT_RE = re.compile(r'^ {0,3}(=+|-+)[ \t]*$')
+_HR_RE = re.compile(r'^ {0,3}([-*_])(?:[ \t]*\1){2,}[ \t]*$')
+_QUOTE_RE = re.compile(r'^ {0,3}> ?')
+_LIST_RE = re.compile(r'^( {0,3})([*+-]|\d{1,9}[.)])( +|$)(.*)$')
+_CODE_INDENT_RE = re.compile(r'^(?: {4})')
+_TABLE_SEP_RE = re.compile(r'^ {0,3}\|?\s*:?-+:?\s*(?:\|\s*:?-+:?\s*)*\|?\s*$')
+_TASK_RE = re.compile(r'^\[([ xX])\]\s+')
+_REF_DEF_RE = re.compile(
+        r'^ {0,3}\[([^\]]+)\]:\s*<?([^\s>]+)>?(?:\s+["\'(](.*)["\')])?\s*$')
+
+_BLOCK_TAGS = set([
+    'address', 'article', 'aside', 'blockquote', 'center', 'details',
+    'dialog', 'dd', 'div', 'dl', 'dt', 'fieldset', 'figcaption', 'figure',
+    'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li',
+    'main', 'nav', 'ol', 'p', 'pre', 'section', 'summary', 'table', 'tbody',
+    'td', 'tfoot', 'th', 'thead', 'tr', 'ul', 'img', 'iframe', 'script',
+    'style'])
+
+_HTML_BLOCK_RE = re.compile(r'^ {0,3}(?:<!--|<(/?)([a-zA-Z][a-zA-Z0-9-]*)(?:\s|/?>|$))')
+
+# Raw HTML allowed through, roughly what github allows
+_ALLOWED_TAGS = frozenset([
+    'a', 'abbr', 'b', 'bdo', 'blockquote', 'br', 'caption', 'center', 'cite',
+    'code', 'dd', 'del', 'details', 'dfn', 'div', 'dl', 'dt', 'em', 'figcaption',
+    'figure', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'i', 'img', 'ins',
+    'kbd', 'li', 'mark', 'ol', 'p', 'pre', 'q', 'rp', 'rt', 'ruby', 's',
+    'samp', 'small', 'span', 'strike', 'strong', 'sub', 'summary', 'sup',
+    'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'time', 'tr', 'tt', 'u',
+    'ul', 'var', 'wbr'])
+_ALLOWED_ATTRS = frozenset([
+    'align', 'alt', 'border', 'cite', 'class', 'colspan', 'datetime', 'dir',
+    'height', 'href', 'hspace', 'id', 'lang', 'name', 'open', 'rowspan',
+    'span', 'src', 'start', 'summary', 'title', 'type', 'valign', 'vspace',
+    'width'])
+_URL_ATTRS = frozenset(['cite', 'href', 'src'])
+_ALLOWED_URL_SCHEMES = frozenset(['http', 'https', 'mailto', 'ftp'])
+
+_HTML_TAG_RE = re.compile(
+        r'<!--.*?-->|<(/?)([a-zA-Z][a-zA-Z0-9-]*)((?:\s+[^\s"\'>/=]+(?:\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s"\'=<>`]+))?)*)\s*(/?)>',
+        re.DOTALL)
+_HTML_ATTR_RE = re.compile(
+        r'([^\s"\'>/=]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'=<>`]+)))?')
+_CHAR_REF_RE = re.compile(r'&(#[xX][0-9a-fA-F]+|#[0-9]+|[a-zA-Z][a-zA-Z0-9]*);?')
+_URL_IGNORED_RE = re.compile(u'[\x00-\x20\x7f]')
+_URL_SCHEME_RE = re.compile(r'^([^/?#]*?):')
+
+_ENTITY_RE = re.compile(r'&(?!#?\w+;)')
+_ESCAPABLE = u'!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~'
+_ESCAPE_RE = re.compile(r'\\([%s])' % (re.escape(_ESCAPABLE)))
+_ESCAPED_TICK_RE = re.compile(r'\\`')
+_CODE_SPAN_RE = re.compile(r'(?<!`)(`+)(?!`)(.+?)(?<!`)\1(?!`)', re.DOTALL)
+_AUTOLINK_RE = re.compile(r'<((?:https?|ftp)://[^\s<>]+|mailto:[^\s<>]+)>')
+_EMAIL_AUTOLINK_RE = re.compile(r'<([^\s<>@]+@[^\s<>@]+\.[^\s<>@]+)>')
+_INLINE_HTML_RE = re.compile(
+        r'<!--.*?-->|</?[a-zA-Z][a-zA-Z0-9-]*(?:\s+[a-zA-Z_:][-\w:.]*(?:\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s"\'=<>`]+))?)*\s*/?>',
+        re.DOTALL)
+
+_LINK_TEXT = r'\[((?:[^\[\]]|\[[^\[\]]*\])*)\]'
+_LINK_DEST = r'\(\s*<?((?:[^\s()<>]|\([^\s()<>]*\))*)>?(?:\s+(?:"([^"]*)"|\'([^\']*)\'))?\s*\)'
+_IMAGE_RE = re.compile(r'!' + _LINK_TEXT + _LINK_DEST)
+_LINK_RE = re.compile(_LINK_TEXT + _LINK_DEST)
+_REF_IMAGE_RE = re.compile(r'!' + _LINK_TEXT + r'\s?\[([^\]]*)\]')
+_REF_LINK_RE = re.compile(_LINK_TEXT + r'\s?\[([^\]]*)\]')
+_SHORTCUT_REF_RE = re.compile(r'(?<!\])' + _LINK_TEXT + r'(?![\[(])')
+_BARE_URL_RE = re.compile(
+        r'(?<![\w/"\'=])((?:https?://|www\.)[^\s<' + _STASH_START + r']*[^\s<.,:;"\')\]!?*_~' + _STASH_START + _STASH_END + r'])')
+
+_EMPHASIS = (
+    (re.compile(r'\*\*\*(?=\S)(.+?)(?<=\S)\*\*\*', re.DOTALL), u'<em><strong>\\1</strong></em>'),
+    (re.compile(r'\*\*(?=\S)(.+?)(?<=\S)\*\*', re.DOTALL), u'<strong>\\1</strong>'),
+    (re.compile(r'(?<!\w)__(?=\S)(.+?)(?<=\S)__(?!\w)', re.DOTALL), u'<strong>\\1</strong>'),
+    (re.compile(r'\*(?=\S)(.+?)(?<=\S)\*', re.DOTALL), u'<em>\\1</em>'),
+    (re.compile(r'(?<!\w)_(?=\S)(.+?)(?<=\S)_(?!\w)', re.DOTALL), u'<em>\\1</em>'),
+    (re.compile(r'~~(?=\S)(.+?)(?<=\S)~~', re.DOTALL), u'<del>\\1</del>'),
+)
+
+_HARD_BREAK_RE = re.compile(r'(?: {2,}|\\)\n')
+_TAG_RE = re.compile(r'<[^>]*>')
+_SLUG_STRIP_RE = re.compile(r'[^\w\- ]', re.UNICODE)
+
+
+def render(text):
+    """
+    Render markdown text to HTML
+
+    :param text: Markdown text
+    :returns: HTML as unicode string
+    """
+
+    if isinstance(text, str):
+        text = unicode(text, encoding='utf-8')
+
+    text = text.replace(_STASH_START, u'').replace(_STASH_END, u'')
+    lines = text.replace(u'\r\n', u'\n').replace(u'\r', u'\n').expandtabs(4)
+    lines = lines.split(u'\n')
+
+    context = {'refs': {}, 'slugs': {}}
+    lines = _extract_references(lines, context['refs'])
+
+    return u'\n'.join(_render_blocks(lines, context))
+
+
+def _extract_references(lines, refs):
+    """
+    Remove reference link definitions from lines and save them
+
+    :param lines: List of lines
+    :param refs: Dictionary to save definitions to keyed by lowercase label
+    :returns: List of lines without reference definitions
+    """
+
+    remaining = []
+    fence = None
+
+    for line in lines:
+        match = _FENCE_RE.match(line)
+        if match is not None:
+            if fence is None:
+                fence = match.group(2)
+            elif match.group(2).startswith(fence) and not match.group(3):
+                fence = None
+
+        if fence is None:
+            match = _REF_DEF_RE.match(line)
+            if match is not None:
+                label = _normalize_label(match.group(1))
+                refs.setdefault(label, (match.group(2), match.group(3)))
+                continue
+
+        remaining.append(line)
+
+    return remaining
+
+
+def _normalize_label(label):
+    """Normalize reference label for case and whitespace insensitive lookup"""
+
+    return u' '.join(label.lower().split())
+
+
+def _is_blank(line):
+    """Determine if line is empty or only whitespace"""
+
+    return _BLANK_RE.match(line) is not None
+
+
+def _indent_of(line):
+    """Number of leading spaces on line"""
+
+    return len(line) - len(line.lstrip(u' '))
+
+
+def _starts_block(line):
+    """
+    Determine if line starts a new block and therefore interrupts a paragraph
+
+    :param line: Line of text
+    :returns: True or False
+    """
+
+    if _ATX_RE.match(line) or _FENCE_RE.match(line) or _HR_RE.match(line):
+        return True
+
+    if _QUOTE_RE.match(line):
+        return True
+
+    match = _LIST_RE.match(line)
+    if match is not None and match.group(4).strip():
+        marker = match.group(2)
+        # Only ordered lists starting at 1 can interrupt a paragraph
+        if marker[-1] not in u'.)' or int(marker[:-1]) == 1:
+            return True
+
+    return _html_block_tag(line) is not None
+
+
+def _html_block_tag(line):
+    """
+    Get name of the tag starting an HTML block on line
+
+    :param line: Line of text
+    :returns: Tag name, '!--' for comments or None if line doesn't start an
+              HTML block
+    """
+
+    match = _HTML_BLOCK_RE.match(line)
+    if match is None:
+        return None
+
+    if match.group(2) is None:
+        return u'!--'
+
+    tag = match.group(2).lower()
+    if tag not in _BLOCK_TAGS:
+        return None
+
+    return tag
+
+
+def _render_blocks(lines, context, tight=False):
+    """
+    Render list of lines as block level elements
+
+    :param lines: List of lines
+    :param context: Dictionary of rendering state shared by the document
+    :param tight: True to render paragraphs without <p> tags, used for the
+                  contents of tight list items
+    :returns: List of HTML strings
+    """
+
+    html = []
+    idx = 0
+    num_lines = len(lines)
+
+    while idx < num_lines:
+        line = lines[idx]
+
+        if _is_blank(line):
+            idx += 1
+            continue
+
+        match = _FENCE_RE.match(line)
+        if match is not None:
+            idx = _render_fenced_code(lines, idx, match, html)
+            continue
+
+        match = _ATX_RE.match(line)
+        if match is not None:
+            html.append(_heading(len(match.group(1)), match.group(2) or u'',
+                                 context))
+            idx += 1
+            continue
+
+        if _HR_RE.match(line):
+            html.append(u'<hr>')
+            idx += 1
+            continue
+
+        if _QUOTE_RE.match(line):
+            idx = _render_blockquote(lines, idx, context, html)
+            continue
+
+        if idx + 1 < num_lines and _is_table_start(line, lines[idx + 1]):
+            idx = _render_table(lines, idx, context, html)
+            continue
+
+        match = _LIST_RE.match(line)
+        if match is not None:
+            idx = _render_list(lines, idx, context, html)
+            continue
+
+        if _CODE_INDENT_RE.match(line):
+            idx = _render_indented_code(lines, idx, html)
+            continue
+
+        if _html_block_tag(line) is not None:
+            idx = _render_html_block(lines, idx, html)
+            continue
+
+        idx = _render_paragraph(lines, idx, context, html, tight)
+
+    return html
+
+
+def _render_fenced_code(lines, idx, match, html):
+    """
+    Render fenced code block starting at idx
+
+    :returns: Index of first line after block
+    """
+
+    indent = len(match.group(1))
+    fence = match.group(2)
+    lang = match.group(3)
+
+    code = []
+    idx += 1
+    while idx < len(lines):
+        line = lines[idx]
+        closing = _FENCE_RE.match(line)
+        if (closing is not None and closing.group(2).startswith(fence) and
+                not closing.group(3)):
+            idx += 1
+            break
+
+        # Remove up to the same amount of indentation as the opening fence
+        strip = min(indent, _indent_of(line))
+        code.append(line[strip:])
+        idx += 1
+
+    text = _escape(u'\n'.join(code))
+    if code:
+        text += u'\n'
+
+    if lang:
+        html.append(u'<pre lang="%s"><code>%s</code></pre>' % (
+                    _escape_attr(lang), text))
+    else:
+        html.append(u'<pre><code>%s</code></pre>' % (text))
+
+    return idx
+
+
+def _render_indented_code(lines, idx, html):
+    """
+    Render indented code block starting at idx
+
+    :returns: Index of first line after block
+    """
+
+    code = []
+    while idx < len(lines):
+        line = lines[idx]
+        if _CODE_INDENT_RE.match(line):
+            code.append(line[4:])
+        elif _is_blank(line):
+            code.append(u'')
+        else:
+            break
+
+        idx += 1
+
+    while code and not code[-1].strip():
+        code.pop()
+
+    html.append(u'<pre><code>%s\n</code></pre>' % (_escape(u'\n'.join(code))))
+    return idx
+
+
+def _render_blockquote(lines, idx, context, html):
+    """
+    Render block quote starting at idx
+
+    :returns: Index of first line after block
+    """
+
+    quoted = []
+    while idx < len(lines):
+        line = lines[idx]
+        match = _QUOTE_RE.match(line)
+
+        if match is not None:
+            quoted.append(line[match.end():])
+        elif (quoted and not _is_blank(line) and not _is_blank(quoted[-1]) and
+              not _starts_block(line)):
+            # Lazy continuation of a paragraph inside the quote
+            quoted.append(line)
+        else:
+            break
+
+        idx += 1
+
+    html.append(u'<blockquote>\n%s\n</blockquote>' % (
+                u'\n'.join(_render_blocks(quoted, context))))
+    return idx
+
+
+def _split_table_row(line):
+    """
+    Split table row into list of cells
+
+    :param line: Line of text
+    :returns: List of cell text
+    """
+
+    line = line.strip()
+    if line.startswith(u'|'):
+        line = line[1:]
+    if line.endswith(u'|') and not line.endswith(u'\\|'):
+        line = line[:-1]
+
+    return [cell.strip().replace(u'\\|', u'|')
+            for cell in re.split(r'(?<!\\)\|', line)]
+
+
+def _is_table_start(line, next_line):
+    """
+    Determine if line is the header of a table
+
+    :param line: Possible header line
+    :param next_line: Possible delimiter line
+    :returns: True or False
+    """
+
+    if u'|' not in line and u'|' not in next_line:
+        return False
+
+    if not _TABLE_SEP_RE.match(next_line) or u'-' not in next_line:
+        return False
+
+    return len(_split_table_row(line)) == len(_split_table_row(next_line))
+
+
+def _render_table(lines, idx, context, html):
+    """
+    Render table starting at idx
+
+    :returns: Index of first line after table
+    """
+
+    header = _split_table_row(lines[idx])
+
+    aligns = []
+    for cell in _split_table_row(lines[idx + 1]):
+        if cell.startswith(u':') and cell.endswith(u':'):
+            aligns.append(u'center')
+        elif cell.endswith(u':'):
+            aligns.append(u'right')
+        elif cell.startswith(u':'):
+            aligns.append(u'left')
+        else:
+            aligns.append(None)
+
+    def _row(cells, tag):
+        out = [u'<tr>']
+        for col, align in enumerate(aligns):
+            text = cells[col] if col < len(cells) else u''
+            attr = u' align="%s"' % (align) if align else u''
+            out.append(u'<%s%s>%s</%s>' % (tag, attr,
+                                          _render_inline(text, context), tag))
+        out.append(u'</tr>')
+        return u'\n'.join(out)
+
+    out = [u'<table>', u'<thead>', _row(header, u'th'), u'</thead>']
+
+    idx += 2
+    body = []
+    while idx < len(lines):
+        line = lines[idx]
+        if _is_blank(line) or (_starts_block(line) and u'|' not in line):
+            break
+
+        body.append(_row(_split_table_row(line), u'td'))
+        idx += 1
+
+    if body:
+        out.append(u'<tbody>')
+        out.extend(body)
+        out.append(u'</tbody>')
+
+    out.append(u'</table>')
+    html.append(u'\n'.join(out))
+
+    return idx
+
+
+def _render_list(lines, idx, context, html):
+    """
+    Render ordered or unordered list starting at idx
+
+    :returns: Index of first line after list
+    """
+
+    first = _LIST_RE.match(lines[idx])
+    marker = first.group(2)
+    ordered = marker[-1] in u'.)'
+
+    # Items must all use the same bullet character or ordered delimiter
+    list_type = marker[-1]
+
+    items = []
+    loose = False
+
+    while idx < len(lines):
+        match = _LIST_RE.match(lines[idx])
+        if match is None or match.group(2)[-1] != list_type:
+            break
+
+        indent, item_marker, spacing, rest = match.groups()
+        content_indent = len(indent) + len(item_marker) + len(spacing)
+
+        # Content starting with 5+ spaces is an indented code block inside
+        # the item and an empty first line still needs one space.
+        if not rest or len(spacing) > 4:
+            content_indent = len(indent) + len(item_marker) + 1
+            rest = u' ' * (len(spacing) - 1) + rest if rest else rest
+
+        item_lines = [rest]
+        idx += 1
+
+        while idx < len(lines):
+            line = lines[idx]
+
+            if _is_blank(line):
+                item_lines.append(u'')
+                idx += 1
+                continue
+
+            if _indent_of(line) >= content_indent:
+                item_lines.append(line[content_indent:])
+                idx += 1
+                continue
+
+            if (item_lines[-1] and not _starts_block(line) and
+                    not _LIST_RE.match(line)):
+                # Lazy continuation of the paragraph
+                item_lines.append(line.strip())
+                idx += 1
+                continue
+
+            break
+
+        # Blank lines at the end of an item separate it from the next item,
+        # which makes the whole list loose.
+        trailing_blank = False
+        while item_lines and not item_lines[-1].strip():
+            item_lines.pop()
+            trailing_blank = True
+
+        if trailing_blank and idx < len(lines):
+            next_match = _LIST_RE.match(lines[idx])
+            if next_match is not None and next_match.group(2)[-1] == list_type:
+                loose = True
+            else:
+                # Blank line ended the list
+                idx -= 1
+                while idx > 0 and _is_blank(lines[idx - 1]):
+                    idx -= 1
+                items.append(item_lines)
+                idx = _skip_blank(lines, idx)
+                break
+
+        if _has_inner_blank(item_lines):
+            loose = True
+
+        items.append(item_lines)
+
+    if ordered:
+        start = int(marker[:-1])
+        start_attr = u' start="%d"' % (start) if start != 1 else u''
+        out = [u'<ol%s>' % (start_attr)]
+    else:
+        out = [u'<ul>']
+
+    for item_lines in items:
+        out.append(_list_item(item_lines, context, tight=not loose))
+
+    out.append(u'</ol>' if ordered else u'</ul>')
+    html.append(u'\n'.join(out))
+
+    return idx
+
+
+def _skip_blank(lines, idx):
+    """Get index of next non-blank line starting at idx"""
+
+    while idx < len(lines) and _is_blank(lines[idx]):
+        idx += 1
+
+    return idx
+
+
+def _has_inner_blank(item_lines):
+    """
+    Determine if a list item has blank lines separating its direct children
+
+    Blank lines inside fenced code blocks don't count.
+    """
+
+    fence = None
+    seen_blank = False
+
+    for line in item_lines:
+        match = _FENCE_RE.match(line)
+        if match is not None:
+            fence = None if fence is not None else match.group(2)
+            seen_blank = False
+            continue
+
+        if fence is not None:
+            continue
+
+        if _is_blank(line):
+            seen_blank = True
+        elif seen_blank and _indent_of(line) == 0:
+            return True
+
+    return False
+
+
+def _list_item(item_lines, context, tight):
+    """
+    Render list item
+
+    :param item_lines: Lines of item with the list marker removed
+    :param context: Dictionary of rendering state shared by the document
+    :param tight: Render paragraphs without <p> tags
+    :returns: HTML string
+    """
+
+    checkbox = u''
+    if item_lines:
+        match = _TASK_RE.match(item_lines[0])
+        if match is not None:
+            checked = u' checked' if match.group(1) in u'xX' else u''
+            checkbox = u'<input type="checkbox" class="task-list-item-checkbox" disabled%s> ' % (checked)
+            item_lines = [item_lines[0][match.end():]] + item_lines[1:]
+
+    body = _render_blocks(item_lines, context, tight=tight)
+
+    if checkbox:
+        return u'<li class="task-list-item">%s%s</li>' % (checkbox,
+                                                           u'\n'.join(body))
+
+    if tight and len(body) <= 1:
+        return u'<li>%s</li>' % (u''.join(body))
+
+    return u'<li>\n%s\n</li>' % (u'\n'.join(body))
+
+
+def _render_html_block(lines, idx, html):
+    """
+    Pass through raw HTML block starting at idx until the next blank line
+
+    :returns: Index of first line after block
+    """
+
+    block = []
+    while idx < len(lines) and not _is_blank(lines[idx]):
+        block.append(lines[idx])
+        idx += 1
+
+    html.append(_sanitize_html(u'\n'.join(block)))
+    return idx
+
+
+def _render_paragraph(lines, idx, context, html, tight):
+    """
+    Render paragraph or setext heading starting at idx
+
+    :returns: Index of first line after paragraph
+    """
+
+    para = [lines[idx].strip()]
+    idx += 1
+
+    while idx < len(lines):
+        line = lines[idx]
+        if _is_blank(line):
+            break
+
+        match = _SETEXT_RE.match(line)
+        if match is not None:
+            level = 1 if match.group(1).startswith(u'=') else 2
+            html.append(_heading(level, u'\n'.join(para), context))
+            return idx + 1
+
+        if _starts_block(line):
+            break
+
+        if idx + 1 < len(lines) and _is_table_start(line, lines[idx + 1]):
+            break
+
+        # Keep trailing whitespace around for hard line breaks
+        para.append(line.lstrip())
+        idx += 1
+
+    text = _render_inline(u'\n'.join(para).rstrip(), context)
+
+    if tight:
+        html.append(text)
+    else:
+        html.append(u'<p>%s</p>' % (text))
+
+    return idx
+
+
+def _heading(level, text, context):
+    """
+    Render heading with anchor link like github
+
+    :param level: Level of heading 1-6
+    :param text: Raw text of heading
+    :param context: Dictionary of rendering state shared by the document
+    :returns: HTML string
+    """
+
+    inner = _render_inline(text.strip(), context)
+    slug = _unique_slug(heading_slug(_TAG_RE.sub(u'', inner)), context)
+
+    return (u'<h%d><a id="user-content-%s" class="anchor" href="#%s" '
+            u'aria-hidden="true"><span class="octicon octicon-link"></span>'
+            u'</a>%s</h%d>' % (level, slug, slug, inner, level))
+
+
+def heading_slug(text):
+    """
+    Get anchor name for heading text the same way github does
+
+    :param text: Plain text of heading
+    :returns: Slug suitable for an id attribute
+    """
+
+    text = _unescape(text).lower()
+    text = _SLUG_STRIP_RE.sub(u'', text)
+
+    return text.replace(u' ', u'-')
+
+
+def _unique_slug(slug, context):
+    """Make slug unique in document by adding a numeric suffix"""
+
+    count = context['slugs'].get(slug)
+    context['slugs'][slug] = 0 if count is None else count + 1
+
+    if count is None:
+        return slug
+
+    return u'%s-%d' % (slug, count + 1)
+
+
+def _render_inline(text, context):
+    """
+    Render inline markdown elements
+
+    :param text: Text of a single block
+    :param context: Dictionary of rendering state shared by the document
+    :returns: HTML string
+    """
+
+    stash = []
+
+    def _stash(html):
+        stash.append(html)
+        return u'%s%d%s' % (_STASH_START, len(stash) - 1, _STASH_END)
+
+    # Escaped backticks cannot start code spans but everything inside code
+    # spans is literal so handle those before other escapes.
+    text = _ESCAPED_TICK_RE.sub(lambda m: _stash(u'`'), text)
+    text = _CODE_SPAN_RE.sub(
+            lambda m: _stash(u'<code>%s</code>' % (
+                             _escape(u' '.join(m.group(2).strip().split(u'\n'))))),
+            text)
+    text = _ESCAPE_RE.sub(lambda m: _stash(_escape(m.group(1))), text)
+
+    text = _AUTOLINK_RE.sub(
+            lambda m: _stash(_link(m.group(1), _escape(m.group(1)))), text)
+    text = _EMAIL_AUTOLINK_RE.sub(
+            lambda m: _stash(_link(u'mailto:%s' % (m.group(1)),
+                                   _escape(m.group(1)))),
+            text)
+    text = _INLINE_HTML_RE.sub(lambda m: _stash(_sanitize_html(m.group(0))),
+                               text)
+
+    def _image(match):
+        url = match.group(2)
+        title = match.group(3) or match.group(4)
+        return _stash(_img(url, _restore(match.group(1), stash), title))
+
+    def _ref_image(match):
+        ref = context['refs'].get(_normalize_label(match.group(2) or
+                                                   match.group(1)))
+        if ref is None:
+            return match.group(0)
+
+        return _stash(_img(ref[0], _restore(match.group(1), stash), ref[1]))
+
+    def _inline_link(match):
+        url = match.group(2)
+        title = match.group(3) or match.group(4)
+        return _stash(_link(url, _render_inline(_restore(match.group(1), stash),
+                                                context), title))
+
+    def _ref_link(match):
+        label = match.group(2) if match.lastindex >= 2 else None
+        ref = context['refs'].get(_normalize_label(label or match.group(1)))
+        if ref is None:
+            return match.group(0)
+
+        return _stash(_link(ref[0], _render_inline(_restore(match.group(1), stash),
+                                                   context), ref[1]))
+
+    text = _IMAGE_RE.sub(_image, text)
+    text = _REF_IMAGE_RE.sub(_ref_image, text)
+    text = _LINK_RE.sub(_inline_link, text)
+    text = _REF_LINK_RE.sub(_ref_link, text)
+    if context['refs']:
+        text = _SHORTCUT_REF_RE.sub(_ref_link, text)
+
+    def _bare_url(match):
+        url = match.group(1)
+        href = url if not url.startswith(u'www.') else u'http://%s' % (url)
+        return _stash(_link(href, _escape(url)))
+
+    text = _BARE_URL_RE.sub(_bare_url, text)
+
+    text = _escape(text)
+
+    for regex, replacement in _EMPHASIS:
+        text = regex.sub(replacement, text)
+
+    text = _HARD_BREAK_RE.sub(u'<br>\n', text)
+
+    return _restore(text, stash)
+
+
+def _restore(text, stash):
+    """Replace stash placeholders in text with their saved HTML"""
+
+    # Stashed HTML can contain placeholders itself, i.e. a link with code in
+    # the text, so keep going until everything is replaced.
+    while _STASH_START in text:
+        text = _STASH_RE.sub(lambda m: stash[int(m.group(1))], text)
+
+    return text
+
+
+def _link(url, inner_html, title=None):
+    """Create HTML for a link"""
+
+    title_attr = u''
+    if title:
+        title_attr = u' title="%s"' % (_escape_attr(title))
+
+    return u'<a href="%s"%s>%s</a>' % (_safe_url(url), title_attr, inner_html)
+
+
+def _img(url, alt, title=None):
+    """Create HTML for an image"""
+
+    title_attr = u''
+    if title:
+        title_attr = u' title="%s"' % (_escape_attr(title))
+
+    alt = _TAG_RE.sub(u'', alt)
+    return u'<img src="%s" alt="%s"%s>' % (_safe_url(url), _escape_attr(alt),
+                                          title_attr)
+
+
+def _safe_url(url):
+    """Escape URL for attribute or empty string for a disallowed scheme"""
+
+    url = _unescape(url)
+    if not _is_safe_url(url):
+        return u''
+
+    return _escape_attr(url)
+
+
+def _is_safe_url(url):
+    """
+    Determine if URL is relative or uses one of the allowed schemes
+
+    :param url: URL that can still contain character references
+    :returns: True or False
+    """
+
+    # Browsers decode references and ignore whitespace and control
+    # characters, i.e. 'jav&#x61;script:' and 'java\tscript:' both run.
+    url = _URL_IGNORED_RE.sub(u'', _decode_char_refs(url))
+
+    match = _URL_SCHEME_RE.match(url)
+    if match is not None:
+        return match.group(1).lower() in _ALLOWED_URL_SCHEMES
+
+    # An unknown reference could still decode to a ':' in the browser
+    return u'&' not in re.split(u'[/?#]', url, 1)[0]
+
+
+def _decode_char_refs(text):
+    """Decode all numeric, hex and named character references in text"""
+
+    def _decode(match):
+        ref = match.group(1)
+
+        try:
+            if ref[:2] in (u'#x', u'#X'):
+                return unichr(int(ref[2:], 16))
+            elif ref[0] == u'#':
+                return unichr(int(ref[1:]))
+        except (ValueError, OverflowError):
+            return u'\ufffd'
+
+        codepoint = htmlentitydefs.name2codepoint.get(ref)
+        if codepoint is None:
+            return match.group(0)
+
+        return unichr(codepoint)
+
+    return _CHAR_REF_RE.sub(_decode, text)
+
+
+def _sanitize_html(html):
+    """
+    Only allow raw HTML that cannot run scripts
+
+    Tags not in _ALLOWED_TAGS are escaped so they show up as text.  Allowed
+    tags are rebuilt with only the attributes in _ALLOWED_ATTRS and URLs with
+    schemes in _ALLOWED_URL_SCHEMES.  Anything that doesn't parse as a tag is
+    escaped too.
+    """
+
+    parts = []
+    pos = 0
+
+    for match in _HTML_TAG_RE.finditer(html):
+        parts.append(_escape(html[pos:match.start()]))
+        parts.append(_sanitize_tag(match))
+        pos = match.end()
+
+    parts.append(_escape(html[pos:]))
+    return u''.join(parts)
+
+
+def _sanitize_tag(match):
+    """Rebuild tag matched by _HTML_TAG_RE with only allowed attributes"""
+
+    closing, name, attrs, self_closing = match.groups()
+
+    # Comments are dropped since browsers end them in more ways than one,
+    # i.e. <!--> and --!>, which would let what follows through unchecked
+    if name is None:
+        return u''
+
+    name = name.lower()
+    if name not in _ALLOWED_TAGS:
+        return _escape(match.group(0))
+
+    if closing:
+        return u'</%s>' % (name)
+
+    allowed = []
+    for attr in _HTML_ATTR_RE.finditer(attrs):
+        attr_name = attr.group(1).lower()
+        if attr_name not in _ALLOWED_ATTRS:
+            continue
+
+        value = next((v for v in attr.groups()[1:] if v is not None), None)
+        if value is None:
+            allowed.append(u' %s' % (attr_name))
+            continue
+
+        value = _decode_char_refs(value)
+        if attr_name in _URL_ATTRS and not _is_safe_url(value):
+            continue
+
+        allowed.append(u' %s="%s"' % (attr_name, cgi.escape(value, True)))
+
+    return u'<%s%s%s>' % (name, u''.join(allowed),
+                          u' /' if self_closing else u'')
+
+
+def _escape(text):
+    """Escape text for HTML leaving existing entities alone"""
+
+    text = _ENTITY_RE.sub(u'&amp;', text)
+    return text.replace(u'<', u'&lt;').replace(u'>', u'&gt;')
+
+
+def _escape_attr(text):
+    """Escape text for use in an HTML attribute"""
+
+    return _escape(text).replace(u'"', u'&quot;')
+
+
+def _unescape(text):
+    """Undo the basic escaping done by _escape"""
+
+    return text.replace(u'&lt;', u'<').replace(u'&gt;', u'>').replace(
+                        u'&quot;', u'"').replace(u'&amp;', u'&')
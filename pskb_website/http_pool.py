@@ -0,0 +1,145 @@
+"""
+Pooled keep-alive HTTP client for talking to github.com
+
+The flask-oauthlib remote application uses urllib2 for every request, which
+means a brand new TCP connection and TLS handshake for every single API call.
+This module provides a drop-in replacement for the remote application's
+http_request() that sends everything through a shared requests.Session so
+connections to api.github.com are kept alive and reused.
+
+The underlying connection pools are safe to share between threads and, since
+gunicorn monkey patches the standard library when running with gevent
+workers, between greenlets as well.  Set GITHUB_POOL_BLOCK to make greenlets
+wait on a free connection instead of opening throw-away connections once a
+host's pool is exhausted.
+
+Pool sizes can be tuned with the following configuration values:
+
+    - GITHUB_POOL_CONNECTIONS: Number of per-host pools to keep around
+    - GITHUB_POOL_MAXSIZE: Max number of connections to keep per host
+    - GITHUB_POOL_BLOCK: Block when a host's pool is exhausted
+    - GITHUB_HTTP_TIMEOUT: Seconds to wait on connect/read before giving up
+"""
+
+import collections
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask_oauthlib.client import prepare_request
+
+from . import app
+from . import utils
+
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 32
+DEFAULT_HTTP_TIMEOUT = 30
+
+# Mimic the bits of a urllib2 response that flask-oauthlib relies on so we can
+# slide in underneath it without any other changes.
+pooled_response = collections.namedtuple('pooled_response', 'code, headers')
+
+_session = None
+
+
+def _create_session():
+    """
+    Create session with pooled adapter mounted according to app config
+
+    :returns: requests.Session object
+    """
+
+    session = requests.Session()
+
+    adapter = HTTPAdapter(
+            pool_connections=utils.int_config('GITHUB_POOL_CONNECTIONS',
+                                              DEFAULT_POOL_CONNECTIONS),
+            pool_maxsize=utils.int_config('GITHUB_POOL_MAXSIZE',
+                                          DEFAULT_POOL_MAXSIZE),
+            pool_block=utils.bool_config('GITHUB_POOL_BLOCK', False))
+
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+def get_session():
+    """
+    Get shared session, creating it on first use
+
+    :returns: requests.Session object
+    """
+
+    global _session
+
+    if _session is None:
+        _session = _create_session()
+
+    return _session
+
+
+def http_request(uri, headers=None, data=None, method=None):
+    """
+    Send request through the shared connection pool
+
+    :param uri: Full URL to request
+    :param headers: Optional dict of headers to send
+    :param data: Optional body of request
+    :param method: HTTP method, defaults to GET or POST if data is given
+    :returns: Tuple of (pooled_response, content)
+
+    This has the same signature and return value as
+    flask_oauthlib.client.OAuthRemoteApp.http_request so it can be used as a
+    replacement for it.
+    """
+
+    uri, headers, data, method = prepare_request(uri, headers, data, method)
+    timeout = utils.int_config('GITHUB_HTTP_TIMEOUT', DEFAULT_HTTP_TIMEOUT)
+
+    resp = get_session().request(method.upper(), uri, headers=headers,
+                                 data=data, timeout=timeout,
+                                 allow_redirects=True)
+
+    return pooled_response(resp.status_code, resp.headers), resp.content
+
+
+def pool_stats():
+    """
+    Get statistics about the connection pools to help with sizing them
+
+    :returns: Dictionary keyed by host with connection counts::
+
+        {'https://api.github.com:443': {'connections_created': 3,
+                                        'requests': 100,
+                                        'idle': 2,
+                                        'maxsize': 32}}
+
+    A connections_created count that keeps growing along with requests means
+    connections are not being reused, usually because GITHUB_POOL_MAXSIZE is
+    too small for the number of concurrent requests.
+    """
+
+    stats = {}
+    if _session is None:
+        return stats
+
+    for adapter in set(_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+
+            # Connection pools are pre-filled with None placeholders so only
+            # count the real connections sitting idle.
+            idle = len([conn for conn in list(pool.pool.queue)
+                        if conn is not None]) if pool.pool else 0
+
+            name = '%s://%s:%s' % (pool.scheme, pool.host, pool.port)
+            stats[name] = {'connections_created': pool.num_connections,
+                           'requests': pool.num_requests,
+                           'idle': idle,
+                           'maxsize': pool.pool.maxsize if pool.pool else 0}
+
+    return stats
@@ -40,6 +40,13 @@ def read_article(stack, title, branch, status, rendered_text=True):
             if possible_status not in statuses_to_check:
                 statuses_to_check.append(possible_status)
 
+    # The index knows where the guide is so only check the others if the
+    # index is out of date.
+    location = models.find_article_location(stack, title)
+    if location is not None:
+        statuses_to_check.remove(location.status)
+        statuses_to_check.insert(0, location.status)
+
     article = None
     for status in statuses_to_check:
         path = u'%s/%s/%s' % (status, stack, title)
@@ -0,0 +1,97 @@
+"""
+Size-bounded in-process cache with per-entry timeouts
+
+Used by the cache module to keep the hottest values in memory in front of
+redis.  Entries are evicted once they time out or once there are too many,
+least recently used first.  All operations are safe to use from several
+threads or greenlets.
+"""
+
+import collections
+import threading
+import time
+
+
+class LRUCache(object):
+    """
+    Least recently used cache of a fixed number of entries
+    """
+
+    def __init__(self, max_entries, timeout):
+        """
+        :param max_entries: Max number of entries to hold
+        :param timeout: Default seconds to keep entries
+        """
+
+        self.max_entries = max_entries
+        self.timeout = timeout
+
+        # key -> (expires, value), oldest first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get value for key
+
+        :param key: Key to look for
+        :returns: Value or None if not found or timed out
+        """
+
+        with self._lock:
+            try:
+                expires, value = self._entries.pop(key)
+            except KeyError:
+                return None
+
+            if expires <= time.time():
+                return None
+
+            # Move to the end to mark it as most recently used
+            self._entries[key] = (expires, value)
+            return value
+
+    def set(self, key, value, timeout=None):
+        """
+        Set value for key
+
+        :param key: Key to save value with
+        :param value: Value to save, None is not allowed
+        :param timeout: Optional seconds to keep value, never longer than the
+                        default timeout
+        :returns: None
+        """
+
+        if timeout is None or timeout > self.timeout:
+            timeout = self.timeout
+
+        if timeout <= 0 or self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + timeout, value)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        """
+        Remove keys
+
+        :param keys: Keys to remove
+        :returns: None
+        """
+
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all entries"""
+
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,672 @@
+"""
+Local git mirror of the content repository
+
+Reading listings and articles from the github API costs at least one rate
+limited request per read.  This module keeps a bare clone of the main content
+repository on local disk and answers the most common reads straight from the
+git objects so rendering pages doesn't have to talk to github at all once the
+mirror is up to date.
+
+The mirror is optional and only enabled when the GIT_MIRROR_PATH
+configuration value is set.  The remote module falls back to the github API
+whenever the mirror cannot answer a request.
+
+Keeping the mirror fresh works like this:
+
+    - The /github_push webhook marks the mirror as stale, which saves a
+      timestamp to the cache so every process sees the change, and fetches
+      immediately.
+    - Every write we make through the github API marks the mirror as stale
+      so reads following a write never see old data.
+    - Each process fetches when it sees a newer stale timestamp in the cache
+      or when it hasn't fetched in GIT_MIRROR_MAX_AGE seconds, which covers
+      any webhooks we never received.
+
+Several processes can share a single mirror directory, i.e. gunicorn workers,
+so fetches are protected by a lock file next to the mirror.
+"""
+
+import email.utils
+import os
+import re
+import subprocess
+import threading
+import time
+
+from . import app
+from . import cache
+from . import catfile
+from . import lru
+from . import utils
+
+# 5 minutes
+DEFAULT_MAX_AGE = 5 * 60
+
+DEFAULT_LOCK_TIMEOUT = 60
+
+# Github commits with no-reply addresses embed the login in the address:
+# 12345+login@users.noreply.github.com or login@users.noreply.github.com
+NOREPLY_EMAIL_RE = re.compile(r'^(?:\d+\+)?([^@]+)@users\.noreply\.github\.com$',
+                              re.IGNORECASE)
+
+# Commits made through the github web interface and API are committed by this
+# address, which the API reports as the 'web-flow' user.
+WEB_FLOW_EMAIL = u'noreply@github.com'
+WEB_FLOW_LOGIN = u'web-flow'
+
+_fetch_lock = threading.Lock()
+
+# Time of start of last successful fetch in this process
+_last_fetch = None
+
+# Email address to github login mapping cached for this process
+_logins = {}
+
+# History of files by (commit SHA, path), which never changes, so reading a
+# guide doesn't run git log until its branch moves
+HISTORY_CACHE_ENTRIES = 1000
+HISTORY_CACHE_TIMEOUT = 60 * 60
+
+_histories = lru.LRUCache(HISTORY_CACHE_ENTRIES, HISTORY_CACHE_TIMEOUT)
+
+
+def mirror_path():
+    """
+    Get path to mirror on local disk
+
+    :returns: Path or None if mirror is disabled
+    """
+
+    return app.config.get('GIT_MIRROR_PATH') or None
+
+
+def is_enabled():
+    """
+    Determine if mirror is enabled or not
+    :returns: True or False
+    """
+
+    return mirror_path() is not None
+
+
+def serves(repo_path):
+    """
+    Determine if mirror holds given repo
+
+    :param repo_path: Path to repo (owner/repo_name)
+    :returns: True or False
+    """
+
+    if not is_enabled():
+        return False
+
+    return repo_path == '%s/%s' % (app.config['REPO_OWNER'],
+                                   app.config['REPO_NAME'])
+
+
+def can_read(repo_path):
+    """
+    Determine if reads for the given repo can be answered by the mirror,
+    fetching first if the mirror is stale
+
+    :param repo_path: Path to repo (owner/repo_name)
+    :returns: True or False
+    """
+
+    return serves(repo_path) and refresh()
+
+
+def mark_stale():
+    """
+    Mark mirror as out of date in all processes because the repo changed
+
+    :returns: None
+    """
+
+    global _last_fetch
+
+    if not is_enabled():
+        return
+
+    _last_fetch = None
+    cache.save_mirror_push_time(time.time())
+
+
+def _is_stale():
+    """
+    Determine if this process should fetch before reading from the mirror
+
+    :returns: True or False
+    """
+
+    if _last_fetch is None:
+        return True
+
+    max_age = utils.int_config('GIT_MIRROR_MAX_AGE', DEFAULT_MAX_AGE)
+    if time.time() - _last_fetch > max_age:
+        return True
+
+    pushed = cache.read_mirror_push_time()
+    if pushed is None:
+        return False
+
+    try:
+        return float(pushed) >= _last_fetch
+    except ValueError:
+        return False
+
+
+def refresh(force=False):
+    """
+    Clone or fetch mirror if it's stale
+
+    :param force: True to fetch even if the mirror looks up to date
+    :returns: True if mirror is ready to read from or False otherwise
+    """
+
+    global _last_fetch
+
+    if not is_enabled():
+        return False
+
+    if not force and not _is_stale():
+        return True
+
+    # Anyone else in this process waits for the fetch in progress and then
+    # reads the new data.
+    with _fetch_lock:
+        if not force and not _is_stale():
+            return True
+
+        started = time.time()
+        timeout = utils.int_config('GIT_MIRROR_LOCK_TIMEOUT',
+                                   DEFAULT_LOCK_TIMEOUT)
+
+        lock_path = '%s.lock' % (mirror_path().rstrip(os.sep))
+
+        with utils.file_lock(lock_path, timeout) as locked:
+            if not locked:
+                app.logger.warning('Timed out waiting on lock for mirror at "%s"',
+                                   mirror_path())
+                return False
+
+            if os.path.isdir(mirror_path()):
+                success = _fetch()
+            else:
+                success = _clone()
+
+        if success:
+            _last_fetch = started
+
+            # Long-running readers might not notice new packs and refs
+            catfile.reset(mirror_path())
+
+        return success
+
+
+def _clone_url():
+    """Get URL to clone main repo with"""
+
+    url = u'github.com/%s/%s.git' % (app.config['REPO_OWNER'],
+                                     app.config['REPO_NAME'])
+
+    token = app.config.get('REPO_OWNER_ACCESS_TOKEN')
+    if token:
+        return u'https://%s:%s@%s' % (app.config['REPO_OWNER'], token, url)
+
+    return u'https://%s' % (url)
+
+
+def _clone():
+    """
+    Create mirror as a bare clone of main repo
+
+    :returns: True or False if clone succeeded
+    """
+
+    path = mirror_path()
+    app.logger.info('Cloning mirror of main repo to "%s"', path)
+
+    cmd = ['git', 'clone', '--bare', '--quiet', _clone_url(), path]
+    if _run(cmd) is None:
+        return False
+
+    # Bare clones don't fetch anything by default.  Mirror every branch as a
+    # local branch so branch names are the same as on github.
+    return _git(['config', 'remote.origin.fetch',
+                 '+refs/heads/*:refs/heads/*']) is not None
+
+
+def _fetch():
+    """
+    Fetch all branches from github and remove any deleted branches
+
+    :returns: True or False if fetch succeeded
+    """
+
+    app.logger.debug('Fetching mirror at "%s"', mirror_path())
+    return _git(['fetch', '--quiet', '--prune', 'origin']) is not None
+
+
+def _run(cmd, input_=None, quiet=False):
+    """
+    Run command and get output
+
+    :param cmd: List of command arguments
+    :param input_: Optional string to send to command's stdin
+    :param quiet: True to not log a failed command i.e. when failure is an
+                  expected answer
+    :returns: Output of command or None if command failed
+    """
+
+    try:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        out, err = proc.communicate(input_)
+    except OSError:
+        app.logger.error('Failed running "%s"', cmd[:3], exc_info=True)
+        return None
+
+    if proc.returncode != 0:
+        if not quiet:
+            app.logger.error('Failed running "%s", returncode: %d, stderr: %s',
+                             cmd[:3], proc.returncode, err)
+        return None
+
+    return out
+
+
+def _git(args, input_=None, quiet=False):
+    """
+    Run git command against mirror
+
+    :param args: List of git arguments
+    :param input_: Optional string to send to command's stdin
+    :param quiet: True to not log a failed command
+    :returns: Output of command or None if command failed
+    """
+
+    cmd = ['git', '--git-dir', mirror_path()] + args
+    return _run(cmd, input_=input_, quiet=quiet)
+
+
+def _ref(branch):
+    """Get fully qualified ref name for branch"""
+
+    return u'refs/heads/%s' % (branch)
+
+
+def read_branch(name):
+    """
+    Get SHA of HEAD of branch
+
+    :param name: Name of branch
+    :returns: SHA or None if branch is not found
+    """
+
+    header = _catfile(catfile.read_header, _ref(name))
+    if header is None:
+        return None
+
+    return header.sha
+
+
+def read_directory_at_commit(path, commit_sha):
+    """
+    Read every file under a directory as of a specific commit
+
+    :param path: Short path to directory without repo owner and name
+    :param commit_sha: SHA of commit to read directory from
+    :returns: Tuple of (tree SHA, list of (path, mode, sha) tuples for files
+              with paths relative to directory) or None if directory is not
+              found
+    """
+
+    header = _catfile(catfile.read_header, u'%s:%s' % (commit_sha, path))
+    if header is None or header.type != 'tree':
+        return None
+
+    listing = []
+    trees = [(u'', header.sha)]
+    while trees:
+        prefix, tree_sha = trees.pop()
+
+        entries = _catfile(catfile.read_tree, tree_sha)
+        if entries is None:
+            return None
+
+        for entry in entries:
+            entry_path = u'%s%s' % (prefix, entry.name)
+
+            if entry.type == 'tree':
+                trees.append((u'%s/' % (entry_path), entry.sha))
+            else:
+                listing.append((entry_path, entry.mode, entry.sha))
+
+    return header.sha, sorted(listing)
+
+
+def files(sha, filename):
+    """
+    Get list of files with a specific name
+
+    :param sha: SHA of commit to read files from
+    :param filename: Name of file to search for recursively
+    :returns: List of (path, sha) tuples with path including repo owner and
+              name or None if listing failed
+    """
+
+    repo = '%s/%s' % (app.config['REPO_OWNER'], app.config['REPO_NAME'])
+    listing = []
+
+    # Walk trees ourselves instead of running ls-tree so all the reads go
+    # through the pool of cat-file processes.
+    trees = [(u'', u'%s^{tree}' % (sha))]
+    while trees:
+        prefix, tree_sha = trees.pop()
+
+        entries = _catfile(catfile.read_tree, tree_sha)
+        if entries is None:
+            app.logger.error('Failed reading tree "%s" from mirror', tree_sha)
+            return None
+
+        for entry in entries:
+            path = u'%s%s' % (prefix, entry.name)
+
+            if entry.type == 'tree':
+                trees.append((u'%s/' % (path), entry.sha))
+            elif entry.type == 'blob' and path.endswith(filename):
+                listing.append((u'%s/%s' % (repo, path), entry.sha))
+
+    # Match the order of the recursive tree listing from the github API
+    listing.sort()
+    return listing
+
+
+def read_file(path, branch, missing=None):
+    """
+    Read file contents
+
+    :param path: Short path to file (<dir>/.../<filename>) without repo
+                 owner and name
+    :param branch: Name of branch to read file from
+    :param missing: Value to return if file is not found
+    :returns: Tuple of (sha, text), missing if file is not found or None if
+              an error occurred
+    """
+
+    return _read_file(u'%s:%s' % (_ref(branch), path), missing=missing)
+
+
+def file_sha(path, branch):
+    """
+    Get SHA of file without reading it
+
+    :param path: Short path to file (<dir>/.../<filename>) without repo
+                 owner and name
+    :param branch: Name of branch file is on
+    :returns: SHA of file or None if file is not found
+    """
+
+    header = _catfile(catfile.read_header, u'%s:%s' % (_ref(branch), path))
+    if header is None or header.type != 'blob':
+        return None
+
+    return header.sha
+
+
+def read_file_at_commit(path, commit_sha):
+    """
+    Read file contents as of a specific commit
+
+    :param path: Short path to file (<dir>/.../<filename>) without repo
+                 owner and name
+    :param commit_sha: SHA of commit to read file from
+    :returns: Tuple of (sha, text) or None if file is not found
+    """
+
+    return _read_file(u'%s:%s' % (commit_sha, path))
+
+
+def _read_file(name, missing=None):
+    """
+    Read blob contents by object name
+
+    :param name: Object name, i.e. <ref>:<path>
+    :param missing: Value to return if file is not found
+    :returns: Tuple of (sha, text), missing if file is not found or None if
+              an error occurred
+    """
+
+    try:
+        obj = catfile.read_object(mirror_path(), name)
+    except (IOError, OSError):
+        app.logger.error('Failed reading %s from mirror', name, exc_info=True)
+        return None
+
+    if obj is None or obj[0].type != 'blob':
+        return missing
+
+    return obj[0].sha, unicode(obj[1], encoding='utf-8')
+
+
+def has_commit(sha):
+    """
+    Determine if mirror has fetched a commit
+
+    :param sha: SHA of commit
+    :returns: True or False
+    """
+
+    header = _catfile(catfile.read_header, sha)
+    return header is not None and header.type == 'commit'
+
+
+def read_blob(sha):
+    """
+    Read contents of file by SHA
+
+    :param sha: SHA of blob
+    :returns: Text of blob or None if not found
+    """
+
+    obj = _catfile(catfile.read_object, sha)
+    if obj is None or obj[0].type != 'blob':
+        return None
+
+    return unicode(obj[1], encoding='utf-8')
+
+
+def _catfile(func, *args):
+    """
+    Call function from catfile module on mirror and log errors
+
+    :param func: Function to call with path to mirror and args
+    :returns: Return value of func or None if an error occurred
+    """
+
+    try:
+        return func(mirror_path(), *args)
+    except (IOError, OSError):
+        app.logger.error('Failed reading %s from mirror', args, exc_info=True)
+        return None
+
+
+def last_modified(path, branch):
+    """
+    Get time file was last changed as an HTTP date like the github API returns
+
+    :param path: Short path to file (<dir>/.../<filename>) without repo
+                 owner and name
+    :param branch: Name of branch to read file from
+    :returns: Date string or None if not found
+    """
+
+    history = _file_history(path, branch)
+    if history is None or history[0] is None:
+        return None
+
+    return email.utils.formatdate(history[0], usegmt=True)
+
+
+def file_contributors(path, branch):
+    """
+    Get authors and committers to a file from git history
+
+    :param path: Short path to file (<dir>/.../<filename>) without repo
+                 owner and name
+    :param branch: Name of branch to read contributors for
+    :returns: Same dictionary as remote.file_contributors or None if any of the
+              contributors' github logins are unknown
+
+    Git history only has names and email addresses so this relies on the
+    email to login mapping learned from previous API requests.  See
+    learn_logins().
+    """
+
+    history = _file_history(path, branch)
+    if history is None:
+        return None
+
+    people = history[1]
+    emails = set(email_ for group in people.itervalues()
+                 for _, email_ in group)
+    logins = _logins_for_emails(emails)
+    if logins is None:
+        return None
+
+    contribs = {'authors': set(), 'committers': set()}
+    for key, group in people.iteritems():
+        for name, email_ in group:
+            login = logins[email_.lower()]
+
+            # Same rules as the API version, no name is better than a name
+            # that's just the login.
+            if not name or name == login:
+                name = None
+
+            contribs[key].add((name, login))
+
+    return contribs
+
+
+def _file_history(path, branch):
+    """
+    Get time file was last changed and everyone who changed it with a single
+    git log
+
+    :param path: Short path to file (<dir>/.../<filename>) without repo
+                 owner and name
+    :param branch: Name of branch to read history for
+    :returns: Tuple of (unix timestamp or None if file has no history,
+              dictionary of 'authors' and 'committers' sets of (name, email)
+              tuples) or None if git failed
+    """
+
+    commit_sha = read_branch(branch)
+    if commit_sha is None:
+        return None
+
+    key = (commit_sha, path)
+    history = _histories.get(key)
+    if history is not None:
+        return history
+
+    out = _git(['log', '--format=%ct%x00%an%x00%ae%x00%cn%x00%ce',
+                commit_sha, '--', path.encode('utf-8')])
+    if out is None:
+        return None
+
+    last_modified_ = None
+    people = {'authors': set(), 'committers': set()}
+    for line in out.splitlines():
+        tokens = unicode(line, encoding='utf-8').split(u'\0')
+        if len(tokens) != 5:
+            continue
+
+        # Newest commit comes first
+        if last_modified_ is None:
+            last_modified_ = int(tokens[0])
+
+        people['authors'].add((tokens[1], tokens[2]))
+        people['committers'].add((tokens[3], tokens[4]))
+
+    history = (last_modified_, people)
+    _histories.set(key, history)
+
+    return history
+
+
+def _logins_for_emails(emails):
+    """
+    Map email addresses to github logins
+
+    :param emails: Iterable of email addresses
+    :returns: Dictionary of lowercase email to login or None if any login is
+              unknown
+    """
+
+    logins = {}
+    missing = []
+
+    for email_ in emails:
+        email_ = email_.lower()
+
+        if email_ == WEB_FLOW_EMAIL:
+            logins[email_] = WEB_FLOW_LOGIN
+            continue
+
+        match = NOREPLY_EMAIL_RE.match(email_)
+        if match is not None:
+            logins[email_] = match.group(1)
+        elif email_ in _logins:
+            logins[email_] = _logins[email_]
+        else:
+            missing.append(email_)
+
+    if missing:
+        found = cache.read_github_logins(missing) or {}
+        for email_ in missing:
+            login = found.get(email_)
+            if login is None:
+                return None
+
+            login = unicode(login, encoding='utf-8')
+            _logins[email_] = login
+            logins[email_] = login
+
+    return logins
+
+
+def learn_logins(commits):
+    """
+    Save email address to github login mapping from commits returned by the
+    github API so git history can be mapped to github users later
+
+    :param commits: List of commits from the github commits API
+    :returns: None
+    """
+
+    if not is_enabled():
+        return
+
+    found = {}
+    for commit in commits:
+        for key in ('author', 'committer'):
+            try:
+                login = commit[key]['login']
+                email_ = commit['commit'][key]['email']
+            except (KeyError, TypeError):
+                continue
+
+            if login and email_:
+                found[email_.lower()] = login
+
+    new = dict((email_, login) for email_, login in found.iteritems()
+               if _logins.get(email_) != login)
+    if not new:
+        return
+
+    _logins.update(new)
+    cache.save_github_logins(new)
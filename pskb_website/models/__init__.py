@@ -3,6 +3,10 @@ Public model API
 """
 
 from .article import search_for_article
+from .article import find_article_location
+from .article import title_in_use
+from .article import index_article
+from .article import unindex_article
 from .article import get_available_articles
 from .article import read_article
 from .article import save_article
@@ -15,6 +19,7 @@ from .article import group_articles_by_status
 from .article import find_article_by_title
 from .article import change_article_stack
 from .article import author_stats
+from .article import load_heart_counts
 
 from .file import read_file
 from .file import read_redirects
@@ -3,6 +3,7 @@ Article related model API
 """
 
 import collections
+import functools
 import itertools
 import json
 import subprocess
@@ -14,6 +15,7 @@ from . import lib
 from . import file as file_mod
 from .user import find_user
 from .heart import count_hearts
+from .heart import count_hearts_many
 from .. import app
 from .. import PUBLISHED, IN_REVIEW, DRAFT, STATUSES
 from .. import cache
@@ -31,9 +33,15 @@ DEFAULT_STACK = u'other'
 
 path_details = collections.namedtuple('path_details', 'repo, filename')
 
+# Where a guide is on the master branch, see find_article_locations()
+article_location = collections.namedtuple('article_location',
+                                          'status, path, sha')
+
 # 2 hours
 ARTICLE_CACHE_TIMEOUT = 2 * 60 * 60
 
+AUTHOR_STATS_CACHE_KEY = 'author-stats'
+
 
 def get_available_articles(status=None, repo_path=None):
     """
@@ -92,6 +100,10 @@ def search_for_article(title, stacks=None, status=None):
     :returns: Article object if found or None if not found
     """
 
+    article = _search_article_index(title, stacks=stacks, status=status)
+    if article is not None:
+        return article
+
     statuses = [status] if status is not None else STATUSES
 
     if stacks is None:
@@ -118,6 +130,221 @@ def search_for_article(title, stacks=None, status=None):
     return None
 
 
+def _search_article_index(title, stacks=None, status=None):
+    """
+    Search for an article with the index of guides instead of the listings
+
+    See search_for_article() for arguments.  Note only the first stack of
+    guides, the one in their path, is indexed.
+
+    :returns: Article object if found or None if not found or not indexed
+    """
+
+    locations = find_article_locations(title)
+    if not locations:
+        return None
+
+    if stacks is not None:
+        stacks = set(utils.slugify_stack(stack) for stack in stacks)
+
+    for stack, location in locations.iteritems():
+        if stacks is not None and stack not in stacks:
+            continue
+
+        if status is not None and location.status != status:
+            continue
+
+        return read_article(location.path, rendered_text=False,
+                            allow_missing=True)
+
+    return None
+
+
+def find_article_locations(title):
+    """
+    Find where guides with a title are on the master branch without searching
+    for them
+
+    :param title: Title of guide, slug or not
+    :returns: Dictionary of stack slug to article_location tuple, empty if no
+              guide has the title, or None if the index isn't available and
+              callers must search instead
+
+    The index is built from the tree listing by rebuild_article_index() and
+    kept current by the push webhook and moves in between.
+    """
+
+    locations = cache.read_article_index(utils.slugify(title))
+    if locations is None:
+        return None
+
+    return dict((stack, article_location(*json.loads(location)))
+                for stack, location in locations.iteritems())
+
+
+def find_article_location(stack, title):
+    """
+    Find where a guide is on the master branch without searching for it
+
+    :param stack: Stack of guide, slug or not
+    :param title: Title of guide, slug or not
+    :returns: article_location tuple or None if not found or not indexed
+    """
+
+    return (find_article_locations(title) or {}).get(
+                                                utils.slugify_stack(stack))
+
+
+def title_in_use(title, stacks=None):
+    """
+    Determine if a guide already uses title, i.e. creating another one would
+    clash with its URL
+
+    :param title: Title of guide
+    :param stacks: Optional list of stacks to check, all stacks are checked if
+                   None is given
+    :returns: True or False
+    """
+
+    locations = find_article_locations(title)
+    if locations is None:
+        return search_for_article(title, stacks=stacks) is not None
+
+    if stacks is None:
+        return bool(locations)
+
+    return any(utils.slugify_stack(stack) in locations for stack in stacks)
+
+
+def rebuild_article_index():
+    """
+    Index where every guide on the master branch is from the tree listing
+
+    :returns: Number of guides indexed or None if the listing couldn't be read
+    """
+
+    repo_path = remote.default_repo_path()
+
+    entries = []
+    for file_details in remote.files_from_github(repo_path, ARTICLE_FILENAME):
+        path = file_details.path[len(repo_path) + 1:]
+        entry = _article_index_entry(os.path.dirname(path), file_details.sha)
+        if entry is not None:
+            entries.append(entry)
+
+    # Failing to read the listing looks just like an empty repo
+    if not entries:
+        app.logger.warning('Not replacing index of guides with empty listing')
+        return None
+
+    if not cache.save_article_index(entries, replace=True):
+        return None
+
+    return len(entries)
+
+
+def index_article(path, sha=None):
+    """
+    Add guide on the master branch to index of guides
+
+    :param path: Short path to guide, i.e. published/python/title
+    :param sha: Optional SHA of guide file, looked up if not given
+    :returns: None
+    """
+
+    if _article_index_entry(path) is None:
+        return
+
+    if sha is None:
+        sha = _indexed_article_sha(path)
+
+    cache.save_article_index([_article_index_entry(path, sha)])
+
+
+def unindex_article(path):
+    """
+    Remove guide on the master branch from index of guides
+
+    :param path: Short path to guide, i.e. published/python/title
+    :returns: None
+
+    Nothing is removed if the index says the guide is somewhere else by now,
+    i.e. it moved to another status.
+    """
+
+    entry = _article_index_entry(path)
+    if entry is None:
+        return
+
+    title, stack, _ = entry
+    location = find_article_location(stack, title)
+    if location is not None and location.path == path:
+        cache.delete_article_index(title, stack)
+
+
+def move_article_in_index(curr_path, new_path):
+    """
+    Update index of guides after guide moved on the master branch
+
+    :param curr_path: Short path guide was at
+    :param new_path: Short path guide is at now
+    :returns: None
+    """
+
+    # Moves reuse the file so it keeps its SHA
+    entry = _article_index_entry(curr_path)
+    location = None
+    if entry is not None:
+        location = find_article_location(entry[1], entry[0])
+
+    unindex_article(curr_path)
+    index_article(new_path, sha=location.sha if location else None)
+
+
+def _indexed_article_sha(path):
+    """
+    Look up SHA of guide file on the master branch for index of guides
+
+    :param path: Short path to guide, i.e. published/python/title
+    :returns: SHA or None if not found
+    """
+
+    path = path.strip('/')
+    sha = remote.file_sha_from_github(u'%s/%s/%s' % (
+            remote.default_repo_path(), path, ARTICLE_FILENAME))
+    if sha is not None:
+        return sha
+
+    # Keep what's already indexed rather than forget the SHA when github
+    # can't be read right now
+    title, stack, _ = _article_index_entry(path)
+    location = find_article_location(stack, title)
+    if location is not None and location.path == path:
+        return location.sha
+
+    return None
+
+
+def _article_index_entry(path, sha=None):
+    """
+    Get entry for index of guides from path of guide
+
+    :param path: Short path to guide, i.e. published/python/title
+    :param sha: Optional SHA of guide file
+    :returns: Tuple of (title slug, stack slug, serialized location) or None
+              if path is not a guide
+    """
+
+    tokens = path.strip('/').split('/')
+    if len(tokens) != 3 or tokens[0] not in STATUSES:
+        return None
+
+    status, stack, title = tokens
+    location = article_location(status, u'/'.join(tokens), sha)
+
+    return title, stack, json.dumps(location)
+
+
 def get_available_articles_from_api(status=None, repo_path=None):
     """
     Get iterator for current article objects
@@ -139,14 +366,18 @@ def get_available_articles_from_api(status=None, repo_path=None):
 
         articles = cache.read_file_listing(status)
         if articles is not None:
-            for article in articles_from_json(articles):
+            articles = list(articles_from_json(articles))
+
+        # Listings saved with another schema version come back empty
+        if articles:
+            for article in articles:
                 yield article
 
             raise StopIteration
 
     files_to_cache = []
 
-    for file_details in remote.files_from_github(repo_path, ARTICLE_FILENAME):
+    def _read_article(file_details):
         # We're only caching published articles right now so don't waste a
         # roundtrip to cache if that's not what caller wants.
         article = None
@@ -155,31 +386,67 @@ def get_available_articles_from_api(status=None, repo_path=None):
             article = _read_article_from_cache(file_details.path)
 
         if article is None:
-            article = read_article_from_metadata(file_details)
+            meta_data_path = meta_data_path_for_article_path(file_details.path)
+            article = read_article_from_metadata(
+                    file_details, meta_data_sha=meta_data_shas.get(meta_data_path))
             if article is None:
-                continue
+                return None
 
             article.filename = ARTICLE_FILENAME
             article.repo_path = repo_path
 
+        return article
+
+    # List articles and their metadata together so the metadata can be read
+    # by SHA, which is cached forever, instead of by path.
+    files = []
+    meta_data_shas = {}
+
+    for file_details in remote.files_from_github(
+            repo_path, (ARTICLE_FILENAME, ARTICLE_METADATA_FILENAME)):
+        if file_details.path.endswith(ARTICLE_METADATA_FILENAME):
+            meta_data_shas[file_details.path] = file_details.sha
+        else:
+            files.append(file_details)
+
+    # Reading the metadata is one request per article so read them all at
+    # once instead of waiting on each one in turn.
+    for article in utils.concurrent_map(_read_article, files):
+        if article is None:
+            continue
+
         if status is None or article.publish_status == status:
             yield article
 
         if status == PUBLISHED and article.publish_status == PUBLISHED:
-            files_to_cache.append(lib.to_json(article))
+            files_to_cache.append(article)
 
     if files_to_cache:
-        cache.save_file_listing('published', json.dumps(files_to_cache))
+        cache.save_file_listing('published', lib.to_cache_json(files_to_cache))
 
 
 def articles_from_json(json_str):
     """
     Generator to iterate through list of article objects in json format
 
-    :param json_str: JSON string
-    :returns: Generator through article objects
+    :param json_str: JSON string saved with lib.to_cache_json or a list of
+                     lib.to_json strings
+    :returns: Generator through article objects, none if saved with another
+              schema version
     """
 
+    try:
+        attrs = lib.from_cache_json(json_str)
+    except ValueError:
+        pass
+    else:
+        for article_attrs in attrs or []:
+            yield lib.object_from_attrs(Article, article_attrs)
+
+        raise StopIteration
+
+    # Listings saved before the compact format are lists of to_json strings.
+    # They're not upgraded since they only live a few minutes.
     for json_str in json.loads(json_str):
         try:
             yield Article.from_json(json_str)
@@ -228,6 +495,21 @@ def get_public_articles_for_author(author_name):
             yield article
 
 
+def load_heart_counts(articles):
+    """
+    Read number of hearts for several articles at once so rendering a listing
+    doesn't read them one at a time
+
+    :param articles: List of article objects
+    :returns: None
+    """
+
+    counts = count_hearts_many((a.stacks[0], a.title) for a in articles)
+
+    for article, count in zip(articles, counts):
+        article._heart_count = count
+
+
 def group_articles_by_status(articles):
     """
     Group articles by publish status
@@ -254,13 +536,15 @@ def group_articles_by_status(articles):
     return itertools.groupby(sorted_by_status, key=lambda a: a.publish_status)
 
 
-def author_stats(statuses=None):
+def author_stats(statuses=None, refresh=False):
     """
     Get number of articles for each author
 
     :param statuses: List of statuses to aggregate stats for
     :param statuses: Optional status to aggregate stats for, all possible
                      statuses are counted if None is given
+    :param refresh: True to count articles and cache stats again even if
+                    they are cached
     :returns: Dictionary mapping author names to number of articles::
 
         {author_name: [article_count, avatar_url]}
@@ -268,10 +552,23 @@ def author_stats(statuses=None):
     Note avatar_url can be None and is considered optional
     """
 
-    cache_key = 'author-stats'
-    stats = cache.get(cache_key)
-    if stats:
-        return json.loads(stats)
+    if statuses is None:
+        statuses = STATUSES
+
+    # Note the same stats are cached for all statuses
+    return lib.cached_computation(AUTHOR_STATS_CACHE_KEY,
+                                  functools.partial(_author_stats, statuses),
+                                  refresh=refresh)
+
+
+def _author_stats(statuses):
+    """
+    Count number of articles for each author
+
+    :param statuses: List of statuses to aggregate stats for
+    :returns: Dictionary mapping author names to number of articles, see
+              author_stats()
+    """
 
     stats = {}
     statuses = [get_available_articles(status=st) for st in statuses]
@@ -291,11 +588,6 @@ def author_stats(statuses=None):
 
         stats[article.author_name] = prev_stats
 
-    if not stats:
-        return stats
-
-    # Just fetch stats every 30 minutes, this is not a critical bit of data
-    cache.save(cache_key, json.dumps(stats), timeout=30 * 60)
     return stats
 
 
@@ -325,12 +617,92 @@ def read_article(path, rendered_text=False, branch=u'master', repo_path=None,
         slash = '' if path.endswith('/') else '/'
         full_path = '%s%s%s' % (full_path, slash, ARTICLE_FILENAME)
 
-    article = _read_article_from_cache(path, branch)
+    # Stale guides are still served while they're refreshed in the background
+    article, fresh = _read_article_entry_from_cache(path, branch)
     if article is not None:
+        if not fresh:
+            lib.refresh_in_background((path, branch), _read_article_from_github,
+                                      full_path, rendered_text, branch,
+                                      allow_missing=True,
+                                      cache_timeout=cache_timeout)
+
+        # Only published guides are cached so they're the only ones worth
+        # refreshing ahead of time, see tasks.warm_cache
+        cache.record_article_access(path, branch)
         return article
 
+    # Callers allowing missing guides are usually looking for one under every
+    # status, i.e. lib.read_article, so remember where it wasn't found.
+    if allow_missing and cache.is_missing_file(path, branch):
+        return None
+
+    if remote.is_degraded(repo_path):
+        if not allow_missing:
+            app.logger.warning('Not reading path: "%s" branch: %s, github is unavailable',
+                               full_path, branch)
+        return None
+
+    return _read_article_from_github(
+            full_path, rendered_text, branch, allow_missing=allow_missing,
+            cache_timeout=cache_timeout,
+            missing_path=path if allow_missing else None)
+
+
+def refresh_article(path, branch=u'master'):
+    """
+    Read published article from github and cache it again
+
+    :param path: Short path to article, not including repo or owner
+    :param branch: Name of branch to read file from
+    :returns: Article object or None if not found
+    """
+
+    full_path = '%s/%s' % (remote.default_repo_path(), path)
+    if not path.endswith(FILE_EXTENSION):
+        full_path = '%s/%s' % (full_path.rstrip('/'), ARTICLE_FILENAME)
+
+    return _read_article_from_github(full_path, False, branch,
+                                     allow_missing=True)
+
+
+def article_expires_in(path, branch=u'master'):
+    """
+    Get seconds until cached article goes stale
+
+    :param path: Short path to article, not including repo or owner
+    :param branch: Name of branch article is on
+    :returns: Seconds or None if article is not cached or already stale
+    """
+
+    return cache.file_expires_in(_article_cache_path(path), branch)
+
+
+def _read_article_from_github(full_path, rendered_text, branch,
+                              allow_missing=False,
+                              cache_timeout=ARTICLE_CACHE_TIMEOUT,
+                              missing_path=None):
+    """
+    Read article from github and cache it if it's published
+
+    :param full_path: Path to article file including repo and owner
+    :param rendered_text: Boolean to read rendered or raw text
+    :param branch: Name of branch to read file from
+    :param allow_missing: False to log warning for missing or True to allow it
+    :param cache_timeout: Number of seconds to keep guide in cache if cached
+    :param missing_path: Optional short path to remember as missing in the
+                         cache if github says the article doesn't exist
+
+    :returns: Article object or None if not found
+    """
+
     details = remote.read_file_from_github(full_path, branch, rendered_text,
-                                           allow_404=allow_missing)
+                                           allow_404=allow_missing,
+                                           report_404=missing_path is not None)
+
+    # Only a 404 means the article isn't there, other errors are temporary
+    if details is remote.FILE_NOT_FOUND:
+        cache.save_missing_file(missing_path, branch)
+        return None
 
     # Allow empty sha when requesting rendered_text b/c of the way the
     # underlying remote API works. See read_file_from_github for more
@@ -364,8 +736,8 @@ def read_article(path, rendered_text=False, branch=u'master', repo_path=None,
         # published.
         if article.published:
             article._read_contributors_from_api(remove_ignored_users=True)
-            cache.save_file(article.path, article.branch, lib.to_json(article),
-                            timeout=cache_timeout)
+            cache.save_file(article.path, article.branch,
+                            lib.to_cache_json(article), timeout=cache_timeout)
     else:
         # We cannot properly show an article without metadata.
         article = None
@@ -380,18 +752,26 @@ def read_article(path, rendered_text=False, branch=u'master', repo_path=None,
     return article
 
 
-def read_article_from_metadata(file_details):
+def read_article_from_metadata(file_details, meta_data_sha=None):
     """
     Read article object from json metadata
 
     :param file_details: remote.file_details object
+    :param meta_data_sha: Optional blob SHA of meta data file to read meta
+                          data by SHA instead of by path
     :returns: Article object with metadata filled out or None
 
     Note the article contents are NOT filled out here!
     """
 
     path_info = parse_full_path(file_details.path)
-    json_str = read_meta_data_for_article_path(file_details.path)
+
+    json_str = None
+    if meta_data_sha is not None:
+        json_str = remote.read_blob_from_github(path_info.repo, meta_data_sha)
+
+    if json_str is None:
+        json_str = read_meta_data_for_article_path(file_details.path)
     if json_str is None:
         # Cannot do anything here b/c we do not know the title.
         app.logger.error('Failed reading meta data for "%s", file_details: %s',
@@ -445,6 +825,17 @@ def save_article(title, message, new_content, author_name, email, sha,
     article.first_commit = first_commit
     article.content = new_content
 
+    # Updates to original articles save the text and metadata together
+    if sha and branch == u'master':
+        commit_sha = _commit_article_and_meta_data(article, message,
+                                                   new_content, author_name,
+                                                   email, sha)
+        if commit_sha is None:
+            return commit_sha
+
+        _delete_article_from_cache(article)
+        return article
+
     commit_sha = remote.commit_file_to_github(article.full_path, message,
                                               new_content, author_name, email,
                                               sha, branch)
@@ -466,9 +857,59 @@ def save_article(title, message, new_content, author_name, email, sha,
         return commit_sha
 
     _delete_article_from_cache(article)
+
+    # New guides are findable right away instead of after the push webhook
+    if (not sha and branch == u'master' and
+            article.repo_path == remote.default_repo_path()):
+        index_article(article.path)
+
     return article
 
 
+def _commit_article_and_meta_data(article, message, new_content, author_name,
+                                  email, sha):
+    """
+    Save article text and metadata on master branch with a single commit
+
+    :param article: Article object to save
+    :param message: Commit message to save article with
+    :param new_content: Content of article
+    :param author_name: Name of author who wrote article
+    :param email: Email address of author
+    :param sha: SHA of the version of the article being replaced
+    :returns: SHA of commit or None for failure
+
+    New articles cannot be saved this way because the metadata includes the
+    SHA of the commit that created the article.
+    """
+
+    meta_data_path = meta_data_path_for_article_path(article.full_path)
+
+    def _build_changes(read):
+        current = read(article.full_path)
+        if current is None or current.sha != sha:
+            app.logger.warning('Article "%s" changed since it was read, sha: %s, current: %s',
+                               article.full_path, sha,
+                               current.sha if current else None)
+            return None
+
+        meta_data = read(meta_data_path)
+        json_content = _meta_data_json(article, meta_data)
+
+        changes = {}
+        if current.text != new_content:
+            changes[article.full_path] = new_content
+
+        if meta_data is None or meta_data.text != json_content:
+            changes[meta_data_path] = json_content
+
+        return changes
+
+    return remote.commit_files_to_github(article.repo_path, message,
+                                         author_name, email, _build_changes,
+                                         branch=u'master')
+
+
 def branch_article(article, message, new_content, author_name, email,
                    image_url, author_real_name=None):
     """
@@ -625,23 +1066,8 @@ def save_article_meta_data(article, author_name=None, email=None, branch=None,
         sha = details.sha
         text = details.text
 
-        orig_article = Article.from_json(details.text)
-
-        if update_branches:
-            # Merge the original article metadata with the new version.
-            # Currently the only thing that can change here is the list of
-            # branches. We only modify the list of branches when saving a
-            # branched article so we merge the two lists of branches here since
-            # removal of a branch should happen elsewhere.
-            for orig_branch in orig_article.branches:
-                if orig_branch not in article.branches:
-                    article.branches.append(orig_branch)
-
-    # Don't need to serialize everything, just the important stuff that's not
-    # stored in the path and article.
-    exclude_attrs = ('content', 'external_url', 'sha', 'repo_path', '_path',
-                     'last_updated', '_contributors', '_heart_count')
-    json_content = lib.to_json(article, exclude_attrs=exclude_attrs)
+    json_content = _meta_data_json(article, details,
+                                   update_branches=update_branches)
 
     # Nothing changed so no commit needed
     if text is not None and json_content == text:
@@ -658,6 +1084,38 @@ def save_article_meta_data(article, author_name=None, email=None, branch=None,
                                         author_name, email, sha, branch=branch)
 
 
+def _meta_data_json(article, details, update_branches=True):
+    """
+    Serialize article metadata for saving
+
+    :param article: Article object
+    :param details: file_details of existing meta data file or None if there
+                    is no meta data file yet
+    :param update_branches: Merge the branches of the existing metadata into
+                            article (True) or save article branches as-is
+                            (False)
+    :returns: JSON text
+    """
+
+    if details is not None and update_branches:
+        orig_article = Article.from_json(details.text)
+
+        # Merge the original article metadata with the new version.
+        # Currently the only thing that can change here is the list of
+        # branches. We only modify the list of branches when saving a
+        # branched article so we merge the two lists of branches here since
+        # removal of a branch should happen elsewhere.
+        for orig_branch in orig_article.branches:
+            if orig_branch not in article.branches:
+                article.branches.append(orig_branch)
+
+    # Don't need to serialize everything, just the important stuff that's not
+    # stored in the path and article.
+    exclude_attrs = ('content', 'external_url', 'sha', 'repo_path', '_path',
+                     'last_updated', '_contributors', '_heart_count')
+    return lib.to_json(article, exclude_attrs=exclude_attrs)
+
+
 def read_meta_data_for_article_path(full_path):
     """
     Read meta data for given article path from master branch
@@ -670,6 +1128,12 @@ def read_meta_data_for_article_path(full_path):
     """
 
     filename = meta_data_path_for_article_path(full_path)
+
+    # Meta data that hasn't changed is read from the cache by SHA
+    text = remote.read_file_text_from_github(filename, rendered_text=False)
+    if text is not None:
+        return text
+
     details = remote.read_file_from_github(filename, rendered_text=False)
     if details is None:
         return None
@@ -774,18 +1238,29 @@ def delete_article(article, message, name, email):
     # We don't save meta data for branches so either remove meta data file or
     # update original articles meta data to remove the branch link.
     if article.branch == u'master':
-        # Remove the meta data file next since that's the most important for
-        # us finding an article from the API.
         meta_data_file = meta_data_path_for_article_path(article.full_path)
 
-        if not remote.remove_file_from_github(meta_data_file, message, name,
-                                              email, article.branch):
-            return False
-    else:
-        if not save_branched_article_meta_data(article, name, email,
-                                               add_branch=False):
+        def _build_changes(read):
+            return dict((path, None) for path in (meta_data_file,
+                                                  article.full_path)
+                        if read(path) is not None)
+
+        commit_sha = remote.commit_files_to_github(article.repo_path, message,
+                                                   name, email,
+                                                   _build_changes,
+                                                   branch=article.branch)
+        if commit_sha is None:
             return False
 
+        if article.repo_path == remote.default_repo_path():
+            unindex_article(article.path)
+
+        return True
+
+    if not save_branched_article_meta_data(article, name, email,
+                                           add_branch=False):
+        return False
+
     if not remote.remove_file_from_github(article.full_path, message,
                                           name, email, article.branch):
         return False
@@ -846,15 +1321,26 @@ def change_article_stack(orig_path, orig_stack, new_stack, title, author_name,
     # Ugly circular imports
     from .. import tasks
 
+    # Branches of the guide still point at the old path so drop everything
+    # cached for them once it's moved
+    article = read_article(orig_path, rendered_text=False, allow_missing=True)
+
     new_path = orig_path.replace(utils.slugify_stack(orig_stack),
                                  utils.slugify_stack(new_stack))
     try:
-        tasks.move_article(orig_path, new_path, title, author_name, email)
+        if not tasks.move_article(orig_path, new_path, title, author_name,
+                                  email):
+            return None
     except subprocess.CalledProcessError as err:
         app.logger.error(err)
         return None
 
-    cache.delete_file(orig_path, u'master')
+    # Lookups of the new path before the move remembered it as missing
+    cache.delete_files([(orig_path, u'master'), (new_path, u'master')])
+
+    if article is not None and article.branches:
+        cache.bump_generation(*[cache.branch_namespace(branch_name)
+                                for author, branch_name in article.branches])
 
     return new_path
 
@@ -904,10 +1390,10 @@ def _delete_article_from_cache(article):
 
     # The point of this function is so outside article.py there is no knowledge
     # of what the cache key is or how we cache it.
-    cache.delete_file(article.path, article.branch)
+    branches = [article.branch]
+    branches.extend(branch_name for author, branch_name in article.branches)
 
-    for author, branch_name in article.branches:
-        cache.delete_file(article.path, branch_name)
+    cache.delete_files((article.path, branch) for branch in set(branches))
 
 
 def _read_article_from_cache(path, branch=u'master'):
@@ -916,7 +1402,57 @@ def _read_article_from_cache(path, branch=u'master'):
 
     :param path: Path to read file from github i.e. path it was cached with
     :param branch: Branch to read file from
-    :returns: Article object if found in cache or None
+    :returns: Article object if found in cache and not stale or None
+    """
+
+    article, fresh = _read_article_entry_from_cache(path, branch)
+    if not fresh:
+        return None
+
+    return article
+
+
+def _read_article_entry_from_cache(path, branch=u'master'):
+    """
+    Read article object from cache even if it's stale
+
+    :param path: Path to read file from github i.e. path it was cached with
+    :param branch: Branch to read file from
+    :returns: Tuple of (Article object or None if not found, False if stale)
+    """
+
+    cache_path = _article_cache_path(path)
+    entry = cache.read_file_entry(cache_path, branch)
+    if entry is None or entry[0] is None:
+        return None, False
+
+    json_str, fresh = entry
+
+    try:
+        attrs = lib.from_cache_json(json_str)
+    except ValueError:
+        # Saved before the compact format so save it again, keeping its
+        # timeout, to read it with the fast path from now on.
+        article = Article.from_json(json_str)
+        timeout = cache.file_expires_in(cache_path, branch) if fresh else None
+        if timeout:
+            cache.save_file(cache_path, branch, lib.to_cache_json(article),
+                            timeout=timeout)
+
+        return article, fresh
+
+    if attrs is None:
+        return None, False
+
+    return lib.object_from_attrs(Article, attrs), fresh
+
+
+def _article_cache_path(path):
+    """
+    Get path article is cached with
+
+    :param path: Path to read file from github
+    :returns: Path
     """
 
     if path.endswith(FILE_EXTENSION):
@@ -924,11 +1460,7 @@ def _read_article_from_cache(path, branch=u'master'):
         # right now it's always the same.
         path = path.split('/')[-2]
 
-    json_str = cache.read_file(path, branch)
-    if json_str is None:
-        return None
-
-    return Article.from_json(json_str)
+    return path
 
 
 class Article(object):
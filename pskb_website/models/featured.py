@@ -46,7 +46,8 @@ def set_featured_article(article):
     value = (article.title, article.stacks[0])
 
     # None for timeout b/c this should never expire
-    cache.save(CACHE_KEY, json.dumps(value), timeout=None)
+    cache.save(CACHE_KEY, json.dumps(value), timeout=None,
+               family=cache.FEATURED_FAMILY)
 
 
 def get_featured_article(articles=None):
@@ -63,7 +64,7 @@ def get_featured_article(articles=None):
     featured = None
 
     if allow_set_featured_article():
-        featured = cache.get(CACHE_KEY)
+        featured = cache.get(CACHE_KEY, family=cache.FEATURED_FAMILY)
 
     if featured is None:
         featured = os.environ.get(ENV_KEY)
@@ -15,6 +15,7 @@ from .. import remote
 from .. import filters
 from .. import cache
 from ..forms import STACK_OPTIONS
+from . import lib
 
 
 FAQ_FILENAME = u'faq.md'
@@ -60,19 +61,62 @@ def read_file(path, rendered_text=True, branch=u'master', use_cache=True,
     :returns: Text of file or None if file could not be read
     """
 
-    if use_cache:
-        text = cache.read_file(path, branch)
-        if text is not None:
-            return json.loads(text)
+    if not use_cache:
+        details = read_file_details(path, rendered_text=rendered_text,
+                                    branch=branch)
+        return details.text if details is not None else None
+
+    # Stale files are still served while they're refreshed in the background
+    text, fresh = cache.read_file_entry(path, branch) or (None, False)
+    if text is not None:
+        if not fresh:
+            lib.refresh_in_background((path, branch), refresh_file, path,
+                                      rendered_text, branch, timeout)
+        return json.loads(text)
+
+    if remote.is_degraded(remote.default_repo_path()):
+        return None
+
+    return refresh_file(path, rendered_text, branch, timeout)
+
+
+def refresh_file(path, rendered_text=True, branch=u'master',
+                 timeout=cache.DEFAULT_CACHE_TIMEOUT):
+    """
+    Read file contents from github and save them in the cache
+
+    See read_file for argument descriptions.
+
+    :returns: Text of file or None if file could not be read
+    """
+
+    text = _read_file_from_github(path, rendered_text, branch)
+    if text is not None:
+        cache.save_file(path, branch, json.dumps(text), timeout=timeout)
+
+    return text
+
+
+def _read_file_from_github(path, rendered_text, branch):
+    """
+    Read file contents from github
+
+    See read_file for argument descriptions.
+
+    :returns: Text of file or None if file could not be read
+    """
+
+    # Files that haven't changed are read from the cache by SHA
+    full_path = '%s/%s' % (remote.default_repo_path(), path)
+    text = remote.read_file_text_from_github(full_path, branch, rendered_text)
+    if text is not None:
+        return text
 
     details = read_file_details(path, rendered_text=rendered_text,
                                 branch=branch)
     if details is None:
         return None
 
-    if use_cache:
-        cache.save_file(path, branch, json.dumps(details.text), timeout=timeout)
-
     return details.text
 
 
@@ -231,59 +275,49 @@ def update_article_listing(article_url, title, author_url, author_name,
     """
 
     if status == PUBLISHED:
-        path_to_listing = published_article_path()
-        filename = PUB_FILENAME
         message = u'Adding "%s" to published' % (title)
     elif status == IN_REVIEW:
-        path_to_listing = in_review_article_path()
-        filename = IN_REVIEW_FILENAME
         message = u'Adding "%s" to in-review' % (title)
     else:
-        path_to_listing = draft_article_path()
-        filename = DRAFT_FILENAME
         message = u'Adding "%s" to draft' % (title)
 
-    sha = None
-    start_text = ''
+    # Add article to the listing for its status and remove it from the others
+    # all in one commit so the article is only on 1 file at a time
+    def _build_changes(read):
+        changes = {}
 
-    details = read_file_details(filename, rendered_text=False, branch=branch)
-    if details is not None:
-        sha = details.sha
-        start_text = details.text
-
-    text = get_updated_file_listing_text(start_text,
-                                         article_url,
-                                         title,
-                                         author_url,
-                                         author_name,
-                                         author_img_url,
-                                         thumbnail_url,
-                                         stacks=stacks)
-
-    if start_text != text:
-        commit_sha = remote.commit_file_to_github(path_to_listing, message,
-                                                  text, committer_name,
-                                                  committer_email, sha=sha,
-                                                  branch=branch)
-        if commit_sha is None:
-            return False
+        for possible_status in (PUBLISHED, IN_REVIEW, DRAFT):
+            path_to_listing = _listing_path(possible_status)
 
-    cache.delete_file(filename, branch)
+            details = read(path_to_listing)
+            start_text = details.text if details is not None else u''
 
-    # Now update the opposite files so the article is only on 1 file at a time
-    results = []
-    for possible_status in (PUBLISHED, IN_REVIEW, DRAFT):
-        if possible_status == status:
-            continue
+            if possible_status == status:
+                text = get_updated_file_listing_text(start_text,
+                                                     article_url,
+                                                     title,
+                                                     author_url,
+                                                     author_name,
+                                                     author_img_url,
+                                                     thumbnail_url,
+                                                     stacks=stacks)
+            else:
+                text = get_removed_file_listing_text(start_text, title)
+
+            if text != start_text:
+                changes[path_to_listing] = text
+
+        return changes
 
-        # Don't care about status here we need to try all the possible files
-        # and lower levels will log anything useful
-        res = remove_article_from_listing(title, possible_status,
-                                          committer_name, committer_email,
-                                          branch=branch)
-        results.append(res)
+    commit_sha = remote.commit_files_to_github(remote.default_repo_path(),
+                                               message, committer_name,
+                                               committer_email,
+                                               _build_changes, branch=branch)
 
-    return all(results)
+    for filename in (PUB_FILENAME, IN_REVIEW_FILENAME, DRAFT_FILENAME):
+        cache.delete_file(filename, branch)
+
+    return commit_sha is not None
 
 
 def remove_article_from_listing(title, status, committer_name,
@@ -300,41 +334,55 @@ def remove_article_from_listing(title, status, committer_name,
     """
 
     if status == PUBLISHED:
-        path_to_listing = published_article_path()
         filename = PUB_FILENAME
         message = u'Removing "%s" from published' % (title)
     elif status == IN_REVIEW:
-        path_to_listing = in_review_article_path()
         filename = IN_REVIEW_FILENAME
         message = u'Removing "%s" from in-review' % (title)
     else:
-        path_to_listing = draft_article_path()
         filename = DRAFT_FILENAME
         message = u'Removing "%s" from draft' % (title)
 
-    sha = None
-    start_text = ''
+    path_to_listing = _listing_path(status)
 
-    details = read_file_details(filename, rendered_text=False, branch=branch)
-    if details is not None:
-        sha = details.sha
-        start_text = details.text
+    def _build_changes(read):
+        details = read(path_to_listing)
+        start_text = details.text if details is not None else u''
 
-    text = get_removed_file_listing_text(start_text, title)
+        text = get_removed_file_listing_text(start_text, title)
+        if text == start_text:
+            return {}
 
-    if start_text != text:
-        commit_sha = remote.commit_file_to_github(path_to_listing, message,
-                                                  text, committer_name,
-                                                  committer_email, sha=sha,
-                                                  branch=branch)
-        if commit_sha is None:
-            return False
+        return {path_to_listing: text}
+
+    commit_sha = remote.commit_files_to_github(remote.default_repo_path(),
+                                               message, committer_name,
+                                               committer_email,
+                                               _build_changes, branch=branch)
+    if commit_sha is None:
+        return False
 
     cache.delete_file(filename, branch)
 
     return True
 
 
+def _listing_path(status):
+    """
+    Get full path to file listing for status
+
+    :param status: PUBLISHED, IN_REVIEW, or DRAFT
+    :returns: Path to listing file (<owner>/<repo>/<filename>)
+    """
+
+    if status == PUBLISHED:
+        return published_article_path()
+    elif status == IN_REVIEW:
+        return in_review_article_path()
+
+    return draft_article_path()
+
+
 def sync_file_listing(all_articles, status, committer_name, committer_email,
                       branch=u'master'):
     """
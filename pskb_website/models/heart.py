@@ -2,9 +2,15 @@
 Module to manage CRUD operations on 'heart'ing guides
 """
 
+import time
+
 from .. import app
+from .. import cache_stats
 from .. import utils
 
+# Family hearts are counted against in cache stats
+STATS_FAMILY = 'hearts'
+
 redis_obj = None
 
 url = app.config.get('REDIS_HEARTS_DB_URL')
@@ -52,7 +58,7 @@ def add_heart(stack, title, username):
     if redis_obj is None:
         return 0
 
-    redis_obj.sadd(_generate_key(stack, title), username)
+    _timed(redis_obj.sadd, _generate_key(stack, title), username, writes=1)
     return count_hearts(stack, title)
 
 
@@ -72,7 +78,7 @@ def remove_heart(stack, title, username):
     if redis_obj is None:
         return 0
 
-    redis_obj.srem(_generate_key(stack, title), username)
+    _timed(redis_obj.srem, _generate_key(stack, title), username, writes=1)
     return count_hearts(stack, title)
 
 
@@ -88,7 +94,27 @@ def count_hearts(stack, title):
     if redis_obj is None:
         return 0
 
-    return redis_obj.scard(_generate_key(stack, title))
+    return _timed(redis_obj.scard, _generate_key(stack, title), hits=1)
+
+
+def count_hearts_many(articles):
+    """
+    Get number of hearts for several stack/title pairs in a single round trip
+
+    :param articles: Iterable of (stack, title) tuples
+    :returns: List of number of hearts in same order as articles
+    """
+
+    articles = list(articles)
+
+    if redis_obj is None:
+        return [0] * len(articles)
+
+    pipe = redis_obj.pipeline(transaction=False)
+    for stack, title in articles:
+        pipe.scard(_generate_key(stack, title))
+
+    return _timed(pipe.execute, hits=len(articles))
 
 
 def has_hearted(stack, title, username):
@@ -103,4 +129,28 @@ def has_hearted(stack, title, username):
     if redis_obj is None:
         return False
 
-    return redis_obj.sismember(_generate_key(stack, title), username)
+    return _timed(redis_obj.sismember, _generate_key(stack, title), username,
+                  hits=1)
+
+
+def _timed(func, *args, **kwargs):
+    """
+    Call redis function and count it in cache stats
+
+    :param func: Function to call
+    :param args: Arguments to call function with
+    :param kwargs: Counters to record for call, see cache_stats.record()
+    :returns: Result of function
+    """
+
+    start = time.time()
+
+    try:
+        result = func(*args)
+    except Exception:
+        cache_stats.record(STATS_FAMILY, errors=1,
+                           seconds=time.time() - start)
+        raise
+
+    cache_stats.record(STATS_FAMILY, seconds=time.time() - start, **kwargs)
+    return result
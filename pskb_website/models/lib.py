@@ -4,11 +4,40 @@ Collection of shared functionality for models subpackage
 
 import collections
 import copy
+import hashlib
 import json
+import math
+import random
+import re
+import time
+import uuid
 
 from .. import app
 from .. import remote
 from .. import cache
+from .. import singleflight
+from .. import utils
+
+# 30 minutes
+STATS_CACHE_TIMEOUT = 30 * 60
+
+COMMIT_STATS_CACHE_KEY = 'commit-stats'
+
+# Most seconds a background refresh of a single key can take before another
+# one is allowed to start
+REFRESH_LEASE_TIMEOUT = 5 * 60
+
+# How eagerly computations are started before their value expires, values
+# above 1 start earlier, see cached_computation()
+RECOMPUTE_BETA = 1.0
+
+# Version of the attributes saved by to_cache_json.  Objects are read back
+# without calling their __init__ so bump this whenever a cached class gains,
+# loses or renames an attribute.  Entries saved with another version are
+# treated as missing.
+CACHE_SCHEMA_VERSION = 1
+
+_CACHE_JSON_RE = re.compile(r'\[(\d+),')
 
 
 def to_json(object_, exclude_attrs=None):
@@ -33,10 +62,190 @@ def to_json(object_, exclude_attrs=None):
     return json.dumps(dict_, sort_keys=True, indent=4, separators=(',', ': '))
 
 
-def contribution_stats():
+def to_cache_json(object_):
+    """
+    Return compact json representation of object to save in cache
+
+    :param object_: Object or list of objects
+    :returns: json representation of object(s) as a string
+
+    Nobody reads the cache so unlike to_json this doesn't copy, sort or
+    pretty-print attributes.  They're saved along with CACHE_SCHEMA_VERSION so
+    from_cache_json can trust them as-is.
+    """
+
+    if isinstance(object_, list):
+        attrs = [obj.__dict__ for obj in object_]
+    else:
+        attrs = object_.__dict__
+
+    return json.dumps([CACHE_SCHEMA_VERSION, attrs], separators=(',', ':'))
+
+
+def from_cache_json(str_):
+    """
+    Read attributes saved with to_cache_json
+
+    :param str_: json string
+    :returns: Dictionary of attributes, list of dictionaries if a list of
+              objects was saved, or None if saved with another
+              CACHE_SCHEMA_VERSION
+    :raises ValueError: If str_ was not saved with to_cache_json, i.e. it was
+                        saved with to_json before the compact format existed
+    """
+
+    match = _CACHE_JSON_RE.match(str_)
+    if match is None:
+        raise ValueError('Not saved with to_cache_json')
+
+    if int(match.group(1)) != CACHE_SCHEMA_VERSION:
+        return None
+
+    return json.loads(str_)[1]
+
+
+def object_from_attrs(class_, attrs):
+    """
+    Create object from attributes read with from_cache_json
+
+    :param class_: Class of object
+    :param attrs: Dictionary of attributes
+    :returns: Object of class_
+
+    The attributes are used as-is without calling __init__ or any of the
+    backwards-compatibility checks of the from_json methods.
+    """
+
+    object_ = class_.__new__(class_)
+    object_.__dict__.update(attrs)
+
+    return object_
+
+
+def refresh_in_background(name, func, *args, **kwargs):
+    """
+    Call function to refresh stale cache entry in the background unless
+    another process is already refreshing it or github is unavailable
+
+    :param name: Name of cache entry being refreshed
+    :param func: Function to call
+    :param args: Arguments to call function with
+    :param kwargs: Keyword arguments to call function with
+    :returns: None
+
+    The function is called in a new request context with background priority
+    so it never uses the rate limit left for page views.
+    """
+
+    if remote.is_degraded():
+        return
+
+    key = 'refresh:%s' % (hashlib.sha1(repr(name)).hexdigest())
+    token = uuid.uuid4().hex
+
+    if cache.acquire_lease(key, token, REFRESH_LEASE_TIMEOUT) is False:
+        return
+
+    def _refresh():
+        try:
+            with app.test_request_context(), remote.background_priority():
+                func(*args, **kwargs)
+        except remote.RateLimitExceeded:
+            app.logger.info(u'Not refreshing %s to save github rate limit',
+                            name)
+        finally:
+            cache.release_lease(key, token)
+
+    utils.spawn(_refresh)
+
+
+def cached_computation(key, compute, timeout=STATS_CACHE_TIMEOUT,
+                       refresh=False):
+    """
+    Read value of expensive computation from cache or compute and cache it
+    without every process computing it at once
+
+    :param key: Key identifying computation
+    :param compute: Function taking no arguments returning JSON serializable
+                    value, empty values are not cached
+    :param timeout: Seconds to cache value
+    :param refresh: True to compute value even if it's cached
+    :returns: Value
+
+    Each read recomputes the value a little early with a probability that
+    grows as it nears its expiry and with how long it took to compute, i.e.
+    XFetch.  Only one process at a time recomputes it and everyone else keeps
+    getting the previous value in the meantime.  When there's no previous
+    value everyone waits on the process computing it.
+    """
+
+    entry = cache.read_computed(key)
+    if entry is None:
+        return singleflight.run('computed:%s' % (key), _compute_once, key,
+                                compute, timeout, lease=True)
+
+    value, delta, expires = entry
+
+    # 1 - random() is never 0 so it's safe to take the log of
+    early = delta * RECOMPUTE_BETA * -math.log(1.0 - random.random())
+    if not refresh and time.time() + early < expires:
+        return value
+
+    lock_key = 'recompute:%s' % (key)
+    token = uuid.uuid4().hex
+
+    if cache.acquire_lease(lock_key, token, REFRESH_LEASE_TIMEOUT) is False:
+        return value
+
+    try:
+        return _compute(key, compute, timeout) or value
+    finally:
+        cache.release_lease(lock_key, token)
+
+
+def _compute_once(key, compute, timeout):
+    """
+    Compute and cache value unless another process just did
+
+    :param key: Key identifying computation
+    :param compute: Function returning value
+    :param timeout: Seconds to cache value
+    :returns: Value
+    """
+
+    entry = cache.read_computed(key)
+    if entry is not None:
+        return entry[0]
+
+    return _compute(key, compute, timeout)
+
+
+def _compute(key, compute, timeout):
+    """
+    Compute and cache value
+
+    :param key: Key identifying computation
+    :param compute: Function returning value
+    :param timeout: Seconds to cache value
+    :returns: Value
+    """
+
+    start = time.time()
+    value = compute()
+
+    if value:
+        cache.save_computed(key, value, time.time() - start, timeout)
+
+    return value
+
+
+def contribution_stats(refresh=False):
     """
     Get total and weekly contribution stats for default repository
 
+    :param refresh: True to read stats from github and cache them again even
+                    if they are cached
+
     :returns: Ordered dictionary keyed by author login name and ordered by most
               commits this week
               Each value in dictionary is a dictionary of stats for that
@@ -47,15 +256,27 @@ def contribution_stats():
         ordered_stats = collections.OrderedDict()
         for user_dict in sorted(stats, key=lambda v: v['weekly_commits'],
                                 reverse=True):
+            # Copy since cached values can be shared between callers
+            user_dict = dict(user_dict)
             login = user_dict.pop('login')
             ordered_stats[login] = user_dict
 
         return ordered_stats
 
-    cache_key = 'commit-stats'
-    stats = cache.get(cache_key)
-    if stats:
-        return _sort_contributions(json.loads(stats))
+    stats = cached_computation(COMMIT_STATS_CACHE_KEY, _contribution_stats,
+                               refresh=refresh)
+
+    # Note we do NOT cache the ordered results b/c we use an ordered dict for
+    # that and we cannot serialize an ordered dict and maintain insert order.
+    return _sort_contributions(stats or [])
+
+
+def _contribution_stats():
+    """
+    Read contribution stats for default repository from github
+
+    :returns: List of dictionaries of stats for each contributor
+    """
 
     # Reformat data and toss out the extra, we're only worried about totals an
     # the current week.
@@ -80,16 +301,7 @@ def contribution_stats():
                       'weekly_additions': this_week['a'],
                       'weekly_deletions': this_week['d']})
 
-    if not stats:
-        return {}
-
-    # Note we do NOT cache the ordered results b/c we use an ordered dict for
-    # that and we cannot serialize an ordered dict and maintain insert order.
-
-    # Just fetch stats every 30 minutes, this is not a critical bit of data
-    cache.save(cache_key, json.dumps(stats), timeout=30 * 60)
-
-    return _sort_contributions(stats)
+    return stats
 
 
 def contributors_to_ignore():
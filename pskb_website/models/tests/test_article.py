@@ -0,0 +1,50 @@
+"""
+Tests for models.article module
+"""
+
+import threading
+
+from ... import remote
+from ... import utils
+from .. import article as article_mod
+
+
+def test_listing_reads_metadata_without_gevent(monkeypatch):
+    # Tests don't run under gevent so this goes through the thread pool
+    # fallback, the same as the celery worker and manage.py commands
+    assert utils._gevent_pool(2) is None
+
+    paths = [u'published/python/guide-%d/article.md' % (ii) for ii in xrange(6)]
+    listing = []
+    for path in paths:
+        meta_data_path = article_mod.meta_data_path_for_article_path(path)
+        listing.append(remote.file_details(path, None, 'sha-' + path, None,
+                                           None, None))
+        listing.append(remote.file_details(meta_data_path, None,
+                                           'sha-' + meta_data_path, None,
+                                           None, None))
+
+    threads = set()
+    meta_data_shas = []
+
+    def _read_article_from_metadata(file_details, meta_data_sha=None):
+        threads.add(threading.current_thread().ident)
+        meta_data_shas.append(meta_data_sha)
+
+        title = file_details.path.split('/')[2]
+        return article_mod.Article(title, u'author', stacks=[u'python'])
+
+    monkeypatch.setattr(remote, 'files_from_github',
+                        lambda repo, filename, limit=None: iter(listing))
+    monkeypatch.setattr(article_mod, 'read_article_from_metadata',
+                        _read_article_from_metadata)
+
+    articles = list(article_mod.get_available_articles_from_api(
+            repo_path='owner/repo'))
+
+    assert [article.title for article in articles] == [
+            u'guide-%d' % (ii) for ii in xrange(6)]
+    assert sorted(meta_data_shas) == sorted(
+            'sha-' + article_mod.meta_data_path_for_article_path(path)
+            for path in paths)
+    assert threading.current_thread().ident not in threads
@@ -330,3 +330,25 @@ def test_get_removed_file_listing_text():
 - [Thumbnail](https://raw.githubusercontent.com/durden/articles/master/images/dc622a2f-673c-4466-ade3-3b1122dc7d6d.jpg)""".lstrip()
 
     assert new_text == correct_text
+
+
+def test_read_file_serves_stale_text_while_refreshing(monkeypatch):
+    entries = {('faq.md', u'master'): ('"old"', False)}
+    refreshes = []
+
+    monkeypatch.setattr(file_mod.cache, 'read_file_entry',
+                        lambda path, branch: entries.get((path, branch)))
+    monkeypatch.setattr(file_mod.lib, 'refresh_in_background',
+                        lambda name, func, *args: refreshes.append(name))
+
+    assert file_mod.read_file('faq.md') == 'old'
+    assert refreshes == [('faq.md', u'master')]
+
+    # Fresh text is served as-is
+    entries[('faq.md', u'master')] = ('"new"', True)
+    assert file_mod.read_file('faq.md') == 'new'
+    assert len(refreshes) == 1
+
+    # Nothing to serve when github is unavailable
+    monkeypatch.setattr(file_mod.remote, 'is_degraded', lambda repo: True)
+    assert file_mod.read_file('other.md') is None
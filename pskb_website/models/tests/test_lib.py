@@ -0,0 +1,95 @@
+"""
+Tests for models.lib module
+"""
+
+import time
+
+from .. import lib
+
+
+def _patch_cache(monkeypatch, entries, leases):
+    monkeypatch.setattr(lib.cache, 'read_computed', entries.get)
+    monkeypatch.setattr(lib.cache, 'save_computed',
+                        lambda key, value, delta, timeout: entries.__setitem__(
+                            key, (value, delta, time.time() + timeout)))
+    monkeypatch.setattr(lib.cache, 'acquire_lease',
+                        lambda key, token, timeout: key not in leases)
+    monkeypatch.setattr(lib.cache, 'release_lease',
+                        lambda key, token: None)
+
+
+def test_cached_computation_serves_previous_value_while_recomputing(monkeypatch):
+    entries = {}
+    leases = set()
+    calls = []
+
+    def _compute():
+        calls.append(1)
+        return {'count': len(calls)}
+
+    _patch_cache(monkeypatch, entries, leases)
+
+    # Computed once and cached when missing
+    assert lib.cached_computation('stats', _compute) == {'count': 1}
+    assert lib.cached_computation('stats', _compute) == {'count': 1}
+    assert len(calls) == 1
+
+    # Expired but somebody else is recomputing it
+    entries['stats'] = ({'count': 1}, 1, time.time() - 1)
+    leases.add('recompute:stats')
+    assert lib.cached_computation('stats', _compute) == {'count': 1}
+    assert len(calls) == 1
+
+    leases.clear()
+    assert lib.cached_computation('stats', _compute) == {'count': 2}
+    assert entries['stats'][0] == {'count': 2}
+
+
+def test_cached_computation_recomputes_early_near_expiry(monkeypatch):
+    entries = {'stats': ({'count': 0}, 10, time.time() + 5)}
+    _patch_cache(monkeypatch, entries, set())
+
+    # A high draw of random() starts about 10 * -log(0.01) = 46 seconds early,
+    # well before the value expires in 5 seconds
+    monkeypatch.setattr(lib.random, 'random', lambda: 0.99)
+    assert lib.cached_computation('stats', lambda: {'count': 1}) == {'count': 1}
+
+    # The lowest draw waits until the value actually expires
+    monkeypatch.setattr(lib.random, 'random', lambda: 0.0)
+    assert lib.cached_computation('stats', lambda: {'count': 2}) == {'count': 1}
+
+
+class _Cached(object):
+    def __init__(self, name):
+        self.name = name
+        self.branches = [[u'a', u'b']]
+
+
+def test_cache_json_round_trip():
+    obj = _Cached(u'guide')
+
+    str_ = lib.to_cache_json(obj)
+    assert ' ' not in str_
+
+    copy_ = lib.object_from_attrs(_Cached, lib.from_cache_json(str_))
+    assert copy_.__dict__ == obj.__dict__
+
+    attrs = lib.from_cache_json(lib.to_cache_json([obj, obj]))
+    assert [a['name'] for a in attrs] == [u'guide', u'guide']
+
+
+def test_cache_json_other_formats(monkeypatch):
+    obj = _Cached(u'guide')
+
+    # Saved with to_json before the compact format
+    for str_ in (lib.to_json(obj), '["{}"]', '[]'):
+        try:
+            lib.from_cache_json(str_)
+        except ValueError:
+            pass
+        else:
+            assert False, str_
+
+    str_ = lib.to_cache_json(obj)
+    monkeypatch.setattr(lib, 'CACHE_SCHEMA_VERSION', lib.CACHE_SCHEMA_VERSION + 1)
+    assert lib.from_cache_json(str_) is None
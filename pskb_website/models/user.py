@@ -25,7 +25,9 @@ def find_user(username=None):
     if username is not None:
         user_info = cache.read_user(username)
         if user_info is not None:
-            return User.from_json(user_info)
+            user = User.from_cache_json(user_info)
+            if user is not None:
+                return user
 
     user_info = remote.read_user_from_github(username)
     if not user_info:
@@ -51,7 +53,7 @@ def find_user(username=None):
 
     # User a longer timeout b/c not anticipating user's name,etc. to change
     # very often
-    cache.save_user(user.login, lib.to_json(user), timeout=60 * 30)
+    cache.save_user(user.login, lib.to_cache_json(user), timeout=60 * 30)
     return user
 
 
@@ -125,3 +127,24 @@ class User(object):
             setattr(user, attr, value)
 
         return user
+
+    @staticmethod
+    def from_cache_json(str_):
+        """
+        Create user object from json string saved in cache
+
+        :param str_: json string saved with lib.to_cache_json or lib.to_json
+        :returns: User object or None if saved with another schema version
+        """
+
+        try:
+            attrs = lib.from_cache_json(str_)
+        except ValueError:
+            # Saved before the compact format, these only live 30 minutes so
+            # no need to upgrade them.
+            return User.from_json(str_)
+
+        if attrs is None:
+            return None
+
+        return lib.object_from_attrs(User, attrs)
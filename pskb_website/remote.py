@@ -4,14 +4,26 @@ Main entry point for interacting with remote service APIs
 
 import base64
 import collections
+import contextlib
+import hashlib
 import json
+import time
 import urllib
 
-from flask_oauthlib.client import OAuth
+import flask
+from flask_oauthlib.client import OAuth, OAuthResponse
 from flask import session
+import requests
+from requests.structures import CaseInsensitiveDict
 
 from . import app
 from . import cache
+from . import gfm
+from . import http_pool
+from . import lru
+from . import mirror
+from . import singleflight
+from . import utils
 
 oauth = OAuth(app)
 
@@ -27,8 +39,339 @@ github = oauth.remote_app(
     authorize_url='https://github.com/login/oauth/authorize'
 )
 
+# Number of times to try committing several files at once when the branch
+# keeps changing underneath us
+COMMIT_RETRIES = 3
+
+# Priorities for github API requests.  Page views are interactive and always
+# go through.  Background work, i.e. celery tasks and webhooks, is slowed down
+# or deferred so it never uses up the rate limit page views depend on.
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+# Number of requests left in the rate limit that only interactive requests
+# can use
+DEFAULT_RATE_LIMIT_RESERVE = 500
+
+# Most seconds a background request waits for the rate limit before it's
+# deferred with RateLimitExceeded
+DEFAULT_BACKGROUND_MAX_WAIT = 60
+
+_PRIORITY_ENVIRON_KEY = 'pskb.github_priority'
+
+# Only serve from the cache once fewer requests than this are left in the
+# rate limit of the REPO_OWNER_ACCESS_TOKEN
+DEFAULT_DEGRADED_RATE_LIMIT = 50
+
+# Only serve from the cache for GITHUB_UNHEALTHY_TIMEOUT seconds once this
+# many requests in a row fail with a server or connection error
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_UNHEALTHY_TIMEOUT = 60
+
+# Number of tree listings to keep in memory as path -> SHA dicts, keyed by
+# SHA so they never go stale.  Only the newest few heads are ever looked up.
+TREE_INDEX_ENTRIES = 4
+TREE_INDEX_TIMEOUT = 60 * 60
+
+_tree_indexes = lru.LRUCache(TREE_INDEX_ENTRIES, TREE_INDEX_TIMEOUT)
+
+# Health of github as seen by this process
+_health = {'failures': 0, 'unhealthy_until': 0}
+
 file_details = collections.namedtuple('file_details', 'path, branch, sha, last_updated, url, text')
 
+# Returned instead of None when reading a file with report_404=True and the
+# file doesn't exist, as opposed to the read failing
+FILE_NOT_FOUND = object()
+
+# Returned instead of None by move_directory_on_github when the branch kept
+# changing underneath the commit, as opposed to the move failing
+COMMIT_CONFLICT = object()
+
+
+class RateLimitExceeded(singleflight.CallerError):
+    """
+    Raised instead of making a background request when there's not enough of
+    the github rate limit left to share with interactive requests
+
+    Interactive callers coalesced with a background request run the request
+    themselves instead of getting this error.
+    """
+
+    def __init__(self, message, wait):
+        super(RateLimitExceeded, self).__init__(message)
+
+        # Seconds until rate limit resets
+        self.wait = wait
+
+
+def request_priority():
+    """
+    Get priority of github API requests made from current context
+
+    :returns: INTERACTIVE or BACKGROUND
+
+    Requests are interactive when made while handling a request unless
+    background_priority() says otherwise.  Requests made outside of a request,
+    i.e. from celery tasks, are always background.
+    """
+
+    if not flask.has_request_context():
+        return BACKGROUND
+
+    return flask.request.environ.get(_PRIORITY_ENVIRON_KEY, INTERACTIVE)
+
+
+@contextlib.contextmanager
+def background_priority():
+    """
+    Context manager to make all github API requests from the current request
+    context background priority
+
+    The priority is saved on the request environment so it's shared with
+    copies of the request context made by utils.concurrent_map.
+    """
+
+    if not flask.has_request_context():
+        yield
+        return
+
+    environ = flask.request.environ
+    previous = environ.get(_PRIORITY_ENVIRON_KEY)
+    environ[_PRIORITY_ENVIRON_KEY] = BACKGROUND
+
+    try:
+        yield
+    finally:
+        if previous is None:
+            environ.pop(_PRIORITY_ENVIRON_KEY, None)
+        else:
+            environ[_PRIORITY_ENVIRON_KEY] = previous
+
+
+def _scheduled_http_request(uri, headers=None, data=None, method=None):
+    """
+    Send request through the shared connection pool once the rate limit of
+    the token allows it and remember the rate limit from the response
+
+    Takes the same arguments and returns the same value as
+    http_pool.http_request, which it replaces for the github remote app.
+
+    :raises: RateLimitExceeded if request is background priority and the
+             rate limit doesn't reset in time
+    """
+
+    key = _rate_limit_key(headers)
+
+    if request_priority() == BACKGROUND:
+        _wait_for_rate_limit(key)
+
+    try:
+        resp, content = http_pool.http_request(uri, headers=headers,
+                                               data=data, method=method)
+    except requests.RequestException:
+        _record_failure()
+        raise
+
+    if resp.code >= 500:
+        _record_failure()
+    else:
+        _record_success()
+
+    _save_rate_limit(key, resp.headers)
+
+    return resp, content
+
+
+def is_degraded(repo=None):
+    """
+    Determine if reads should only be served from the cache
+
+    :param repo: Optional path to repo (owner/repo_name) being read from,
+                 repos read from the local mirror are never degraded
+    :returns: True or False
+
+    This is the case when github keeps failing or when there's almost nothing
+    left in the rate limit of the REPO_OWNER_ACCESS_TOKEN.  Both recover on
+    their own, after GITHUB_UNHEALTHY_TIMEOUT seconds or once the rate limit
+    resets.
+    """
+
+    if repo is not None and mirror.can_read(repo):
+        return False
+
+    if _health['unhealthy_until'] > time.time():
+        return True
+
+    # Same header oauthlib sends for the token
+    token = app.config['REPO_OWNER_ACCESS_TOKEN']
+    key = _rate_limit_key({'Authorization': 'Bearer %s' % (token)})
+
+    rate_limit = _read_rate_limit(key)
+    if rate_limit is None:
+        return False
+
+    remaining, reset = rate_limit
+    threshold = utils.int_config('GITHUB_DEGRADED_RATE_LIMIT',
+                                 DEFAULT_DEGRADED_RATE_LIMIT)
+
+    return remaining < threshold and reset > time.time()
+
+
+def _record_failure():
+    """
+    Count failed request and mark github unhealthy after too many in a row
+
+    :returns: None
+    """
+
+    _health['failures'] += 1
+
+    threshold = utils.int_config('GITHUB_FAILURE_THRESHOLD',
+                                 DEFAULT_FAILURE_THRESHOLD)
+    if _health['failures'] < threshold:
+        return
+
+    timeout = utils.int_config('GITHUB_UNHEALTHY_TIMEOUT',
+                               DEFAULT_UNHEALTHY_TIMEOUT)
+
+    if _health['unhealthy_until'] <= time.time():
+        app.logger.warning('Github failed %d requests in a row, only serving from cache for %d seconds',
+                           _health['failures'], timeout)
+
+    _health['unhealthy_until'] = time.time() + timeout
+
+
+def _record_success():
+    """
+    Mark github healthy again after successful request
+
+    :returns: None
+    """
+
+    if _health['failures'] >= utils.int_config('GITHUB_FAILURE_THRESHOLD',
+                                               DEFAULT_FAILURE_THRESHOLD):
+        app.logger.info('Github recovered after %d failed requests',
+                        _health['failures'])
+
+    _health['failures'] = 0
+    _health['unhealthy_until'] = 0
+
+
+def _rate_limit_key(headers):
+    """
+    Get key identifying the rate limit a request counts against
+
+    :param headers: Headers of request
+    :returns: String key
+
+    Github keeps a separate rate limit for every token.  Only a hash of the
+    token is used so tokens are never saved in the cache.
+    """
+
+    authorization = None
+    for name, value in (headers or {}).iteritems():
+        if name.lower() == 'authorization':
+            authorization = value
+
+    if not authorization:
+        return 'anonymous'
+
+    if isinstance(authorization, unicode):
+        authorization = authorization.encode('utf-8')
+
+    return hashlib.sha1(authorization).hexdigest()
+
+
+def _read_rate_limit(key):
+    """
+    Read rate limit last seen by any process
+
+    :param key: Key from _rate_limit_key
+    :returns: Tuple of (remaining requests, reset time in seconds since epoch)
+              or None if unknown
+    """
+
+    saved = cache.read_rate_limit(key)
+    if saved is None:
+        return None
+
+    try:
+        saved = json.loads(saved)
+        return int(saved['remaining']), int(saved['reset'])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _save_rate_limit(key, headers):
+    """
+    Save rate limit from response headers for all processes
+
+    :param key: Key from _rate_limit_key
+    :param headers: Headers of response
+    :returns: None
+    """
+
+    try:
+        remaining = int(headers['X-RateLimit-Remaining'])
+        reset = int(headers['X-RateLimit-Reset'])
+    except (KeyError, TypeError, ValueError):
+        return
+
+    # Nothing to share once the rate limit resets
+    timeout = max(1, reset - int(time.time()))
+
+    cache.save_rate_limit(key, json.dumps({'remaining': remaining,
+                                           'reset': reset}), timeout)
+
+
+def _wait_for_rate_limit(key):
+    """
+    Hold background request until the rate limit can spare it
+
+    :param key: Key from _rate_limit_key
+    :returns: None
+    :raises: RateLimitExceeded if the wait would be longer than the
+             GITHUB_BACKGROUND_MAX_WAIT config value
+
+    Background requests never use the last GITHUB_RATE_LIMIT_RESERVE
+    requests.  Once less than twice the reserve is left background requests
+    are spread out over the time left until the rate limit resets.
+    """
+
+    rate_limit = _read_rate_limit(key)
+    if rate_limit is None:
+        return
+
+    remaining, reset = rate_limit
+    reserve = utils.int_config('GITHUB_RATE_LIMIT_RESERVE',
+                               DEFAULT_RATE_LIMIT_RESERVE)
+    max_wait = utils.int_config('GITHUB_BACKGROUND_MAX_WAIT',
+                                DEFAULT_BACKGROUND_MAX_WAIT)
+
+    time_left = max(0, reset - time.time())
+    spare = remaining - reserve
+
+    if spare > reserve or time_left == 0:
+        return
+
+    if spare > 0:
+        wait = min(time_left / spare, max_wait)
+    elif time_left <= max_wait:
+        wait = time_left
+    else:
+        raise RateLimitExceeded('Only %d github requests left for %d seconds' % (
+                                remaining, time_left), time_left)
+
+    app.logger.info('Delaying background github request %.1f seconds, %d requests left',
+                    wait, remaining)
+    time.sleep(wait)
+
+
+# Send all requests through our pool of keep-alive connections instead of
+# opening a new connection for every API call.
+github.http_request = _scheduled_http_request
+
 
 def default_repo_path():
     """Get path to main repo"""
@@ -55,363 +398,1252 @@ def log_error(message, url, resp, **kwargs):
     :returns: None
     """
 
-    additional_info = []
-    if kwargs:
-        for key, value in kwargs.iteritems():
-            additional_info.append('%s: "%s"' % (key, value))
+    additional_info = []
+    if kwargs:
+        for key, value in kwargs.iteritems():
+            additional_info.append('%s: "%s"' % (key, value))
+
+    app.logger.error('%s at "%s", status: %d, data: %s, %s',
+                     message, url, resp.status, getattr(resp, 'data', None),
+                     ','.join(additional_info))
+
+
+def files_from_github(repo, filename, limit=None):
+    """
+    Iterate through files with a specific name from github
+
+    :param repo: Path to repo to read files from
+    :param filename: Name of filename to search for recursively or tuple of
+                     names to find several kinds of files in one listing
+    :param limit: Optional limit of the number of files to return
+
+    :returns: Iterator through file_details tuples
+    """
+
+    sha = repo_sha_from_github(repo)
+    if sha is None:
+        raise StopIteration
+
+    # The listing for a specific SHA can never change so no need to ask github
+    # about it again if we already have it.
+    cache_key = (repo, sha, filename)
+
+    try:
+        files = _gen_files_from_cache(cache_key, limit=limit)
+    except KeyError:
+        files = None
+
+    if files is None and mirror.can_read(repo):
+        listing = mirror.files(sha, filename)
+        if listing is not None:
+            if listing:
+                cache.save_file_listing(cache_key, json.dumps(listing))
+
+            files = _iter_cached_files(listing, limit=limit)
+
+    if files is None:
+        try:
+            files = _gen_files_from_github_api(repo, sha, filename,
+                                               limit=limit,
+                                               cache_key=cache_key)
+        except ValueError:
+            raise StopIteration
+
+    for file_ in files:
+        yield file_
+
+
+@singleflight.single_flight('read_tree_listing')
+def _read_tree_listing(repo, sha):
+    """
+    Get listing of all files in a tree from github API
+
+    :param repo: Path to repo (owner/repo_name)
+    :param sha: Sha of tree or commit to read
+    :returns: List of (path, sha) pairs for every file relative to the tree or
+              None if a request failed
+
+    Github truncates recursive listings of large trees.  In that case we read
+    the top level of the tree and walk each subtree concurrently, which is
+    repeated for subtrees that are too large themselves.  Listings are cached
+    by SHA since they can never change so unchanged subtrees, i.e. all the
+    stacks that didn't get a new guide, are never requested again.
+    """
+
+    listing = cache.read_tree_listing(sha)
+    if listing is not None:
+        try:
+            return json.loads(listing)
+        except ValueError:
+            pass
+
+    url = 'repos/%s/git/trees/%s' % (repo, sha)
+    app.logger.debug('GET: %s?recursive=1', url)
+
+    resp = _conditional_get('%s?recursive=1' % (url))
+    if resp.status != 200:
+        log_error('Failed reading files', url, resp)
+        return None
+
+    # Walk subtrees ourselves from a listing of just the top level
+    truncated = resp.data.get('truncated', False)
+    if truncated:
+        app.logger.info('Listing of tree %s truncated, reading subtrees', sha)
+        app.logger.debug('GET: %s', url)
+
+        resp = _conditional_get(url)
+        if resp.status != 200:
+            log_error('Failed reading files', url, resp)
+            return None
+
+    listing = []
+    subtrees = []
+    for obj in resp.data['tree']:
+        if obj['type'] == 'blob':
+            listing.append((obj['path'], obj['sha']))
+        elif obj['type'] == 'tree' and truncated:
+            subtrees.append(obj)
+
+    def _read_subtree(obj):
+        return _read_tree_listing(repo, obj['sha'])
+
+    for obj, sublisting in zip(subtrees,
+                               utils.concurrent_map(_read_subtree, subtrees)):
+        if sublisting is None:
+            return None
+
+        for path, file_sha in sublisting:
+            listing.append(('%s/%s' % (obj['path'], path), file_sha))
+
+    cache.save_tree_listing(sha, json.dumps(listing))
+
+    return listing
+
+
+def _gen_files_from_cache(cache_key, limit=None):
+    """
+    Get generator through files from cache
+
+    :param cache_key: Key to retrieve files from cache
+    :param limit: Optional limit of the number of files to return
+
+    :returns: Iterator through file_details tuples
+    :raises: KeyError if cache is a miss
+    """
+
+    # Read eagerly so a miss raises KeyError to the caller instead of on the
+    # first iteration of the generator.
+    files = cache.read_file_listing(cache_key)
+    if files is None:
+        raise KeyError('No files found with %s' % (cache_key))
+
+    return _iter_cached_files(json.loads(files), limit=limit)
+
+
+def _iter_cached_files(files, limit=None):
+    """
+    Generator through list of (path, sha) pairs as saved in cache
+
+    :param files: List of (path, sha) pairs
+    :param limit: Optional limit of the number of files to return
+
+    :returns: Iterator through file_details tuples
+    """
+
+    count = 0
+    for file_ in files:
+        yield file_details(file_[0], None, file_[1], None, None, None)
+        count += 1
+
+        if limit is not None and count == limit:
+            raise StopIteration
+
+
+def _gen_files_from_github_api(repo, sha, filename, limit=None, cache_key=None):
+    """
+    Iterate through files with a specific name from github and cache files if
+    cache_key is given
+
+    :param repo: Path to repo to read files from
+    :param sha: Sha of repo to read with
+    :param filename: Name of filename to search for recursively
+    :param limit: Optional limit of the number of files to return
+    :param cache_key: Optional key to cache file listing with
+
+    :returns: Iterator through file_details tuples
+    :raises: ValueError if request fails
+    """
+
+    listing = _read_tree_listing(repo, sha)
+    if listing is None:
+        raise ValueError('Failed reponse')
+
+    files = []
+    for path, file_sha in listing:
+        if path.endswith(filename):
+            # Easier to serialize a standard tuple than namedtuple
+            files.append(('%s/%s' % (repo, path), file_sha))
+
+    # Always cache the full listing so a limited request doesn't leave a
+    # partial listing behind for the next caller.
+    if files and cache_key:
+        cache.save_file_listing(cache_key, json.dumps(files))
+
+    return _iter_cached_files(files, limit=limit)
+
+
+def _conditional_request_key(url, headers=None, data=None):
+    """
+    Get key to identify a GET request for conditional requests
+
+    :param url: URL of request
+    :param headers: Optional dict of headers sent with request
+    :param data: Optional dict of query string arguments sent with request
+    :returns: String key
+    """
+
+    accept = None
+    if headers:
+        for name, value in headers.iteritems():
+            if name.lower() == 'accept':
+                accept = value
+
+    args = []
+    if data:
+        for name, value in sorted(data.iteritems()):
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+
+            args.append((name, value))
+
+    key = '%s?%s accept:%s' % (url, urllib.urlencode(args), accept)
+    return hashlib.sha1(key).hexdigest()
+
+
+@singleflight.single_flight(
+        'conditional_get',
+        lambda url, headers=None, data=None, token=None: _conditional_request_key(
+                url, headers=headers, data=data),
+        lease=True)
+def _conditional_get(url, headers=None, data=None, token=None):
+    """
+    Make GET request to github API revalidating any previously seen response
+
+    :param url: URL to request
+    :param headers: Optional dict of headers to send with request
+    :param data: Optional dict of query string arguments
+    :param token: Optional token to make request with, see github.get
+    :returns: Response object just like github.get
+
+    The etag and body of every successful response is saved in the cache,
+    which is shared by all processes.  Subsequent requests for the same URL
+    send the etag and a 304 response is turned back into the saved response.
+    This way callers don't know the difference, and 304 responses do not count
+    against the github rate limit.
+    """
+
+    key = _conditional_request_key(url, headers=headers, data=data)
+    headers = dict(headers or {})
+
+    saved = cache.read_conditional_response(key)
+    if saved is not None:
+        try:
+            saved = json.loads(saved)
+        except ValueError:
+            saved = None
+
+    if saved is not None:
+        if saved['etag']:
+            headers['If-None-Match'] = saved['etag']
+        elif saved['last_modified']:
+            headers['If-Modified-Since'] = saved['last_modified']
+
+    resp = github.get(url, headers=headers, data=data, token=token)
+
+    if resp.status == 304 and saved is not None:
+        return _response_from_saved(saved)
+
+    if resp.status == 200:
+        _save_response(key, resp)
+
+    return resp
+
+
+def _save_response(key, resp):
+    """
+    Save response to use with future conditional requests
+
+    :param key: Key from _conditional_request_key
+    :param resp: Response object to save
+    :returns: None
+    """
+
+    resp_headers = resp._resp.headers
+    etag = resp_headers.get('ETag')
+    last_modified = resp_headers.get('Last-Modified')
+
+    # Nothing to revalidate with
+    if not etag and not last_modified:
+        return
+
+    try:
+        body = resp.raw_data.decode('utf-8')
+    except UnicodeDecodeError:
+        app.logger.warning('Not saving non utf-8 response for conditional requests')
+        return
+
+    saved = {'etag': etag, 'last_modified': last_modified,
+             'content_type': resp_headers.get('Content-Type'), 'body': body}
+
+    cache.save_conditional_response(key, json.dumps(saved))
+
+
+def _response_from_saved(saved):
+    """
+    Create response object from saved response
+
+    :param saved: Dictionary of response as saved by _save_response
+    :returns: Response object just like github.get
+    """
+
+    headers = CaseInsensitiveDict()
+    for name, value in (('ETag', saved['etag']),
+                        ('Last-Modified', saved['last_modified']),
+                        ('Content-Type', saved['content_type'])):
+        if value is not None:
+            headers[name] = value
+
+    resp = http_pool.pooled_response(200, headers)
+    return OAuthResponse(resp, saved['body'].encode('utf-8'),
+                         github.content_type)
+
+
+@singleflight.single_flight('repo_sha_from_github')
+def repo_sha_from_github(repo, branch=u'master'):
+    """
+    Get sha from head of given repo
+
+    :param repo: Path to repo (owner/repo_name)
+    :param branch: Name of branch to get sha for
+    :returns: Sha of branch
+    """
+
+    if mirror.can_read(repo):
+        return mirror.read_branch(branch)
+
+    url = 'repos/%s/git/refs/heads/%s' % (repo, branch)
+    app.logger.debug('GET: %s', url)
+
+    resp = _conditional_get(url)
+
+    if resp.status != 200:
+        log_error('Failed reading sha', url, resp, branch=branch)
+        return None
+
+    return resp.data['object']['sha']
+
+
+def primary_github_email_of_logged_in():
+    """Get primary email address of logged in user"""
+
+    app.logger.debug('GET: user/emails')
+
+    resp = github.get('user/emails')
+    if resp.status != 200:
+        return None
+
+    for email_data in resp.data:
+        if email_data['primary']:
+            return email_data['email']
+
+    return None
+
+
+@singleflight.single_flight('read_file_from_github')
+def read_file_from_github(path, branch=u'master', rendered_text=True,
+                          allow_404=False, report_404=False):
+    """
+    Get rendered file text from github API
+
+    :param path: Path to file (<owner>/<repo>/<dir>/.../<filename>)
+    :param branch: Name of branch to read file from
+    :param rendered_text: Return rendered or raw text
+    :param allow_404: False to log warning for 404 or True to allow it i.e.
+                      when you're just seeing if a file already exists
+    :param report_404: True to return FILE_NOT_FOUND instead of None if the
+                       file doesn't exist
+    :returns: file_details namedtuple or None if error
+
+    Note when requesting rendered text from github there will be no SHA or
+    last_updated data available.  This is a restriction from the github API
+    (https://developer.github.com/v3/media/#repository-contents) Requesting
+    file 'details' like SHA and rendered text are 2 API calls.  Therefore, if
+    you want all of that information you should call this function twice, once
+    with rendered_text=True and one with rendered_text=False and combine the
+    information yourself.
+
+    Markdown files are rendered locally unless the MARKDOWN_RENDERER config
+    value is 'github'.  In that case all file details are available.
+    """
+
+    if rendered_text and _render_markdown_locally(path):
+        details = file_details_from_github(path, branch, allow_404=allow_404,
+                                           report_404=report_404)
+        if details is None or details is FILE_NOT_FOUND:
+            return details
+
+        return details._replace(text=render_markdown(details.text,
+                                                     sha=details.sha))
+
+    if rendered_text:
+        text = rendered_markdown_from_github(path, branch, allow_404=allow_404,
+                                             report_404=report_404)
+        if text is FILE_NOT_FOUND:
+            return text
+
+        details = file_details(path, branch, None, None,
+                               _html_url(path, branch), text)
+    else:
+        details = file_details_from_github(path, branch, allow_404=allow_404,
+                                           report_404=report_404)
+
+    return details
+
+
+def _html_url(path, branch):
+    """
+    Get URL to view file on github.com
+
+    :param path: Path to file (<owner>/<repo>/<dir>/.../<filename>)
+    :param branch: Name of branch file is on
+    :returns: URL
+    """
+
+    # This is a little tricky b/c this URL could change on github and we
+    # would be wrong.  However, those URLs have been the same for years so
+    # seems like a safe enough bet at this point.
+    owner, repo, file_path = split_full_file_path(path)
+
+    # Cannot pass unicode data to pathname2url or it can raise KeyError.
+    # Must only pass URL-safe bytes. So, something like u'\u2026' will
+    # raise a # KeyError but if we encode it to bytes, '%E2%80%A6', things
+    # work correctly.
+    # http://stackoverflow.com/questions/15115588/urllib-quote-throws-keyerror
+
+    return u'https://github.com/%s/%s/blob/%s/%s' % (
+            owner,
+            repo,
+            branch,
+            urllib.pathname2url(file_path.encode('utf-8')))
+
+
+def _render_markdown_locally(path):
+    """
+    Determine if file at path should be rendered with the local renderer
+
+    :param path: Path to file
+    :returns: True or False
+    """
+
+    renderer = app.config.get('MARKDOWN_RENDERER') or 'local'
+    return renderer != 'github' and path.lower().endswith('.md')
+
+
+def render_markdown(text, sha=None):
+    """
+    Render markdown text to HTML without using the github API
+
+    :param text: Markdown text
+    :param sha: Optional SHA of text, used to save rendered HTML in the cache
+    :returns: HTML text
+    """
+
+    if sha is not None:
+        html = cache.read_rendered_markdown(sha, gfm.VERSION)
+        if html is not None:
+            return unicode(html, encoding='utf-8')
+
+    html = gfm.render(text)
+
+    if sha is not None:
+        cache.save_rendered_markdown(sha, gfm.VERSION, html.encode('utf-8'))
+
+    return html
+
+
+@singleflight.single_flight('rendered_markdown_from_github')
+def rendered_markdown_from_github(path, branch=u'master', allow_404=False,
+                                  report_404=False):
+    """
+    Get rendered markdown file text from github API
+
+    :param path: Path to file (<owner>/<repo>/<dir>/.../<filename.md>)
+    :param branch: Name of branch to read file from
+    :param allow_404: False to log warning for 404 or True to allow it i.e.
+                      when you're just seeing if a file already exists
+    :param report_404: True to return FILE_NOT_FOUND instead of None if the
+                       file doesn't exist
+    :returns: HTML file text or None if error
+    """
+
+    url = contents_url_from_path(path)
+    headers = {'accept': 'application/vnd.github.html'}
+    app.logger.debug('GET: %s, headers: %s, ref: %s', url, headers, branch)
+
+    resp = _conditional_get(url, headers=headers, data={'ref': branch})
+    if resp.status == 200:
+        return unicode(resp.data, encoding='utf-8')
+
+    if resp.status != 404 or not allow_404:
+        log_error('Failed reading rendered markdown', url, resp, branch=branch)
+
+    if resp.status == 404 and report_404:
+        return FILE_NOT_FOUND
+
+    return None
+
+
+@singleflight.single_flight('file_details_from_github')
+def file_details_from_github(path, branch=u'master', allow_404=False,
+                             report_404=False):
+    """
+    Get file details from github
+
+    :param path: Path to file (<owner>/<repo>/<dir>/.../<filename>)
+    :param branch: Name of branch to read file from
+    :param allow_404: False to log warning for 404 or True to allow it i.e.
+                      when you're just seeing if a file already exists
+    :param report_404: True to return FILE_NOT_FOUND instead of None if the
+                       file doesn't exist
+    :returns: file_details namedtuple or None for error
+    """
+
+    owner, repo, file_path = split_full_file_path(path)
+    if mirror.can_read(u'%s/%s' % (owner, repo)):
+        return _file_details_from_mirror(path, branch, allow_404=allow_404,
+                                         report_404=report_404)
+
+    url = contents_url_from_path(path)
+    app.logger.debug('GET: %s ref: %s', url, branch)
+
+    resp = _conditional_get(url, data={'ref': branch})
+
+    if resp.status == 200:
+
+        # Temporary debug. It seems that sometimes github returns a 200
+        # response and a list of items, which should only happen if we ask for
+        # the contents of a directory.  This function should never be called
+        # with a directory.
+        try:
+            sha = resp.data['sha']
+        except TypeError as err:
+            app.logger.error('Incorrect SHA response for URL: %s, resp: %s, err: %s',
+                             url, resp.data, err)
+            return None
+
+        link = resp.data['_links']['html']
+        text = unicode(base64.b64decode(resp.data['content'].encode('utf-8')),
+                       encoding='utf-8')
+        last_updated = resp._resp.headers.get('Last-Modified')
+    else:
+        if resp.status != 404 or (resp.status == 404 and not allow_404):
+            app.logger.warning('Failed reading file details at "%s", status: %d, branch: %s, data: %s',
+                               url, resp.status, branch, resp.data)
+
+        if resp.status == 404 and report_404:
+            return FILE_NOT_FOUND
+
+        return None
+
+    return file_details(path, branch, sha, last_updated, link, text)
+
+
+def _file_details_from_mirror(path, branch=u'master', allow_404=False,
+                              report_404=False):
+    """
+    Get file details from local mirror of repo
+
+    :param path: Path to file (<owner>/<repo>/<dir>/.../<filename>)
+    :param branch: Name of branch to read file from
+    :param allow_404: False to log warning for missing file or True to allow
+                      it i.e. when you're just seeing if a file already exists
+    :param report_404: True to return FILE_NOT_FOUND instead of None if the
+                       file doesn't exist
+    :returns: file_details namedtuple or None for error
+    """
+
+    file_path = split_full_file_path(path)[2]
+
+    contents = mirror.read_file(file_path, branch, missing=FILE_NOT_FOUND)
+    if contents is None or contents is FILE_NOT_FOUND:
+        if contents is None or not allow_404:
+            app.logger.warning('Failed reading file details from mirror at "%s", branch: %s',
+                               path, branch)
+
+        if report_404:
+            return contents
+
+        return None
+
+    sha, text = contents
+    last_updated = mirror.last_modified(file_path, branch)
+
+    return file_details(path, branch, sha, last_updated,
+                        _html_url(path, branch), text)
+
+
+@singleflight.single_flight('read_blob_from_github')
+def read_blob_from_github(repo, sha):
+    """
+    Read text of file by blob SHA
+
+    :param repo: Path to repo (owner/repo_name)
+    :param sha: SHA of blob
+    :returns: Text of file or None for error
+
+    Blobs can never change so they are cached by SHA and never requested
+    again.
+    """
+
+    text = cache.read_blob(sha)
+    if text is not None:
+        return unicode(text, encoding='utf-8')
+
+    if mirror.can_read(repo):
+        text = mirror.read_blob(sha)
+        if text is not None:
+            cache.save_blob(sha, text.encode('utf-8'))
+
+        return text
+
+    return _read_blob_from_api(repo, sha)
+
+
+@singleflight.single_flight('read_blob_from_api', lease=True)
+def _read_blob_from_api(repo, sha):
+    """
+    Read text of file by blob SHA from github API and cache it
+
+    :param repo: Path to repo (owner/repo_name)
+    :param sha: SHA of blob
+    :returns: Text of file or None for error
+    """
+
+    # Another process might have read it while we waited on the lease
+    text = cache.read_blob(sha)
+    if text is not None:
+        return unicode(text, encoding='utf-8')
+
+    url = 'repos/%s/git/blobs/%s' % (repo, sha)
+    app.logger.debug('GET: %s', url)
+
+    resp = github.get(url)
+    if resp.status != 200:
+        log_error('Failed reading blob', url, resp)
+        return None
+
+    text = unicode(base64.b64decode(resp.data['content'].encode('utf-8')),
+                   encoding='utf-8')
+
+    cache.save_blob(sha, text.encode('utf-8'))
+
+    return text
+
+
+@singleflight.single_flight('read_file_text_from_github')
+def read_file_text_from_github(path, branch=u'master', rendered_text=False):
+    """
+    Read text of file by looking up its SHA and reading the blob
+
+    :param path: Path to file (<owner>/<repo>/<dir>/.../<filename>)
+    :param branch: Name of branch to read file from
+    :param rendered_text: Return rendered or raw text
+    :returns: Text of file or None if file is missing or could not be read
+
+    The SHA comes from the tree listing of the head of the branch, which is
+    cached by SHA like the blob itself.  So reading a file that hasn't changed
+    only costs a conditional request for the head of the branch, which
+    doesn't count against the rate limit.  Rendered text is only available
+    when markdown is rendered locally.
+    """
+
+    if rendered_text and not _render_markdown_locally(path):
+        return None
+
+    owner, repo_name, file_path = split_full_file_path(path)
+    repo = '%s/%s' % (owner, repo_name)
+
+    if mirror.can_read(repo):
+        contents = mirror.read_file(file_path, branch)
+        if contents is None:
+            return None
+
+        sha, text = contents
+    else:
+        sha = _file_sha_from_tree_listing(repo, file_path, branch)
+        if sha is None:
+            return None
+
+        text = read_blob_from_github(repo, sha)
+        if text is None:
+            return None
+
+    if rendered_text:
+        return render_markdown(text, sha=sha)
+
+    return text
+
+
+def file_sha_from_github(path, branch=u'master'):
+    """
+    Get SHA of file without reading it
+
+    :param path: Path to file (<owner>/<repo>/<dir>/.../<filename>)
+    :param branch: Name of branch file is on
+    :returns: SHA of file or None if file is missing or could not be read
+    """
+
+    owner, repo_name, file_path = split_full_file_path(path)
+    repo = '%s/%s' % (owner, repo_name)
+
+    if mirror.can_read(repo):
+        return mirror.file_sha(file_path, branch)
+
+    return _file_sha_from_tree_listing(repo, file_path, branch)
+
+
+def _file_sha_from_tree_listing(repo, file_path, branch=u'master'):
+    """
+    Get SHA of file from tree listing of head of branch
+
+    :param repo: Path to repo (owner/repo_name)
+    :param file_path: Short path to file (<dir>/.../<filename>)
+    :param branch: Name of branch to read file from
+    :returns: SHA of file or None if file is missing or listing failed
+    """
+
+    head_sha = repo_sha_from_github(repo, branch)
+    if head_sha is None:
+        return None
+
+    index = _tree_indexes.get(head_sha)
+    if index is None:
+        listing = _read_tree_listing(repo, head_sha)
+        if listing is None:
+            return None
+
+        # Decoding and scanning the whole listing for every file read adds up
+        # so keep it around as a dict until the branch moves on.
+        index = dict(listing)
+        _tree_indexes.set(head_sha, index)
+
+    return index.get(file_path)
+
+
+def commit_file_to_github(path, message, content, name, email, sha=None,
+                          branch=u'master', auto_encode=True):
+    """
+    Save given file content to github
+
+    :param path: Path to file (<owner>/<repo>/<dir>/.../<filename>)
+    :param message: Commit message to save file with
+    :param content: Content of file
+    :param name: Name of author who wrote file
+    :param email: Email address of author
+    :param sha: Optional SHA of file if it already exists on github
+    :param branch: Name of branch to commit file to (branch must already
+                   exist)
+    :param auto_encode: Boolean to automatically encode data as utf-8
+
+    :returns: SHA of commit or None for failure
+
+    Note that name and email can be None if you want to make a commit with the
+    REPO_OWNER.  However, name and email should both exist or both be None,
+    which is a requirement of the underlying Github API.
+    """
+
+    url = contents_url_from_path(path)
+
+    if auto_encode:
+        content = base64.b64encode(content.encode('utf-8'))
+
+    commit_info = {'message': message, 'content': content, 'branch': branch}
+
+    if name is not None and email is not None:
+        commit_info['author'] = {'name': name, 'email': email}
+        commit_info['committer'] = {'name': name, 'email': email}
+    elif (name is None and email is not None) or (name is not None and email is None):
+        raise ValueError('Must specify both name and email or neither')
+
+    if sha:
+        commit_info['sha'] = sha
+
+    # The flask-oauthlib API expects the access token to be in a tuple or a
+    # list.  Not exactly sure why since the underlying oauthlib library has a
+    # separate kwargs for access_token.  See flask_oauthlib.client.make_client
+    # for more information.
+    token = (app.config['REPO_OWNER_ACCESS_TOKEN'], )
+
+    app.logger.debug('PUT: %s, data: %s, token: %s', url, commit_info, token)
+
+    resp = github.put(url, data=commit_info, format='json', token=token)
+
+    if resp.status not in (201, 200):
+        log_error('Failed saving file', url, resp, commit_msg=message,
+                  content=content, name=name, email=email, sha=sha,
+                  branch=branch)
+        return None
+
+    mirror.mark_stale()
+
+    return resp.data['commit']['sha']
+
+
+def commit_files_to_github(repo_path, message, name, email, build_changes,
+                           branch=u'master'):
+    """
+    Save changes to several files to github as a single commit
+
+    :param repo_path: Path to repo (<owner>/<repo_name>)
+    :param message: Commit message
+    :param name: Name of author making changes
+    :param email: Email address of author
+    :param build_changes: Function called with a function to read files as
+                          they are on the commit being built on.  The read
+                          function takes a path (<owner>/<repo>/<dir>/...)
+                          and returns a file_details namedtuple or None if
+                          the file doesn't exist.  build_changes should
+                          return a dictionary of path to new text, or None
+                          to remove the file, or None to abort the commit.
+    :param branch: Name of branch to commit to (branch must already exist)
+
+    :returns: SHA of commit, SHA of current HEAD if there were no changes, or
+              None for failure
+
+    Note that name and email can be None if you want to make a commit with the
+    REPO_OWNER.  However, name and email should both exist or both be None.
+
+    All changes are made with one new tree, one new commit and one update of
+    the branch.  The update fails if somebody else committed to the branch in
+    the meantime, in which case we start over with the new HEAD so
+    build_changes can be called more than once.
+    """
+
+    def _build_entries(parent_sha):
+        def _read(path):
+            return _file_details_at_commit(path, parent_sha)
+
+        changes = build_changes(_read)
+        if changes is None:
+            return None
+
+        return _tree_entries_for_changes(repo_path, changes)
+
+    return _commit_tree_changes(repo_path, message, name, email,
+                                _build_entries, branch=branch)
+
+
+def _commit_tree_changes(repo_path, message, name, email, build_entries,
+                         branch=u'master', report_conflict=False):
+    """
+    Commit changes to the tree of HEAD of branch
+
+    :param repo_path: Path to repo (<owner>/<repo_name>)
+    :param message: Commit message
+    :param name: Name of author making changes
+    :param email: Email address of author
+    :param build_entries: Function called with SHA of the commit being built
+                          on that returns a list of tree entries as described
+                          by the github create tree API, an empty list for no
+                          changes or None to abort the commit
+    :param branch: Name of branch to commit to (branch must already exist)
+    :param report_conflict: True to return COMMIT_CONFLICT instead of None if
+                            the branch changed on every try
+
+    :returns: SHA of commit, SHA of current HEAD if there were no changes, or
+              None for failure
+    """
+
+    if (name is None) != (email is None):
+        raise ValueError('Must specify both name and email or neither')
+
+    token = (app.config['REPO_OWNER_ACCESS_TOKEN'], )
+
+    for _ in xrange(COMMIT_RETRIES):
+        parent_sha = _read_ref_from_github(repo_path, branch)
+        if parent_sha is None:
+            return None
 
-    app.logger.error('%s at "%s", status: %d, data: %s, %s',
-                     message, url, resp.status, getattr(resp, 'data', None),
-                     ','.join(additional_info))
+        base_tree_sha = _read_commit_tree_from_github(repo_path, parent_sha)
+        if base_tree_sha is None:
+            return None
 
+        entries = build_entries(parent_sha)
+        if entries is None:
+            return None
 
-def files_from_github(repo, filename, limit=None):
-    """
-    Iterate through files with a specific name from github
+        if not entries:
+            app.logger.debug('No changes for commit "%s"', message)
+            return parent_sha
 
-    :param repo: Path to repo to read files from
-    :param filename: Name of filename to search for recursively
-    :param limit: Optional limit of the number of files to return
+        tree_sha = _create_tree_on_github(repo_path, base_tree_sha, entries,
+                                          token)
+        if tree_sha is None:
+            return None
 
-    :returns: Iterator through file_details tuples
-    """
+        commit_sha = _create_commit_on_github(repo_path, message, tree_sha,
+                                              parent_sha, name, email, token)
+        if commit_sha is None:
+            return None
 
-    sha = repo_sha_from_github(repo)
-    if sha is None:
-        raise StopIteration
+        status = _update_ref_on_github(repo_path, branch, commit_sha, token)
+        if status == 200:
+            mirror.mark_stale()
+            return commit_sha
 
-    headers = {}
-    cache_key = (repo, sha, filename)
-    etag = cache.read_file_listing_etag(cache_key)
-    if etag is not None:
-        headers = {'If-None-Match': etag}
+        # 422 means the update wasn't a fast-forward so someone else
+        # committed first.
+        if status != 422:
+            return None
 
-    resp = _fetch_files_from_github_api(repo, sha, headers=headers)
-    if resp is None:
-        raise StopIteration
+        app.logger.info('Branch "%s" changed while committing "%s", retrying',
+                        branch, message)
 
-    # Try to read articles from cache
-    files = None
-    if resp.status == 304:
-        try:
-            files = _gen_files_from_cache(cache_key, limit=limit)
-        except KeyError:
-            # Nothing in cache which is odd since we had a etag but that's ok
-            # we can do a real read
-            pass
+    app.logger.error('Gave up committing "%s" to branch "%s" after %d tries',
+                     message, branch, COMMIT_RETRIES)
 
-    if files is None:
-        try:
-            files = _gen_files_from_github_api(repo, sha, filename,
-                                               limit=limit,
-                                               cache_key=cache_key)
-        except ValueError:
-            raise StopIteration
+    if report_conflict:
+        return COMMIT_CONFLICT
 
-    for file_ in files:
-        yield file_
+    return None
 
 
-def _fetch_files_from_github_api(repo, sha, headers=None):
+def move_directory_on_github(repo_path, curr_path, new_path, message, name,
+                             email, rewrite_files=None, branch=u'master'):
     """
-    Grab listing of files from github API
+    Move directory to a new location with a single commit and no checkout
 
-    :param repo: Path to repo (owner/repo_name)
-    :param sha: Sha of repo to read with
-    :param headers: Optional dict of headers to use in request
-    :returns: Response object from request or None if response failed
+    :param repo_path: Path to repo (<owner>/<repo_name>)
+    :param curr_path: Path to directory without repo owner and name
+    :param new_path: New path to directory without repo owner and name
+    :param message: Commit message
+    :param name: Name of author making changes
+    :param email: Email address of author
+    :param rewrite_files: Optional dictionary of file names inside the
+                          directory to a function taking the current text and
+                          returning the new text to save in the same commit
+    :param branch: Name of branch to commit to
+
+    :returns: SHA of commit, COMMIT_CONFLICT if the branch kept changing
+              while committing or None for failure, i.e. the directory
+              doesn't exist or the new location is already taken
+
+    The tree of the directory is reused as-is at the new location, or with
+    just the rewritten files replaced, so this costs the same handful of API
+    requests no matter how big the repo is.
     """
 
-    url = 'repos/%s/git/trees/%s?recursive=1' % (repo, sha)
-    app.logger.debug('GET: %s', url)
-
-    resp = github.get(url, headers=headers)
-    if resp.status not in (200, 304):
-        log_error('Failed reading files', url, resp)
-        return None
+    token = (app.config['REPO_OWNER_ACCESS_TOKEN'], )
 
-    try:
-        truncated = resp.data['truncated']
-    except KeyError:
-        truncated = False
+    def _build_entries(parent_sha):
+        directory = _read_directory_at_commit(repo_path, curr_path,
+                                              parent_sha)
+        if directory is None:
+            app.logger.error('Cannot move missing directory "%s" in "%s"',
+                             curr_path, repo_path)
+            return None
 
-    # FIXME: Handle this scenario
-    if truncated:
-        log_error('Too many files for API call', url, resp)
+        # Recursive listing of the whole tree so the check never misses the
+        # new location.  A listing of its parent is capped at 1000 entries
+        # and any error reading it would look just like it's free.
+        listing = _read_tree_listing(repo_path, parent_sha)
+        if listing is None:
+            app.logger.error('Cannot move "%s", failed reading tree of %s in "%s"',
+                             curr_path, parent_sha, repo_path)
+            return None
 
-    return resp
+        prefix = u'%s/' % (new_path.rstrip(u'/'))
+        if any(path == new_path or path.startswith(prefix)
+               for path, _ in listing):
+            app.logger.error('Cannot move "%s" to existing directory "%s" in "%s"',
+                             curr_path, new_path, repo_path)
+            return None
 
+        tree_sha, files = directory
 
-def _gen_files_from_cache(cache_key, limit=None):
-    """
-    Get generator through files from cache
+        if rewrite_files:
+            sub_entries = []
+            for filename, rewrite in sorted(rewrite_files.iteritems()):
+                path = u'%s/%s/%s' % (repo_path, curr_path, filename)
 
-    :param cache_key: Key to retrieve files from cache
-    :param limit: Optional limit of the number of files to return
+                details = _file_details_at_commit(path, parent_sha)
+                if details is None:
+                    app.logger.error('Cannot rewrite missing file "%s"', path)
+                    return None
 
-    :returns: Iterator through file_details tuples
-    :raises: KeyError if cache is a miss
-    """
+                sub_entries.append({'path': filename, 'mode': '100644',
+                                    'type': 'blob',
+                                    'content': rewrite(details.text)})
 
-    files = cache.read_file_listing(cache_key)
-    if files is None:
-        raise KeyError('No files found with %s' % (cache_key))
+            tree_sha = _create_tree_on_github(repo_path, tree_sha,
+                                              sub_entries, token)
+            if tree_sha is None:
+                return None
 
-    count = 0
-    for file_ in json.loads(files):
-        yield file_details(file_[0], None, file_[1], None, None, None)
-        count += 1
+        entries = [{'path': new_path, 'mode': '040000', 'type': 'tree',
+                    'sha': tree_sha}]
 
-        if limit is not None and count == limit:
-            raise StopIteration
+        # Git has no notion of a directory on its own so removing all the
+        # files removes the old directory.
+        for path, mode, _ in files:
+            entries.append({'path': u'%s/%s' % (curr_path, path),
+                            'mode': mode, 'type': 'blob', 'sha': None})
 
+        return entries
 
-def _gen_files_from_github_api(repo, sha, filename, limit=None, cache_key=None):
-    """
-    Iterate through files with a specific name from github and cache files if
-    cache_key is given
+    return _commit_tree_changes(repo_path, message, name, email,
+                                _build_entries, branch=branch,
+                                report_conflict=True)
 
-    :param repo: Path to repo to read files from
-    :param sha: Sha of repo to read with
-    :param filename: Name of filename to search for recursively
-    :param limit: Optional limit of the number of files to return
-    :param cache_key: Optional key to cache file listing with
 
-    :returns: Iterator through file_details tuples or None if request fails
+def _read_directory_at_commit(repo_path, path, commit_sha):
+    """
+    Read every file under a directory as of a specific commit
+
+    :param repo_path: Path to repo (<owner>/<repo_name>)
+    :param path: Path to directory without repo owner and name
+    :param commit_sha: SHA of commit to read directory from
+    :returns: Tuple of (tree SHA, list of (path, mode, sha) tuples for files
+              with paths relative to directory) or None if directory is not
+              found or error
     """
 
-    resp = _fetch_files_from_github_api(repo, sha)
-    if resp is None:
-        raise ValueError('Failed reponse')
+    if mirror.can_read(repo_path) and mirror.has_commit(commit_sha):
+        return mirror.read_directory_at_commit(path, commit_sha)
 
-    count = 0
-    files = []
+    # Find SHA of directory tree from listing of its parent
+    parent, _, dirname = path.rstrip(u'/').rpartition(u'/')
+    url = contents_url_from_path(u'%s/%s' % (repo_path, parent))
+    app.logger.debug('GET: %s ref: %s', url, commit_sha)
 
-    for obj in resp.data['tree']:
-        if obj['path'].endswith(filename):
-            full_path = '%s/%s' % (repo, obj['path'])
-            yield file_details(full_path, None, obj['sha'], None, None, None)
-            count += 1
+    resp = _conditional_get(url, data={'ref': commit_sha})
+    if resp.status == 404:
+        return None
 
-            if cache_key is not None:
-                # Easier to serialize a standard tuple than namedtuple
-                files.append((full_path, obj['sha']))
+    if resp.status != 200 or not isinstance(resp.data, list):
+        log_error('Failed reading directory', url, resp, ref=commit_sha)
+        return None
 
-        if limit is not None and count == limit:
+    tree_sha = None
+    for item in resp.data:
+        if item['name'] == dirname and item['type'] == 'dir':
+            tree_sha = item['sha']
             break
 
-    if files and cache_key:
-        cache.save_file_listing(cache_key, json.dumps(files))
+    if tree_sha is None:
+        return None
 
+    url = 'repos/%s/git/trees/%s?recursive=1' % (repo_path, tree_sha)
+    app.logger.debug('GET: %s', url)
 
-def repo_sha_from_github(repo, branch=u'master'):
+    resp = _conditional_get(url)
+    if resp.status != 200 or resp.data.get('truncated'):
+        log_error('Failed reading directory tree', url, resp)
+        return None
+
+    files = [(obj['path'], obj['mode'], obj['sha'])
+             for obj in resp.data['tree'] if obj['type'] != 'tree']
+
+    return tree_sha, sorted(files)
+
+
+def _read_ref_from_github(repo_path, branch):
     """
-    Get sha from head of given repo
+    Get SHA of HEAD of branch straight from github, never the mirror
 
-    :param repo: Path to repo (owner/repo_name)
-    :param branch: Name of branch to get sha for
-    :returns: Sha of branch
+    :param repo_path: Path to repo (<owner>/<repo_name>)
+    :param branch: Name of branch
+    :returns: SHA or None if error
     """
 
-    url = 'repos/%s/git/refs/heads/%s' % (repo, branch)
+    url = 'repos/%s/git/refs/heads/%s' % (repo_path, branch)
     app.logger.debug('GET: %s', url)
 
-    resp = github.get(url)
-
+    resp = _conditional_get(url)
     if resp.status != 200:
-        log_error('Failed reading sha', url, resp, branch=branch)
+        log_error('Failed reading branch', url, resp, branch=branch)
         return None
 
     return resp.data['object']['sha']
 
 
-def primary_github_email_of_logged_in():
-    """Get primary email address of logged in user"""
+def _read_commit_tree_from_github(repo_path, commit_sha):
+    """
+    Get SHA of tree for commit
 
-    app.logger.debug('GET: user/emails')
+    :param repo_path: Path to repo (<owner>/<repo_name>)
+    :param commit_sha: SHA of commit
+    :returns: SHA of tree or None if error
+    """
 
-    resp = github.get('user/emails')
+    url = 'repos/%s/git/commits/%s' % (repo_path, commit_sha)
+    app.logger.debug('GET: %s', url)
+
+    # Commits never change so this is almost always a free 304
+    resp = _conditional_get(url)
     if resp.status != 200:
+        log_error('Failed reading commit', url, resp)
         return None
 
-    for email_data in resp.data:
-        if email_data['primary']:
-            return email_data['email']
-
-    return None
+    return resp.data['tree']['sha']
 
 
-def read_file_from_github(path, branch=u'master', rendered_text=True,
-                          allow_404=False):
+def _file_details_at_commit(path, commit_sha):
     """
-    Get rendered file text from github API
+    Read file as of a specific commit
 
     :param path: Path to file (<owner>/<repo>/<dir>/.../<filename>)
-    :param branch: Name of branch to read file from
-    :param rendered_text: Return rendered or raw text
-    :param allow_404: False to log warning for 404 or True to allow it i.e.
-                      when you're just seeing if a file already exists
-    :returns: file_details namedtuple or None if error
-
-    Note when requesting rendered text there will be no SHA or last_updated
-    data available.  This is a restriction from the github API
-    (https://developer.github.com/v3/media/#repository-contents) Requesting
-    file 'details' like SHA and rendered text are 2 API calls.  Therefore, if
-    you want all of that information you should call this function twice, once
-    with rendered_text=True and one with rendered_text=False and combine the
-    information yourself.
+    :param commit_sha: SHA of commit to read file from
+    :returns: file_details namedtuple or None if file doesn't exist
     """
 
-    if rendered_text:
-        text = rendered_markdown_from_github(path, branch, allow_404=allow_404)
+    owner, repo, file_path = split_full_file_path(path)
 
-        # This is a little tricky b/c this URL could change on github and we
-        # would be wrong.  However, those URLs have been the same for years so
-        # seems like a safe enough bet at this point.
-        owner, repo, file_path = split_full_file_path(path)
+    # Mirror might not have fetched the commit yet
+    if mirror.can_read(u'%s/%s' % (owner, repo)) and mirror.has_commit(commit_sha):
+        contents = mirror.read_file_at_commit(file_path, commit_sha)
+        if contents is None:
+            return None
 
-        # Cannot pass unicode data to pathname2url or it can raise KeyError.
-        # Must only pass URL-safe bytes. So, something like u'\u2026' will
-        # raise a # KeyError but if we encode it to bytes, '%E2%80%A6', things
-        # work correctly.
-        # http://stackoverflow.com/questions/15115588/urllib-quote-throws-keyerror
+        return file_details(path, commit_sha, contents[0], None, None,
+                            contents[1])
 
-        url = u'https://github.com/%s/%s/blob/%s/%s' % (
-                owner,
-                repo,
-                branch,
-                urllib.pathname2url(file_path.encode('utf-8')))
+    url = contents_url_from_path(path)
+    app.logger.debug('GET: %s ref: %s', url, commit_sha)
 
-        details = file_details(path, branch, None, None, url, text)
-    else:
-        details = file_details_from_github(path, branch, allow_404=allow_404)
+    resp = _conditional_get(url, data={'ref': commit_sha})
+    if resp.status == 404:
+        return None
 
-    return details
+    if resp.status != 200:
+        log_error('Failed reading file', url, resp, ref=commit_sha)
+        return None
 
+    text = unicode(base64.b64decode(resp.data['content'].encode('utf-8')),
+                   encoding='utf-8')
 
-def rendered_markdown_from_github(path, branch=u'master', allow_404=False):
+    return file_details(path, commit_sha, resp.data['sha'], None, None, text)
+
+
+def _tree_entries_for_changes(repo_path, changes):
     """
-    Get rendered markdown file text from github API
+    Turn file changes into entries for the github create tree API
 
-    :param path: Path to file (<owner>/<repo>/<dir>/.../<filename.md>)
-    :param branch: Name of branch to read file from
-    :param allow_404: False to log warning for 404 or True to allow it i.e.
-                      when you're just seeing if a file already exists
-    :returns: HTML file text
+    :param repo_path: Path to repo (<owner>/<repo_name>)
+    :param changes: Dictionary of path (<owner>/<repo>/<dir>/...) to text or
+                    None to remove file
+    :returns: List of tree entries
     """
 
-    url = contents_url_from_path(path)
-    headers = {'accept': 'application/vnd.github.html'}
-    app.logger.debug('GET: %s, headers: %s, ref: %s', url, headers, branch)
+    entries = []
+    for path, text in sorted(changes.iteritems()):
+        owner, repo, file_path = split_full_file_path(path)
+        if u'%s/%s' % (owner, repo) != repo_path:
+            raise ValueError('Path "%s" is not in repo "%s"' % (path,
+                                                                repo_path))
 
-    resp = github.get(url, headers=headers, data={'ref': branch})
-    if resp.status == 200:
-        return unicode(resp.data, encoding='utf-8')
+        entry = {'path': file_path, 'mode': '100644', 'type': 'blob'}
 
-    if resp.status != 404 or not allow_404:
-        log_error('Failed reading rendered markdown', url, resp, branch=branch)
+        # A null SHA removes the file from the tree
+        if text is None:
+            entry['sha'] = None
+        else:
+            entry['content'] = text
 
-    return None
+        entries.append(entry)
 
+    return entries
 
-def file_details_from_github(path, branch=u'master', allow_404=False):
-    """
-    Get file details from github
 
-    :param path: Path to file (<owner>/<repo>/<dir>/.../<filename>)
-    :param branch: Name of branch to read file from
-    :param allow_404: False to log warning for 404 or True to allow it i.e.
-                      when you're just seeing if a file already exists
-    :returns: file_details namedtuple or None for error
+def _create_tree_on_github(repo_path, base_tree_sha, entries, token):
+    """
+    Create new tree with changes on top of existing tree
+
+    :param repo_path: Path to repo (<owner>/<repo_name>)
+    :param base_tree_sha: SHA of tree to apply changes to
+    :param entries: List of tree entries as described by the github create
+                    tree API
+    :param token: Token to authenticate with
+    :returns: SHA of new tree or None if error
     """
 
-    url = contents_url_from_path(path)
-    app.logger.debug('GET: %s ref: %s', url, branch)
-
-    resp = github.get(url, data={'ref': branch})
-
-    if resp.status == 200:
-
-        # Temporary debug. It seems that sometimes github returns a 200
-        # response and a list of items, which should only happen if we ask for
-        # the contents of a directory.  This function should never be called
-        # with a directory.
-        try:
-            sha = resp.data['sha']
-        except TypeError as err:
-            app.logger.error('Incorrect SHA response for URL: %s, resp: %s, err: %s',
-                             url, resp.data, err)
-            return None
+    url = 'repos/%s/git/trees' % (repo_path)
+    data = {'base_tree': base_tree_sha, 'tree': entries}
+    paths = [entry['path'] for entry in entries]
 
-        link = resp.data['_links']['html']
-        text = unicode(base64.b64decode(resp.data['content'].encode('utf-8')),
-                       encoding='utf-8')
-        last_updated = resp._resp.headers.get('Last-Modified')
-    else:
-        if resp.status != 404 or (resp.status == 404 and not allow_404):
-            app.logger.warning('Failed reading file details at "%s", status: %d, branch: %s, data: %s',
-                               url, resp.status, branch, resp.data)
+    app.logger.debug('POST: %s, paths: %s', url, paths)
 
+    resp = github.post(url, data=data, format='json', token=token)
+    if resp.status != 201:
+        log_error('Failed creating tree', url, resp, paths=paths)
         return None
 
-    return file_details(path, branch, sha, last_updated, link, text)
+    return resp.data['sha']
 
 
-def commit_file_to_github(path, message, content, name, email, sha=None,
-                          branch=u'master', auto_encode=True):
+def _create_commit_on_github(repo_path, message, tree_sha, parent_sha, name,
+                             email, token):
+    """
+    Create commit object
+
+    :param repo_path: Path to repo (<owner>/<repo_name>)
+    :param message: Commit message
+    :param tree_sha: SHA of tree for commit
+    :param parent_sha: SHA of parent commit
+    :param name: Name of author or None to commit as REPO_OWNER
+    :param email: Email address of author or None to commit as REPO_OWNER
+    :param token: Token to authenticate with
+    :returns: SHA of commit or None if error
     """
-    Save given file content to github
-
-    :param path: Path to file (<owner>/<repo>/<dir>/.../<filename>)
-    :param message: Commit message to save file with
-    :param content: Content of file
-    :param name: Name of author who wrote file
-    :param email: Email address of author
-    :param sha: Optional SHA of file if it already exists on github
-    :param branch: Name of branch to commit file to (branch must already
-                   exist)
-    :param auto_encode: Boolean to automatically encode data as utf-8
 
-    :returns: SHA of commit or None for failure
+    url = 'repos/%s/git/commits' % (repo_path)
+    data = {'message': message, 'tree': tree_sha, 'parents': [parent_sha]}
 
-    Note that name and email can be None if you want to make a commit with the
-    REPO_OWNER.  However, name and email should both exist or both be None,
-    which is a requirement of the underlying Github API.
-    """
+    if name is not None and email is not None:
+        data['author'] = {'name': name, 'email': email}
+        data['committer'] = {'name': name, 'email': email}
 
-    url = contents_url_from_path(path)
+    app.logger.debug('POST: %s, data: %s', url, data)
 
-    if auto_encode:
-        content = base64.b64encode(content.encode('utf-8'))
+    resp = github.post(url, data=data, format='json', token=token)
+    if resp.status != 201:
+        log_error('Failed creating commit', url, resp, commit_msg=message)
+        return None
 
-    commit_info = {'message': message, 'content': content, 'branch': branch}
+    return resp.data['sha']
 
-    if name is not None and email is not None:
-        commit_info['author'] = {'name': name, 'email': email}
-        commit_info['committer'] = {'name': name, 'email': email}
-    elif (name is None and email is not None) or (name is not None and email is None):
-        raise ValueError('Must specify both name and email or neither')
 
-    if sha:
-        commit_info['sha'] = sha
+def _update_ref_on_github(repo_path, branch, commit_sha, token):
+    """
+    Point branch at new commit, only if it's a fast-forward
 
-    # The flask-oauthlib API expects the access token to be in a tuple or a
-    # list.  Not exactly sure why since the underlying oauthlib library has a
-    # separate kwargs for access_token.  See flask_oauthlib.client.make_client
-    # for more information.
-    token = (app.config['REPO_OWNER_ACCESS_TOKEN'], )
+    :param repo_path: Path to repo (<owner>/<repo_name>)
+    :param branch: Name of branch
+    :param commit_sha: SHA of commit to update branch to
+    :param token: Token to authenticate with
+    :returns: HTTP status of response
+    """
 
-    app.logger.debug('PUT: %s, data: %s, token: %s', url, commit_info, token)
+    url = 'repos/%s/git/refs/heads/%s' % (repo_path, branch)
+    data = {'sha': commit_sha, 'force': False}
 
-    resp = github.put(url, data=commit_info, format='json', token=token)
+    app.logger.debug('PATCH: %s, data: %s', url, data)
 
-    if resp.status not in (201, 200):
-        log_error('Failed saving file', url, resp, commit_msg=message,
-                  content=content, name=name, email=email, sha=sha,
-                  branch=branch)
-        return None
+    resp = github.patch(url, data=data, format='json', token=token)
+    if resp.status not in (200, 422):
+        log_error('Failed updating branch', url, resp, sha=commit_sha)
 
-    return resp.data['commit']['sha']
+    return resp.status
 
 
 def commit_image_to_github(path, message, file_, name, email, sha=None,
@@ -452,7 +1684,12 @@ def read_user_from_github(username=None):
 
     app.logger.debug('GET: %s', url)
 
-    resp = github.get(url)
+    # The response for the logged in user depends on the session so only
+    # revalidate requests for a specific user.
+    if username is not None:
+        resp = _conditional_get(url)
+    else:
+        resp = github.get(url)
 
     if resp.status != 200:
         log_error('Failed reading user', url, resp)
@@ -480,7 +1717,7 @@ def read_repo_collaborators_from_github(owner=None, repo=None):
 
     app.logger.debug('GET: %s, token: %s', url, token)
 
-    resp = github.get(url, token=token)
+    resp = _conditional_get(url, token=token)
 
     if resp.status != 200:
         log_error('Failed reading collaborators', url, resp, repo=repo,
@@ -546,6 +1783,7 @@ def contents_url_from_path(path):
                                                             file_path))
 
 
+@singleflight.single_flight('read_branch')
 def read_branch(repo_path, name):
     """
     Read branch and get HEAD sha
@@ -555,11 +1793,14 @@ def read_branch(repo_path, name):
     :returns: SHA of HEAD or None if branch is not found
     """
 
+    if mirror.can_read(repo_path):
+        return mirror.read_branch(name)
+
     url = 'repos/%s/git/refs/heads/%s' % (repo_path, name)
 
     app.logger.debug('GET: %s', url)
 
-    resp = github.get(url)
+    resp = _conditional_get(url)
 
     # Branch doesn't exist
     if resp.status == 404:
@@ -608,6 +1849,8 @@ def create_branch(repo_path, name, sha):
         log_error('Failed creating branch', url, resp, sha=sha)
         return False
 
+    mirror.mark_stale()
+
     return True
 
 
@@ -635,6 +1878,8 @@ def update_branch(repo_path, name, sha):
         log_error('Failed updating branch', url, resp, sha=sha)
         return False
 
+    mirror.mark_stale()
+
     return True
 
 
@@ -694,6 +1939,8 @@ def remove_file_from_github(path, message, name, email, branch):
         log_error('Failed removing file', url, resp, file=path)
         return False
 
+    mirror.mark_stale()
+
     return True
 
 
@@ -718,7 +1965,11 @@ def merge_branch(repo_path, base, head, message):
     resp = github.post(url, data=data, format='json', token=token)
 
     # 204 means no content i.e. no merge needed
-    if resp.status in (201, 204):
+    if resp.status == 204:
+        return True
+
+    if resp.status == 201:
+        mirror.mark_stale()
         return True
 
     log_error('Failed merging', url, resp, repo=repo_path, base=base, head=head)
@@ -742,16 +1993,24 @@ def file_contributors(path, branch=u'master'):
     github account.
     """
 
+    if mirror.can_read(default_repo_path()):
+        contribs = mirror.file_contributors(path, branch)
+        if contribs is not None:
+            return contribs
+
     contribs = {'authors': set(), 'committers': set()}
     url = u'/repos/%s/commits' % (default_repo_path())
 
     app.logger.debug('GET: %s path: %s, branch: %s', url, path, branch)
 
-    resp = github.get(url, data={'path': path, 'branch': branch})
+    resp = _conditional_get(url, data={'path': path, 'branch': branch})
     if resp.status != 200:
         log_error('Failed reading commits from github', url, resp)
         return contribs
 
+    # Remember who these people are so the mirror can answer next time
+    mirror.learn_logins(resp.data)
+
     def _extract_data_from_commit(commit, key):
         login = commit[key]['login']
 
@@ -0,0 +1,227 @@
+"""
+Coalesce identical concurrent reads from github
+
+When a popular guide drops out of the cache every greenlet rendering it asks
+github for the same thing at the same time.  Functions wrapped with
+single_flight() only run once at a time for the same arguments in each
+process.  The first caller runs the function and everyone else arriving
+while it runs waits for and shares its result.
+
+Functions that actually send requests to github can also take a short lease
+in the cache so it's shared by all processes, i.e. gunicorn workers.  Workers
+that find somebody else holding the lease wait for it to be released, up to
+SINGLE_FLIGHT_LEASE_TIMEOUT seconds, before running the function themselves.
+By then the caches the leader filled, i.e. saved responses for conditional
+requests and blobs, answer the read or at least turn it into a 304 response
+that doesn't count against the rate limit.  Leases cost a couple of cache
+round trips so they are only used where a request to github is next.
+
+Results are shared as-is between callers in a process so only wrap functions
+returning values callers don't modify.
+
+Exceptions raised by the function are re-raised in every caller waiting on it
+except for CallerError exceptions, which depend on who is calling.  Callers
+waiting on a call that raises one run the function themselves instead.
+"""
+
+import collections
+import functools
+import hashlib
+import sys
+import threading
+import time
+import uuid
+
+from . import app
+from . import cache
+from . import utils
+
+# Seconds a lease is held at most, in case the worker holding it dies
+DEFAULT_LEASE_TIMEOUT = 10
+
+# Seconds to sleep between checks for a lease to be released
+LEASE_POLL_INTERVAL = 0.05
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+# Counters for this process, see stats()
+_stats = collections.defaultdict(int)
+
+
+class CallerError(Exception):
+    """
+    Base class for errors caused by the caller rather than the call itself,
+    i.e. a background caller deferring its request, which are never shared
+    with other callers
+    """
+
+
+class _Call(object):
+    """
+    Call in progress shared by everyone asking for the same key
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def single_flight(name, key_func=None, lease=False):
+    """
+    Decorator to coalesce concurrent calls with the same arguments
+
+    :param name: Name of function used to build keys
+    :param key_func: Optional function taking the same arguments as the
+                     decorated function returning a key for the call or None
+                     to skip coalescing the call.  Defaults to the repr of
+                     the arguments.
+    :param lease: True to also coalesce calls between processes with a lease
+                  in the cache
+    """
+
+    def _decorator(func):
+        @functools.wraps(func)
+        def _wrapper(*args, **kwargs):
+            if key_func is None:
+                key = repr((args, sorted(kwargs.iteritems())))
+            else:
+                key = key_func(*args, **kwargs)
+
+            if key is None:
+                return func(*args, **kwargs)
+
+            return run('%s:%s' % (name, key), func, *args, lease=lease,
+                       **kwargs)
+
+        return _wrapper
+
+    return _decorator
+
+
+def run(key, func, *args, **kwargs):
+    """
+    Call function unless a call with the same key is already running and wait
+    for its result instead
+
+    :param key: String key identifying call
+    :param func: Function to call
+    :param args: Arguments to call function with
+    :param kwargs: Keyword arguments to call function with and optionally
+                   lease=True to take a lease shared by all processes before
+                   calling function
+    :returns: Result of function
+    """
+
+    lease = kwargs.pop('lease', False)
+
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        _stats['coalesced'] += 1
+        call.done.wait()
+
+        if call.error is not None:
+            if isinstance(call.error[1], CallerError):
+                _stats['retried'] += 1
+                return func(*args, **kwargs)
+
+            raise call.error[0], call.error[1], call.error[2]
+
+        return call.result
+
+    _stats['calls'] += 1
+
+    try:
+        if lease:
+            call.result = _run_with_lease(key, func, *args, **kwargs)
+        else:
+            call.result = func(*args, **kwargs)
+
+        return call.result
+    except Exception:
+        call.error = sys.exc_info()
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[key]
+
+        call.done.set()
+
+
+def _run_with_lease(key, func, *args, **kwargs):
+    """
+    Call function while holding lease shared by all processes
+
+    :param key: String key identifying call
+    :param func: Function to call
+    :param args: Arguments to call function with
+    :param kwargs: Keyword arguments to call function with
+    :returns: Result of function
+
+    The function is still called when the lease cannot be acquired in time or
+    the cache is unavailable.
+    """
+
+    timeout = utils.int_config('SINGLE_FLIGHT_LEASE_TIMEOUT',
+                               DEFAULT_LEASE_TIMEOUT)
+    lease_key = hashlib.sha1(key).hexdigest()
+    token = uuid.uuid4().hex
+    deadline = time.time() + timeout
+    waited = False
+
+    while True:
+        acquired = cache.acquire_lease(lease_key, token, timeout)
+
+        # None means no cache to share a lease with
+        if acquired or acquired is None:
+            break
+
+        if not waited:
+            _stats['lease_waits'] += 1
+            waited = True
+
+        if time.time() > deadline:
+            _stats['lease_timeouts'] += 1
+            app.logger.warning('Timed out waiting on lease for "%s"', key)
+            acquired = False
+            break
+
+        time.sleep(LEASE_POLL_INTERVAL)
+
+    try:
+        return func(*args, **kwargs)
+    finally:
+        if acquired:
+            cache.release_lease(lease_key, token)
+
+
+def stats():
+    """
+    Get counters of calls in this process
+
+    :returns: Dictionary of counters::
+
+        {'calls': 100,
+         'coalesced': 25,
+         'retried': 1,
+         'lease_waits': 3,
+         'lease_timeouts': 0}
+
+    calls is the number of times a wrapped function ran, coalesced the number
+    of calls that shared the result of a call already running in this process,
+    retried the number of those that ran the function themselves after it
+    raised a CallerError and lease_waits the number of calls that waited on
+    another process.
+    """
+
+    counters = dict.fromkeys(('calls', 'coalesced', 'retried', 'lease_waits',
+                              'lease_timeouts'), 0)
+    counters.update(_stats)
+
+    return counters
@@ -3,22 +3,43 @@ Configure and define tasks for use with Celery
 """
 
 import codecs
+import datetime
+import functools
 import os
 import shutil
 import subprocess
 import tempfile
 import json
+import uuid
 
 from celery import Celery
 
 from . import app
 from . import PUBLISHED, IN_REVIEW, DRAFT
+from . import cache
+from . import mirror
 from . import remote
+from . import utils
+from .models import article as article_mod
 from .models import file as file_mod
+from .models import lib as models_lib
 from .models.article import get_available_articles_from_api
 
 RETRIES = 5
 
+# 5 minutes
+DEFAULT_CLONE_LOCK_TIMEOUT = 5 * 60
+
+# 5 minutes
+DEFAULT_WARM_CACHE_INTERVAL = 5 * 60
+
+# Max number of the most popular published guides to keep warm
+DEFAULT_WARM_CACHE_MAX_ARTICLES = 50
+
+# Read counts of guides are halved every time the cache is warmed so guides
+# that stop being read stop being refreshed
+ARTICLE_ACCESS_DECAY = 0.5
+
 def make_celery(app):
     celery = Celery(app.import_name, broker=app.config['CELERY_BROKER_URL'])
     celery.conf.update(app.config)
@@ -36,6 +57,16 @@ def make_celery(app):
 
 celery = make_celery(app)
 
+# Run with celery beat, i.e. celery worker -B
+celery.conf.CELERYBEAT_SCHEDULE = {
+    'warm-cache': {
+        'task': 'pskb_website.tasks.warm_cache',
+        'schedule': datetime.timedelta(
+            seconds=utils.int_config('WARM_CACHE_INTERVAL',
+                                     DEFAULT_WARM_CACHE_INTERVAL)),
+    },
+}
+
 
 # Updating the file listing files is done via celery because we need a queue to
 # synchonize all the changes and avoid conflicts.  These files are updated by
@@ -49,8 +80,8 @@ celery = make_celery(app)
 # github between the time we've read the SHA from the API and changed the file.
 # Not a great way to reduce this risk with the current design...
 
-@celery.task()
-def update_listing(*args, **kwargs):
+@celery.task(bind=True)
+def update_listing(self, *args, **kwargs):
     """
     Update file listing with data as described by arguments
 
@@ -60,15 +91,19 @@ def update_listing(*args, **kwargs):
     that it can be a normal function outside of celery tasks.
     """
 
-    with app.test_request_context():
-        success = file_mod.update_article_listing(*args, **kwargs)
+    with app.test_request_context(), remote.background_priority():
+        try:
+            success = file_mod.update_article_listing(*args, **kwargs)
+        except remote.RateLimitExceeded as err:
+            raise self.retry(exc=err, countdown=err.wait)
+
         if not success:
             app.logger.error(u'Failed updating article listing, args: "%s", kwargs: "%s"',
                              args, kwargs)
 
 
-@celery.task()
-def remove_from_listing(*args, **kwargs):
+@celery.task(bind=True)
+def remove_from_listing(self, *args, **kwargs):
     """
     Remove a an article from file listing
 
@@ -78,15 +113,19 @@ def remove_from_listing(*args, **kwargs):
     that it can be a normal function outside of celery tasks.
     """
 
-    with app.test_request_context():
-        success = file_mod.remove_article_from_listing(*args, **kwargs)
+    with app.test_request_context(), remote.background_priority():
+        try:
+            success = file_mod.remove_article_from_listing(*args, **kwargs)
+        except remote.RateLimitExceeded as err:
+            raise self.retry(exc=err, countdown=err.wait)
+
         if not success:
             app.logger.error(u'Failed removing article from listing, args: "%s", kwargs: "%s"',
                              args, kwargs)
 
 
-@celery.task()
-def synchronize_listing(status, committer_name, committer_email):
+@celery.task(bind=True)
+def synchronize_listing(self, status, committer_name, committer_email):
     """
     Synchronize file listing with the articles that exist via the API
 
@@ -96,25 +135,139 @@ def synchronize_listing(status, committer_name, committer_email):
 
     Note this is an expensive operation because it does a full scan of all the
     articles in the repo so it can use up quite a few API requests and time.
+    The requests are background priority so the task is retried later if it
+    would use up the rate limit left for page views.
     """
 
-    with app.test_request_context():
-        articles = get_available_articles_from_api(status)
-        success = file_mod.sync_file_listing(articles, status, committer_name,
-                                             committer_email)
+    with app.test_request_context(), remote.background_priority():
+        try:
+            articles = get_available_articles_from_api(status)
+            success = file_mod.sync_file_listing(articles, status,
+                                                 committer_name,
+                                                 committer_email)
+
+            # Same tree listing so rebuilding the index is nearly free
+            article_mod.rebuild_article_index()
+        except remote.RateLimitExceeded as err:
+            raise self.retry(exc=err, countdown=err.wait)
+
         if not success:
             app.logger.error(u'Failed syncing article listing, status: "%s", committer_name: "%s", committer_email: "%s"',
                              status, committer_name, committer_email)
 
 
+@celery.task(bind=True)
+def recache_articles(self, paths, branch):
+    """
+    Read published guides from github and cache them again, i.e. after a push
+    changed them
+
+    :param paths: List of short paths to guides, i.e. published/python/title
+    :param branch: Name of branch guides are on
+
+    Requests are background priority so the task is retried with the guides
+    it didn't get to once the rate limit resets.
+    """
+
+    with app.test_request_context(), remote.background_priority():
+        for index, path in enumerate(paths):
+            try:
+                article_mod.refresh_article(path, branch)
+            except remote.RateLimitExceeded as err:
+                raise self.retry(args=(paths[index:], branch), exc=err,
+                                 countdown=err.wait)
+
+
+@celery.task()
+def warm_cache():
+    """
+    Read popular published guides, file listings and stats from github again
+    before they expire from the cache and rebuild the index of guides
+
+    This runs every WARM_CACHE_INTERVAL seconds with celery beat and refreshes
+    everything that expires before the next run or two.  Spending the rate
+    limit here with background priority means readers rarely pay for a cache
+    miss.  Guides are refreshed in order of popularity, up to
+    WARM_CACHE_MAX_ARTICLES of them.
+    """
+
+    if not cache.is_enabled():
+        return
+
+    interval = utils.int_config('WARM_CACHE_INTERVAL',
+                                DEFAULT_WARM_CACHE_INTERVAL)
+    max_articles = utils.int_config('WARM_CACHE_MAX_ARTICLES',
+                                    DEFAULT_WARM_CACHE_MAX_ARTICLES)
+
+    with app.test_request_context(), remote.background_priority():
+        if remote.is_degraded(remote.default_repo_path()):
+            app.logger.info(u'Not warming cache while github is unavailable')
+        else:
+            try:
+                _warm_cache(2 * interval, max_articles)
+            except remote.RateLimitExceeded:
+                app.logger.info(u'Stopped warming cache to save github rate limit')
+
+    cache.decay_article_access(ARTICLE_ACCESS_DECAY)
+
+
+def _warm_cache(ahead, max_articles):
+    """
+    Refresh everything that expires from the cache soon
+
+    :param ahead: Refresh anything that expires within this many seconds
+    :param max_articles: Max number of popular guides to refresh
+    :returns: None
+    """
+
+    def _expiring(expires_in):
+        # None means it's already gone
+        return expires_in is None or expires_in < ahead
+
+    for filename in (file_mod.PUB_FILENAME, file_mod.IN_REVIEW_FILENAME,
+                     file_mod.DRAFT_FILENAME):
+        if _expiring(cache.file_expires_in(filename, u'master')):
+            app.logger.debug(u'Warming cache for %s', filename)
+            file_mod.refresh_file(filename, rendered_text=False)
+
+    for path, branch in cache.read_popular_articles(max_articles):
+        if _expiring(article_mod.article_expires_in(path, branch)):
+            app.logger.debug(u'Warming cache for %s, branch: %s', path, branch)
+            article_mod.refresh_article(path, branch)
+
+    if _expiring(cache.computed_expires_in(article_mod.AUTHOR_STATS_CACHE_KEY)):
+        article_mod.author_stats(statuses=(PUBLISHED, ), refresh=True)
+
+    if _expiring(cache.computed_expires_in(models_lib.COMMIT_STATS_CACHE_KEY)):
+        models_lib.contribution_stats(refresh=True)
+
+    # Catches anything the push webhook missed.  The tree listing is cached
+    # by SHA so this only costs requests when the repo changed.
+    article_mod.rebuild_article_index()
+
+
 def change_publish_metadata(path, new_status):
     """
     Change publish_status in JSON metadata file
     """
 
     with codecs.open(path, 'r', encoding='utf-8') as file_obj:
-        metadata = json.loads(file_obj.read(), encoding='utf-8')
+        text = file_obj.read()
 
+    with codecs.open(path, 'w', encoding='utf-8') as file_obj:
+        file_obj.write(publish_metadata_text(text, new_status))
+
+
+def publish_metadata_text(text, new_status):
+    """
+    Change publish_status in JSON metadata text
+
+    :param text: JSON metadata text
+    :param new_status: PUBLISHED, IN_REVIEW, or DRAFT
+    :returns: New JSON metadata text
+    """
+
+    metadata = json.loads(text, encoding='utf-8')
     metadata['_publish_status'] = new_status
 
     # This was renamed so handle 'upgrading' when we see this old ref.
@@ -123,14 +276,70 @@ def change_publish_metadata(path, new_status):
     except KeyError:
         pass
 
-    with codecs.open(path, 'w', encoding='utf-8') as file_obj:
-        file_obj.write(json.dumps(metadata, sort_keys=True, indent=4,
-                                  separators=(',', ': ')))
+    return json.dumps(metadata, sort_keys=True, indent=4,
+                      separators=(',', ': '))
 
 
-@celery.task()
-def move_article(curr_path, new_path, title, committer_name, committer_email,
-                 new_publish_status=None):
+def working_clone_path():
+    """
+    Get path to working clone of main repo used for moving articles
+
+    :returns: Path
+    """
+
+    path = app.config.get('GIT_WORKING_CLONE_PATH')
+    if not path:
+        path = os.path.join(tempfile.gettempdir(), u'guides-cms-working-clone')
+
+    return path
+
+
+def _git(args, clone_dir):
+    """
+    Run git command in working clone
+
+    :param args: List of git arguments
+    :param clone_dir: Path to working clone
+    :raises: subprocess.CalledProcessError if command fails
+    """
+
+    cmd = [u'git'] + args
+    subprocess.check_call([arg.encode('utf-8') for arg in cmd], cwd=clone_dir)
+
+
+def _update_working_clone(clone_dir):
+    """
+    Create working clone or fetch the latest changes into it
+
+    :param clone_dir: Path to working clone
+    :raises: subprocess.CalledProcessError if clone or fetch fails
+
+    Caller must hold the lock on the working clone.
+    """
+
+    user = app.config['REPO_OWNER']
+    pwd = app.config['REPO_OWNER_ACCESS_TOKEN']
+
+    url = u'https://%s:%s@github.com/%s.git' % (user, pwd,
+                                                remote.default_repo_path())
+
+    if os.path.isdir(os.path.join(clone_dir, u'.git')):
+        # Token could have changed since we cloned
+        _git([u'remote', u'set-url', u'origin', url], clone_dir)
+        _git([u'fetch', u'--quiet', u'--prune', u'origin'], clone_dir)
+        return
+
+    # Leftovers from a clone that didn't finish
+    if os.path.isdir(clone_dir):
+        shutil.rmtree(clone_dir)
+
+    app.logger.info(u'Creating working clone at %s', clone_dir)
+    _git([u'clone', u'--quiet', url, clone_dir], None)
+
+
+@celery.task(bind=True)
+def move_article(self, curr_path, new_path, title, committer_name,
+                 committer_email, new_publish_status=None):
     """
     Move article from one publish status to another
 
@@ -145,71 +354,144 @@ def move_article(curr_path, new_path, title, committer_name, committer_email,
                                should be moved and publish status changed
                                argument should be PUBLISHED, IN_REVIEW, or
                                DRAFT
+    :returns: True if article was moved or False if the move failed, i.e.
+              the new path is taken, or the working clone was busy for too
+              long
+    :raises: subprocess.CalledProcessError if a git command fails
+
+    The move is done with the github API by rewriting trees, without any
+    checkout.  If the branch keeps changing underneath that commit the move
+    happens in a working clone instead, which is kept around between moves
+    and only fetches the latest changes so the cost of a move doesn't grow
+    with the size of the repo.  The clone is shared by all processes on the
+    machine, so only one move runs at a time.  The requests are background
+    priority so the task is retried later if it would use up the rate limit
+    left for page views.
     """
 
     app.logger.info(u'Moving %s from %s to %s', title, curr_path, new_path)
 
-    url = remote.default_repo_path()
-    clone_dir = tempfile.mkdtemp()
-
-    user = app.config['REPO_OWNER']
-    pwd = app.config['REPO_OWNER_ACCESS_TOKEN']
+    move_msg = u'Moving \'%s\' from %s to %s' % (title, curr_path, new_path)
 
-    url = u'https://%s:%s@github.com/%s.git' % (user, pwd, url)
+    rewrite_files = None
+    if new_publish_status in (PUBLISHED, IN_REVIEW, DRAFT):
+        rewrite_files = {u'details.json': functools.partial(
+                                            publish_metadata_text,
+                                            new_status=new_publish_status)}
 
-    cmd = u'git clone %s %s' % (url, clone_dir)
-    subprocess.check_call(cmd.split())
+    with app.test_request_context(), remote.background_priority():
+        try:
+            commit_sha = remote.move_directory_on_github(
+                    remote.default_repo_path(), curr_path, new_path, move_msg,
+                    committer_name, committer_email,
+                    rewrite_files=rewrite_files)
+        except remote.RateLimitExceeded as err:
+            raise self.retry(exc=err, countdown=err.wait)
+
+    if commit_sha is None:
+        app.logger.error(u'Failed moving %s from %s to %s with github API',
+                         title, curr_path, new_path)
+        return False
+
+    if commit_sha is not remote.COMMIT_CONFLICT:
+        article_mod.move_article_in_index(curr_path, new_path)
+        return True
+
+    app.logger.warning(u'Branch kept changing while moving %s with github API, falling back to working clone',
+                       title)
+
+    clone_dir = working_clone_path()
+    timeout = utils.int_config('GIT_WORKING_CLONE_LOCK_TIMEOUT',
+                               DEFAULT_CLONE_LOCK_TIMEOUT)
+
+    with utils.file_lock(u'%s.lock' % (clone_dir.rstrip(os.sep)),
+                         timeout) as locked:
+        if not locked:
+            app.logger.error(u'Timed out waiting on working clone to move %s from %s to %s',
+                             title, curr_path, new_path)
+            return False
+
+        _update_working_clone(clone_dir)
+        if not _move_article_in_clone(clone_dir, curr_path, new_path, title,
+                                      committer_name, committer_email,
+                                      new_publish_status):
+            return False
+
+    mirror.mark_stale()
+    article_mod.move_article_in_index(curr_path, new_path)
+
+    return True
+
+
+def _move_article_in_clone(clone_dir, curr_path, new_path, title,
+                           committer_name, committer_email,
+                           new_publish_status=None):
+    """
+    Commit move of article on a temporary branch and push it to master
 
-    cwd = os.getcwd()
-    os.chdir(clone_dir)
+    See move_article for argument descriptions.  Caller must hold the lock on
+    the working clone.
 
-    cmd = u'git config user.name %s' % (committer_name)
-    subprocess.check_call(cmd.split())
+    :returns: True if article was moved or False if the new path is taken
+    """
 
-    cmd = u'git config user.email %s' % (committer_email)
-    subprocess.check_call(cmd.split())
+    # Start from a pristine copy of master regardless of what a previous
+    # failed move left behind.
+    branch = u'move-%s' % (uuid.uuid4().hex)
+    _git([u'checkout', u'--quiet', u'--force', u'-B', branch,
+          u'origin/master'], clone_dir)
+    _git([u'clean', u'--quiet', u'--force', u'-d', u'-x'], clone_dir)
 
     try:
-        dirname = os.path.dirname(new_path)
+        # git mv would move the article inside of the existing directory
+        if os.path.exists(os.path.join(clone_dir, new_path)):
+            app.logger.error(u'Cannot move %s to existing path %s', curr_path,
+                             new_path)
+            return False
+
+        dirname = os.path.join(clone_dir, os.path.dirname(new_path))
         try:
             os.makedirs(dirname)
         except OSError:
             if not os.path.isdir(dirname):
                 raise
 
-        mv_cmd = u'git mv %s %s' % (curr_path, new_path)
-        subprocess.check_call(mv_cmd.split(), cwd=clone_dir)
+        _git([u'mv', curr_path, new_path], clone_dir)
 
         if new_publish_status in (PUBLISHED, IN_REVIEW, DRAFT):
             md_file = os.path.join(clone_dir, new_path, u'details.json')
             change_publish_metadata(md_file, new_publish_status)
 
-            cmd = u'git add %s' % (md_file)
-            subprocess.check_call(cmd.split(), cwd=clone_dir)
+            _git([u'add', md_file], clone_dir)
 
-        move_msg = u'"Moving \'%s\' from %s to %s"' % (title, curr_path,
-                                                       new_path)
-        cmd = [u'git', u'commit', u'-m', move_msg]
+        # Pass the committer on the command line instead of saving it in the
+        # config of the shared clone
+        identity = [u'-c', u'user.name=%s' % (committer_name),
+                    u'-c', u'user.email=%s' % (committer_email)]
 
-        subprocess.check_call(cmd, cwd=clone_dir)
+        move_msg = u'Moving \'%s\' from %s to %s' % (title, curr_path, new_path)
+        _git(identity + [u'commit', u'--quiet', u'-m', move_msg], clone_dir)
 
         # Race condition here where we need to make sure to do a pull before a
         # push and the app itself could sneak commits in between.
         for cnt in xrange(RETRIES):
             try:
-                subprocess.check_call(u'git push origin master'.split(), cwd=clone_dir)
+                _git([u'push', u'--quiet', u'origin', u'HEAD:master'],
+                     clone_dir)
                 break
             except subprocess.CalledProcessError:
-                if cnt >= RETRIES:
+                if cnt == RETRIES - 1:
                     raise
 
                 # Must do this in 2 steps b/c heroku git version doesn't have
                 # the --commit option in git pull.
-                subprocess.check_call(u'git fetch'.split(), cwd=clone_dir)
-                cmd = [u'git', u'merge', u'origin/master',
-                       u'-m', u'"Merged %s' % (move_msg),
-                       u'--no-edit']
-                subprocess.check_call(cmd, cwd=clone_dir)
+                _git([u'fetch', u'--quiet', u'origin'], clone_dir)
+                _git(identity + [u'merge', u'origin/master',
+                                 u'-m', u'Merged %s' % (move_msg),
+                                 u'--no-edit'], clone_dir)
+
+        return True
     finally:
-        os.chdir(cwd)
-        shutil.rmtree(clone_dir)
+        _git([u'checkout', u'--quiet', u'--force', u'--detach',
+              u'origin/master'], clone_dir)
+        _git([u'branch', u'--quiet', u'-D', branch], clone_dir)
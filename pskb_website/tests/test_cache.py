@@ -0,0 +1,233 @@
+"""
+Tests for cache module
+"""
+
+from .. import cache
+from .. import lru
+
+
+class _FakeRedis(object):
+    """
+    Just enough of redis.Redis to count round trips
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.timeouts = {}
+        self.published = []
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+    def mget(self, keys):
+        self.round_trips += 1
+        return [self.data.get(str(key)) for key in keys]
+
+    def get(self, key):
+        return self.data.get(str(key))
+
+    def incr(self, key):
+        self.data[str(key)] = str(int(self.data.get(str(key), 0)) + 1)
+
+    def expire(self, key, timeout):
+        self.timeouts[str(key)] = timeout
+
+    def set(self, key, value, ex=None):
+        self.data[str(key)] = value
+        self.timeouts[str(key)] = ex
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(str(key), None)
+
+    def publish(self, channel, message):
+        self.published.append(message)
+
+    def exists(self, key):
+        return str(key) in self.data
+
+    def hgetall(self, key):
+        return dict(self.data.get(str(key), {}))
+
+    def hmset(self, key, mapping):
+        self.data.setdefault(str(key), {}).update(mapping)
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.data.get(str(key), {}).pop(field, None)
+
+    def sadd(self, key, *members):
+        self.data.setdefault(str(key), set()).update(members)
+
+    def smembers(self, key):
+        return set(self.data.get(str(key), set()))
+
+
+class _FakePipeline(object):
+    def __init__(self, redis_obj):
+        self.redis_obj = redis_obj
+        self.commands = []
+
+    def __getattr__(self, name):
+        def _queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+
+        return _queue
+
+    def execute(self):
+        self.redis_obj.round_trips += 1
+        return [getattr(self.redis_obj, name)(*args, **kwargs)
+                for name, args, kwargs in self.commands]
+
+
+def _patch_redis(monkeypatch, local_cache=None):
+    redis_obj = _FakeRedis()
+    monkeypatch.setattr(cache, 'redis_obj', redis_obj)
+    monkeypatch.setattr(cache, '_local_cache', lambda: local_cache)
+    monkeypatch.setattr(cache, '_local_cache_enabled',
+                        lambda: local_cache is not None)
+
+    return redis_obj
+
+
+def test_save_file_in_one_round_trip(monkeypatch):
+    redis_obj = _patch_redis(monkeypatch)
+
+    assert cache.save_file(u'faq.md', u'master', 'text', timeout=60)
+
+    # One to read generations, which are normally kept in memory
+    assert redis_obj.round_trips == 2
+
+    key = cache._file_key(u'faq.md', u'master')
+    assert redis_obj.timeouts[key] > 60
+    # Timeouts are jittered, see _save_all()
+    assert 60 <= redis_obj.timeouts[cache._fresh_key(key)] <= 66
+
+    redis_obj.round_trips = 0
+    assert cache.read_file_entry(u'faq.md', u'master') == ('text', True)
+    assert redis_obj.round_trips == 2
+
+    redis_obj.round_trips = 0
+    cache.delete_files([(u'faq.md', u'master'), (u'faq.md', u'other')])
+    assert redis_obj.round_trips == 2
+    assert redis_obj.data == {}
+
+
+def test_bumping_generation_invalidates_namespace(monkeypatch):
+    redis_obj = _patch_redis(monkeypatch)
+
+    cache.save_file(u'published/python/a', u'master', 'a')
+    cache.save_file(u'published/python/a', u'other', 'b')
+    cache.save_file(u'draft/python/c', u'master', 'c')
+    cache.save_file_listing(u'published', 'listing')
+
+    assert cache.bump_generation(cache.branch_namespace(u'other'))
+    assert cache.read_file(u'published/python/a', u'other') is None
+    assert cache.read_file(u'published/python/a', u'master') == 'a'
+
+    assert cache.bump_generation(cache.status_namespace(u'published'))
+    assert cache.read_file(u'published/python/a', u'master') is None
+    assert cache.read_file_listing(u'published') is None
+    assert cache.read_file(u'draft/python/c', u'master') == 'c'
+
+    assert cache.bump_generation(cache.GLOBAL_NAMESPACE)
+    assert cache.read_file(u'draft/python/c', u'master') is None
+
+    # Old entries are left to time out
+    assert len([k for k in redis_obj.data if not k.startswith('gen:')]) == 7
+
+
+def test_get_many_reads_missing_keys_from_redis(monkeypatch):
+    local_cache = lru.LRUCache(10, 60)
+    redis_obj = _patch_redis(monkeypatch, local_cache)
+
+    assert cache.save_many({'a': '1', 'b': '2'})
+    assert len(redis_obj.published) == 2
+
+    # Saved values are kept in memory
+    assert cache.get_many(['a', 'b']) == ['1', '2']
+    assert redis_obj.round_trips == 1
+
+    local_cache.delete('a')
+    assert cache.get_many(['a', 'b', 'c']) == ['1', '2', None]
+    assert redis_obj.round_trips == 2
+
+    # Rate limits and such skip memory
+    assert cache.get('b', local=False) == '2'
+    assert redis_obj.round_trips == 3
+
+
+def test_get_many_skips_keeping_values_changed_while_reading(monkeypatch):
+    local_cache = lru.LRUCache(10, 60)
+    redis_obj = _patch_redis(monkeypatch, local_cache)
+    redis_obj.data['a'] = 'old'
+
+    mget = redis_obj.mget
+
+    def _mget(keys):
+        values = mget(keys)
+
+        # Another greenlet saves a new value while the old one is on its way
+        monkeypatch.setattr(redis_obj, 'mget', mget)
+        assert cache.save_many({'a': 'new'})
+
+        return values
+
+    monkeypatch.setattr(redis_obj, 'mget', _mget)
+
+    assert cache.get_many(['a']) == ['old']
+    assert cache.get_many(['a']) == ['new']
+
+
+def test_large_values_compressed(monkeypatch):
+    redis_obj = _patch_redis(monkeypatch)
+
+    text = 'guide ' * 1000
+    assert cache.save_many({'large': text, 'small': 'guide'})
+
+    assert len(redis_obj.data['large']) < len(text)
+    assert redis_obj.data['small'] == 'guide'
+    assert cache.get_many(['large', 'small']) == [text, 'guide']
+
+    # Values saved before compression still read back as they were
+    redis_obj.data['old'] = text
+    assert cache.get('old') == text
+
+
+def test_missing_file_cleared_with_file(monkeypatch):
+    _patch_redis(monkeypatch)
+
+    assert not cache.is_missing_file(u'draft/python/a', u'master')
+    assert cache.save_missing_file(u'draft/python/a', u'master', timeout=60)
+    assert cache.is_missing_file(u'draft/python/a', u'master')
+    assert not cache.is_missing_file(u'draft/python/a', u'other')
+
+    # Saving the guide or a push event adding it deletes the file
+    cache.delete_file(u'draft/python/a', u'master')
+    assert not cache.is_missing_file(u'draft/python/a', u'master')
+
+
+def test_article_index_replaced_at_once(monkeypatch):
+    redis_obj = _patch_redis(monkeypatch)
+
+    # Callers search instead until the index is built
+    assert cache.save_article_index([(u'a', u'python', 'loc-a')])
+    assert cache.read_article_index(u'a') is None
+
+    assert cache.save_article_index([(u'b', u'python', 'loc-b'),
+                                     (u'b', u'go', 'loc-b-go')],
+                                    replace=True)
+    assert cache.read_article_index(u'a') == {}
+    assert cache.read_article_index(u'b') == {u'python': 'loc-b',
+                                              u'go': 'loc-b-go'}
+
+    assert cache.save_article_index([(u'c', u'python', 'loc-c')])
+    cache.delete_article_index(u'b', u'go')
+    assert cache.read_article_index(u'b') == {u'python': 'loc-b'}
+    assert cache.read_article_index(u'c') == {u'python': 'loc-c'}
+
+    assert cache.save_article_index([(u'b', u'python', 'loc-b')],
+                                    replace=True)
+    assert cache.read_article_index(u'c') == {}
+    assert redis_obj.smembers(cache.ARTICLE_INDEX_TITLES_KEY) == set([u'b'])
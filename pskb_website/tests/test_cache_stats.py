@@ -0,0 +1,28 @@
+"""
+Tests for cache_stats module
+"""
+
+from .. import cache_stats
+
+
+def test_record_counts_and_latency_buckets():
+    cache_stats.record('test-family', hits=2, local_hits=1, misses=1,
+                       bytes_read=100, seconds=0.0015)
+    cache_stats.record('test-family', writes=1, bytes_written=50,
+                       seconds=5)
+    cache_stats.record('test-family', errors=1)
+
+    stats = cache_stats.stats()['test-family']
+
+    assert stats['hits'] == 2
+    assert stats['local_hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['errors'] == 1
+    assert stats['writes'] == 1
+    assert stats['bytes_read'] == 100
+    assert stats['bytes_written'] == 50
+
+    # Only round trips with a time are in the histogram
+    assert sum(stats['latency_ms'].values()) == 2
+    assert stats['latency_ms']['2'] == 1
+    assert stats['latency_ms']['inf'] == 1
@@ -0,0 +1,98 @@
+"""
+Tests for gfm markdown renderer
+"""
+
+import re
+
+from .. import gfm
+
+
+def test_heading_anchors():
+    html = gfm.render(u'# Hello *World*\n\n## Hello World')
+
+    assert u'<a id="user-content-hello-world" class="anchor" href="#hello-world"' in html
+    assert u'Hello <em>World</em></h1>' in html
+    assert u'href="#hello-world-1"' in html
+
+
+def test_fenced_code_is_escaped():
+    html = gfm.render(u'```python\nprint "<b>"\n```')
+
+    assert html == u'<pre lang="python"><code>print "&lt;b&gt;"\n</code></pre>'
+
+
+def test_inline_elements():
+    html = gfm.render(u'`a*b*` **bold** _em_ ~~del~~ snake_case_name')
+
+    assert html == (u'<p><code>a*b*</code> <strong>bold</strong> <em>em</em> '
+                    u'<del>del</del> snake_case_name</p>')
+
+
+def test_links():
+    html = gfm.render(u'[a](http://a.com "T") [b][ref] see www.b.com.\n\n'
+                      u'[ref]: http://ref.com')
+
+    assert u'<a href="http://a.com" title="T">a</a>' in html
+    assert u'<a href="http://ref.com">b</a>' in html
+    assert u'<a href="http://www.b.com">www.b.com</a>.' in html
+
+
+def test_table_alignment():
+    html = gfm.render(u'| a | b |\n|:-:|--:|\n| 1 | 2 |')
+
+    assert u'<th align="center">a</th>' in html
+    assert u'<td align="right">2</td>' in html
+
+
+def test_lists():
+    html = gfm.render(u'* one\n* [x] two\n    * nested\n\n3. a\n4. b')
+
+    assert html.startswith(u'<ul>\n<li>one</li>\n<li class="task-list-item">')
+    assert u'disabled checked> two' in html
+    assert u'<ul>\n<li>nested</li>\n</ul>' in html
+    assert u'<ol start="3">\n<li>a</li>\n<li>b</li>\n</ol>' in html
+
+
+def test_unsafe_html_escaped():
+    html = gfm.render(u'<div onclick="x()">hi</div>\n<script>alert(1)</script>\n\n'
+                      u'[x](javascript:alert(1))')
+
+    assert u'<div>hi</div>' in html
+    assert u'&lt;script&gt;' in html
+    assert u'<a href="">x</a>' in html
+
+
+_SCRIPTING_TAG_RE = re.compile(
+        r'<(?:svg|button)|<[^>]*(?:javascript|onerror|onload|xlink|formaction)',
+        re.IGNORECASE)
+
+
+def test_scripting_payloads_removed():
+    payloads = (u'<a href="jav&#x61;script:alert(1)">x</a>',
+                u'<a href="jav&#97script:alert(1)">x</a>',
+                u'<a href="java\tscript:alert(1)">x</a>',
+                u'<a href="javascript&colon;alert(1)">x</a>',
+                u'<svg><a xlink:href="javascript:alert(1)">x</a></svg>',
+                u'<button formaction="javascript:alert(1)">x</button>',
+                u'<img src=x onerror=alert(1)>',
+                u'<svg/onload=alert(1)>',
+                u'[x](jav&#x61;script:alert(1))',
+                u'<!--><img src=x onerror=alert(1)>-->',
+                u'<!-- --!><img src=x onerror=alert(1)> -->',
+                u'<div>\n<!--><img src=x onerror=alert(1)>-->\n</div>',
+                u'<div>\n<!-- --!><img src=x onerror=alert(1)> -->\n</div>',
+                u'<!-- <img src=x onerror=alert(1)>')
+
+    for payload in payloads:
+        html = gfm.render(payload)
+
+        # Escaped tags showing up as text are fine, real tags are not
+        assert not _SCRIPTING_TAG_RE.search(html), html
+
+
+def test_allowed_html_kept():
+    html = gfm.render(u'<div align="center"><a href="https://a.b/c?d=1&amp;e=2" '
+                      u'title="t">x</a> <img src="/i.png" width=10></div>')
+
+    assert html == (u'<div align="center"><a href="https://a.b/c?d=1&amp;e=2" '
+                    u'title="t">x</a> <img src="/i.png" width="10"></div>')
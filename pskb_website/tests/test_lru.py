@@ -0,0 +1,58 @@
+"""
+Tests for lru module
+"""
+
+from .. import lru
+
+
+def test_least_recently_used_evicted_first():
+    cache = lru.LRUCache(2, 60)
+
+    cache.set('a', '1')
+    cache.set('b', '2')
+
+    # Reading a makes b the least recently used
+    assert cache.get('a') == '1'
+
+    cache.set('c', '3')
+
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get('a') == '1'
+    assert cache.get('c') == '3'
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(lru.time, 'time', lambda: now[0])
+
+    cache = lru.LRUCache(10, 60)
+    cache.set('a', '1')
+
+    # Timeouts are never longer than the default
+    cache.set('b', '2', timeout=600)
+    cache.set('c', '3', timeout=5)
+
+    now[0] += 10
+    assert cache.get('a') == '1'
+    assert cache.get('b') == '2'
+    assert cache.get('c') is None
+
+    now[0] += 60
+    assert cache.get('a') is None
+    assert cache.get('b') is None
+    assert len(cache) == 0
+
+
+def test_delete_and_disabled():
+    cache = lru.LRUCache(10, 60)
+    cache.set('a', '1')
+    cache.set('b', '2')
+
+    cache.delete('a', 'missing')
+    assert cache.get('a') is None
+    assert cache.get('b') == '2'
+
+    disabled = lru.LRUCache(0, 60)
+    disabled.set('a', '1')
+    assert disabled.get('a') is None
@@ -0,0 +1,124 @@
+"""
+Tests for local git mirror
+"""
+
+import os
+import subprocess
+
+import pytest
+
+from .. import app
+from .. import catfile
+from .. import lru
+from .. import mirror
+
+
+@pytest.fixture
+def repo(tmpdir, monkeypatch):
+    work = str(tmpdir.join('work'))
+    bare = str(tmpdir.join('mirror.git'))
+
+    def _git(*args, **kwargs):
+        env = dict(os.environ, GIT_AUTHOR_NAME='Jane', GIT_COMMITTER_NAME='Jane',
+                   GIT_AUTHOR_EMAIL=kwargs.get('email', 'jane@example.com'),
+                   GIT_COMMITTER_EMAIL=kwargs.get('email', 'jane@example.com'))
+        subprocess.check_call(('git',) + args, cwd=work, env=env)
+
+    os.makedirs(os.path.join(work, 'published', 'python'))
+    _git('init', '-q', '-b', 'master')
+
+    with open(os.path.join(work, 'published', 'python', 'article.md'), 'w') as file_obj:
+        file_obj.write('# Title\n')
+
+    _git('add', '.')
+    _git('commit', '-q', '-m', 'Add', email='1+jane@users.noreply.github.com')
+    subprocess.check_call(['git', 'clone', '-q', '--bare', work, bare])
+
+    monkeypatch.setitem(app.config, 'GIT_MIRROR_PATH', bare)
+    monkeypatch.setitem(app.config, 'REPO_OWNER', 'owner')
+    monkeypatch.setitem(app.config, 'REPO_NAME', 'guides')
+
+    # Pretend we just fetched so tests never talk to github
+    monkeypatch.setattr(mirror, 'refresh', lambda force=False: True)
+
+    return bare
+
+
+def test_read_branch_and_files(repo):
+    sha = mirror.read_branch(u'master')
+
+    assert len(sha) == 40
+    assert mirror.read_branch(u'missing') is None
+    assert [path for path, _ in mirror.files(sha, u'article.md')] == [
+            u'owner/guides/published/python/article.md']
+
+
+def test_read_file(repo):
+    sha, text = mirror.read_file(u'published/python/article.md', u'master')
+
+    assert text == u'# Title\n'
+    assert mirror.file_sha(u'published/python/article.md', u'master') == sha
+    assert mirror.file_sha(u'published/python/other.md', u'master') is None
+    assert mirror.file_sha(u'published/python', u'master') is None
+    assert mirror.read_file(u'published/python/other.md', u'master') is None
+    assert mirror.read_file(u'published/python/other.md', u'master',
+                            missing=False) is False
+    assert mirror.last_modified(u'published/python/article.md',
+                                u'master').endswith('GMT')
+
+
+def test_file_contributors_uses_noreply_login(repo):
+    contribs = mirror.file_contributors(u'published/python/article.md',
+                                        u'master')
+
+    assert contribs == {'authors': set([(u'Jane', u'jane')]),
+                        'committers': set([(u'Jane', u'jane')])}
+
+
+def test_file_history_read_once_per_commit(repo, monkeypatch):
+    commands = []
+    git = mirror._git
+
+    def _git(args, *more_args, **kwargs):
+        commands.append(args[0])
+        return git(args, *more_args, **kwargs)
+
+    monkeypatch.setattr(mirror, '_git', _git)
+    monkeypatch.setattr(mirror, '_histories', lru.LRUCache(10, 60))
+
+    for _ in xrange(2):
+        assert mirror.last_modified(u'published/python/article.md',
+                                    u'master').endswith('GMT')
+        assert mirror.file_contributors(u'published/python/article.md',
+                                        u'master') is not None
+
+    assert commands == ['log']
+
+
+def test_serves_only_main_repo(repo):
+    assert mirror.serves('owner/guides')
+    assert not mirror.serves('other/guides')
+
+
+def test_catfile_reader_reused_after_abandoned_stream(repo):
+    sha, _ = mirror.read_file(u'published/python/article.md', u'master')
+
+    chunks = catfile.stream_object(repo, sha, chunk_size=2)
+    assert next(chunks) == '# '
+    chunks.close()
+
+    # Leftovers of the abandoned stream must not leak into the next lookup
+    assert mirror.read_blob(sha) == u'# Title\n'
+    assert catfile.read_header(repo, u'refs/heads/missing') is None
+
+
+def test_read_directory_at_commit(repo):
+    sha = mirror.read_branch(u'master')
+
+    tree_sha, files = mirror.read_directory_at_commit(u'published', sha)
+
+    assert len(tree_sha) == 40
+    assert [(path, mode) for path, mode, _ in files] == [
+            (u'python/article.md', '100644')]
+    assert mirror.read_directory_at_commit(u'draft', sha) is None
+    assert mirror.has_commit(sha)
@@ -0,0 +1,468 @@
+"""
+Tests for remote module
+"""
+
+import base64
+import json
+
+from requests.structures import CaseInsensitiveDict
+
+from .. import http_pool
+from .. import lru
+from .. import remote
+
+
+def _fake_response(status, body='', headers=None):
+    headers = CaseInsensitiveDict(headers or {})
+    resp = http_pool.pooled_response(status, headers)
+    return remote.OAuthResponse(resp, body, None)
+
+
+def _patch_cache(monkeypatch):
+    store = {}
+
+    monkeypatch.setattr(remote.cache, 'read_conditional_response',
+                        lambda key: store.get(key))
+
+    def _save(key, value):
+        store[key] = value
+
+    monkeypatch.setattr(remote.cache, 'save_conditional_response', _save)
+
+    return store
+
+
+def test_conditional_request_key_ignores_other_headers():
+    key_1 = remote._conditional_request_key('repos/a/b', data={'ref': u'master'})
+    key_2 = remote._conditional_request_key('repos/a/b', headers={'X-Other': '1'},
+                                            data={'ref': u'master'})
+    key_3 = remote._conditional_request_key('repos/a/b',
+                                            headers={'Accept': 'html'},
+                                            data={'ref': u'master'})
+
+    assert key_1 == key_2
+    assert key_1 != key_3
+
+
+def test_conditional_get_revalidates_saved_response(monkeypatch):
+    store = _patch_cache(monkeypatch)
+    requests = []
+
+    body = json.dumps({'sha': 'abc'})
+    responses = [
+        _fake_response(200, body, {'ETag': '"123"',
+                                   'Content-Type': 'application/json'}),
+        _fake_response(304, '', {'ETag': '"123"'}),
+    ]
+
+    def _get(url, headers=None, data=None, token=None):
+        requests.append(headers)
+        return responses.pop(0)
+
+    monkeypatch.setattr(remote.github, 'get', _get)
+
+    resp = remote._conditional_get('repos/a/b', data={'ref': u'master'})
+    assert resp.status == 200
+    assert resp.data == {'sha': 'abc'}
+    assert len(store) == 1
+    assert 'If-None-Match' not in requests[0]
+
+    resp = remote._conditional_get('repos/a/b', data={'ref': u'master'})
+    assert requests[1]['If-None-Match'] == '"123"'
+    assert resp.status == 200
+    assert resp.data == {'sha': 'abc'}
+    assert resp._resp.headers.get('etag') == '"123"'
+
+
+def test_conditional_get_skips_saving_without_validators(monkeypatch):
+    store = _patch_cache(monkeypatch)
+
+    monkeypatch.setattr(remote.github, 'get',
+                        lambda *args, **kwargs: _fake_response(200, '{}'))
+
+    remote._conditional_get('repos/a/b')
+    assert not store
+
+
+def test_render_markdown_cached_by_sha(monkeypatch):
+    store = {}
+
+    monkeypatch.setattr(remote.cache, 'read_rendered_markdown',
+                        lambda sha, version: store.get((sha, version)))
+
+    def _save(sha, version, html):
+        store[(sha, version)] = html
+
+    monkeypatch.setattr(remote.cache, 'save_rendered_markdown', _save)
+
+    assert remote.render_markdown(u'*hi*', sha='abc') == u'<p><em>hi</em></p>'
+    assert store[('abc', remote.gfm.VERSION)] == '<p><em>hi</em></p>'
+
+    # Text is ignored once the SHA is cached
+    assert remote.render_markdown(u'other', sha='abc') == u'<p><em>hi</em></p>'
+
+
+def test_commit_files_retries_when_branch_moves(monkeypatch):
+    heads = ['parent-1', 'parent-2']
+    posts = []
+    patches = []
+
+    def _conditional_get(url, headers=None, data=None, token=None):
+        if '/git/refs/heads/' in url:
+            return _fake_response(200, json.dumps({'object': {'sha': heads.pop(0)}}),
+                                  {'Content-Type': 'application/json'})
+
+        return _fake_response(200, json.dumps({'tree': {'sha': 'tree-1'}}),
+                              {'Content-Type': 'application/json'})
+
+    def _post(url, data=None, format=None, token=None):
+        posts.append((url, data))
+        return _fake_response(201, json.dumps({'sha': 'new-%d' % (len(posts))}),
+                              {'Content-Type': 'application/json'})
+
+    def _patch(url, data=None, format=None, token=None):
+        patches.append(data)
+        return _fake_response(422 if len(patches) == 1 else 200, '{}',
+                              {'Content-Type': 'application/json'})
+
+    monkeypatch.setattr(remote, '_conditional_get', _conditional_get)
+    monkeypatch.setattr(remote.github, 'post', _post)
+    monkeypatch.setattr(remote.github, 'patch', _patch)
+
+    def _build(read):
+        return {u'o/r/a.md': u'text', u'o/r/old.md': None}
+
+    sha = remote.commit_files_to_github(u'o/r', u'msg', None, None, _build)
+
+    assert sha == 'new-4'
+    assert patches[-1] == {'sha': 'new-4', 'force': False}
+
+    # Second attempt is built on the new HEAD
+    assert posts[3][1]['parents'] == ['parent-2']
+    assert posts[2][1]['tree'] == [
+            {'path': u'a.md', 'mode': '100644', 'type': 'blob', 'content': u'text'},
+            {'path': u'old.md', 'mode': '100644', 'type': 'blob', 'sha': None}]
+
+
+def test_commit_files_skips_commit_without_changes(monkeypatch):
+    monkeypatch.setattr(remote, '_read_ref_from_github', lambda *args: 'head')
+    monkeypatch.setattr(remote, '_read_commit_tree_from_github',
+                        lambda *args: 'tree')
+
+    assert remote.commit_files_to_github(u'o/r', u'msg', None, None,
+                                         lambda read: {}) == 'head'
+    assert remote.commit_files_to_github(u'o/r', u'msg', None, None,
+                                         lambda read: None) is None
+
+
+def test_move_directory_reuses_tree_and_rewrites_files(monkeypatch):
+    directories = {
+        u'draft/python/foo': ('tree-foo', [(u'article.md', '100644', 'a'),
+                                           (u'details.json', '100644', 'b')]),
+    }
+    subtrees = []
+
+    listing = [[u'draft/python/foo/article.md', 'a'],
+               [u'draft/python/foo/details.json', 'b'],
+               [u'published/python/foobar/article.md', 'c']]
+
+    monkeypatch.setattr(remote, '_read_directory_at_commit',
+                        lambda repo, path, sha: directories.get(path))
+    monkeypatch.setattr(remote, '_read_tree_listing',
+                        lambda repo, sha: listing)
+    monkeypatch.setattr(remote, '_file_details_at_commit',
+                        lambda path, sha: remote.file_details(path, sha, 'b',
+                                                              None, None,
+                                                              u'old'))
+
+    def _create_tree(repo_path, base_tree_sha, entries, token):
+        subtrees.append((base_tree_sha, entries))
+        return 'tree-new'
+
+    monkeypatch.setattr(remote, '_create_tree_on_github', _create_tree)
+    monkeypatch.setattr(remote, '_commit_tree_changes',
+                        lambda repo, msg, name, email, build, branch,
+                        report_conflict: build('head'))
+
+    entries = remote.move_directory_on_github(
+            u'o/r', u'draft/python/foo', u'published/python/foo', u'msg',
+            None, None, rewrite_files={u'details.json': lambda text: u'new'})
+
+    assert subtrees == [('tree-foo', [{'path': u'details.json',
+                                       'mode': '100644', 'type': 'blob',
+                                       'content': u'new'}])]
+    assert entries == [
+        {'path': u'published/python/foo', 'mode': '040000', 'type': 'tree',
+         'sha': 'tree-new'},
+        {'path': u'draft/python/foo/article.md', 'mode': '100644',
+         'type': 'blob', 'sha': None},
+        {'path': u'draft/python/foo/details.json', 'mode': '100644',
+         'type': 'blob', 'sha': None}]
+
+    # Never move on top of an existing directory or when it can't be checked
+    listing.append([u'published/python/foo/article.md', 'd'])
+    assert remote.move_directory_on_github(u'o/r', u'draft/python/foo',
+                                           u'published/python/foo', u'msg',
+                                           None, None) is None
+
+    listing = None
+    assert remote.move_directory_on_github(u'o/r', u'draft/python/foo',
+                                           u'published/python/bar', u'msg',
+                                           None, None) is None
+
+
+def test_move_directory_reports_conflicts(monkeypatch):
+    monkeypatch.setattr(remote, '_read_ref_from_github', lambda *args: 'head')
+    monkeypatch.setattr(remote, '_read_commit_tree_from_github',
+                        lambda *args: 'tree')
+    monkeypatch.setattr(remote, '_read_directory_at_commit',
+                        lambda repo, path, sha: ('tree-foo', []))
+    monkeypatch.setattr(remote, '_read_tree_listing', lambda repo, sha: [])
+    monkeypatch.setattr(remote, '_create_tree_on_github', lambda *args: 'tree')
+    monkeypatch.setattr(remote, '_create_commit_on_github',
+                        lambda *args: 'commit')
+
+    statuses = []
+    monkeypatch.setattr(remote, '_update_ref_on_github',
+                        lambda *args: statuses[-1])
+
+    statuses.append(422)
+    assert remote.move_directory_on_github(
+            u'o/r', u'draft/python/foo', u'published/python/foo', u'msg',
+            None, None) is remote.COMMIT_CONFLICT
+
+    statuses.append(500)
+    assert remote.move_directory_on_github(
+            u'o/r', u'draft/python/foo', u'published/python/foo', u'msg',
+            None, None) is None
+
+
+def test_read_tree_listing_walks_truncated_trees(monkeypatch):
+    trees = {
+        'root': {'truncated': True, 'tree': [
+            {'path': 'README.md', 'type': 'blob', 'sha': 'readme'},
+            {'path': 'draft', 'type': 'tree', 'sha': 'draft'},
+            {'path': 'published', 'type': 'tree', 'sha': 'published'},
+        ]},
+        'draft': {'truncated': False, 'tree': [
+            {'path': 'a', 'type': 'tree', 'sha': 'a'},
+            {'path': 'a/details.json', 'type': 'blob', 'sha': 'a-details'},
+        ]},
+        'published': {'truncated': False, 'tree': [
+            {'path': 'b/details.json', 'type': 'blob', 'sha': 'b-details'},
+        ]},
+    }
+    requests = []
+    listings = {}
+
+    def _conditional_get(url, headers=None, data=None, token=None):
+        requests.append(url)
+        sha = url.split('/')[-1].split('?')[0]
+        return _fake_response(200, json.dumps(trees[sha]),
+                              {'Content-Type': 'application/json'})
+
+    monkeypatch.setattr(remote, '_conditional_get', _conditional_get)
+    monkeypatch.setattr(remote.cache, 'read_tree_listing', listings.get)
+    monkeypatch.setattr(remote.cache, 'save_tree_listing',
+                        listings.__setitem__)
+
+    listing = remote._read_tree_listing('o/r', 'root')
+    assert [tuple(item) for item in listing] == [
+        ('README.md', 'readme'),
+        ('draft/a/details.json', 'a-details'),
+        ('published/b/details.json', 'b-details')]
+
+    assert 'repos/o/r/git/trees/root' in requests
+    assert set(listings) == set(['root', 'draft', 'published'])
+
+    # Unchanged subtrees come from the cache
+    del listings['root']
+    del requests[:]
+    trees['root']['tree'].append({'path': 'in-review', 'type': 'tree',
+                                  'sha': 'review'})
+    trees['review'] = {'truncated': False, 'tree': []}
+
+    remote._read_tree_listing('o/r', 'root')
+    assert not [url for url in requests if 'draft' in url or
+                'published' in url]
+
+
+def test_read_blob_cached_by_sha(monkeypatch):
+    blobs = {}
+    requests = []
+
+    monkeypatch.setattr(remote.cache, 'read_blob', blobs.get)
+    monkeypatch.setattr(remote.cache, 'save_blob', blobs.__setitem__)
+    monkeypatch.setattr(remote.mirror, 'can_read', lambda repo: False)
+
+    def _get(url, headers=None, data=None, token=None):
+        requests.append(url)
+        body = json.dumps({'content': base64.b64encode(u'{"title": "\xe9"}'.encode('utf-8')),
+                           'encoding': 'base64'})
+        return _fake_response(200, body, {'Content-Type': 'application/json'})
+
+    monkeypatch.setattr(remote.github, 'get', _get)
+
+    assert remote.read_blob_from_github('o/r', 'abc') == u'{"title": "\xe9"}'
+    assert remote.read_blob_from_github('o/r', 'abc') == u'{"title": "\xe9"}'
+    assert requests == ['repos/o/r/git/blobs/abc']
+
+
+def test_only_404_reported_as_file_not_found(monkeypatch):
+    monkeypatch.setattr(remote.mirror, 'can_read', lambda repo: False)
+
+    statuses = []
+    monkeypatch.setattr(remote, '_conditional_get',
+                        lambda url, headers=None, data=None, token=None: _fake_response(statuses[-1]))
+
+    for status in (401, 403, 500):
+        statuses.append(status)
+        assert remote.file_details_from_github('o/r/a/article.md',
+                                               report_404=True) is None
+
+    statuses.append(404)
+    assert remote.file_details_from_github('o/r/a/article.md',
+                                           report_404=True) is remote.FILE_NOT_FOUND
+    assert remote.file_details_from_github('o/r/a/article.md') is None
+
+
+def test_read_file_text_resolves_sha_from_tree_listing(monkeypatch):
+    listings = []
+
+    def _read_tree_listing(repo, sha):
+        listings.append(sha)
+        return [['draft/a/details.json', 'meta']]
+
+    monkeypatch.setattr(remote.mirror, 'can_read', lambda repo: False)
+    monkeypatch.setattr(remote, 'repo_sha_from_github',
+                        lambda repo, branch: 'head')
+    monkeypatch.setattr(remote, '_read_tree_listing', _read_tree_listing)
+    monkeypatch.setattr(remote, '_tree_indexes', lru.LRUCache(2, 60))
+    monkeypatch.setattr(remote, 'read_blob_from_github',
+                        lambda repo, sha: {'meta': u'{}'}.get(sha))
+
+    assert remote.read_file_text_from_github('o/r/draft/a/details.json') == u'{}'
+    assert remote.read_file_text_from_github('o/r/draft/b/details.json') is None
+    assert listings == ['head']
+
+
+def test_rate_limit_saved_from_responses(monkeypatch):
+    limits = {}
+
+    monkeypatch.setattr(remote.time, 'time', lambda: 1000)
+    monkeypatch.setattr(remote.cache, 'save_rate_limit',
+                        lambda key, value, timeout: limits.__setitem__(key, (value, timeout)))
+    monkeypatch.setattr(remote.cache, 'read_rate_limit',
+                        lambda key: limits.get(key, (None, ))[0])
+
+    key = remote._rate_limit_key({'Authorization': 'Bearer abc'})
+    assert key != remote._rate_limit_key({'Authorization': 'Bearer def'})
+    assert 'abc' not in key
+
+    remote._save_rate_limit(key, CaseInsensitiveDict({'X-RateLimit-Remaining': '42',
+                                                      'X-RateLimit-Reset': '1600'}))
+    assert limits[key][1] == 600
+    assert remote._read_rate_limit(key) == (42, 1600)
+
+    # Responses without rate limit headers are ignored
+    remote._save_rate_limit('other', CaseInsensitiveDict())
+    assert 'other' not in limits
+
+
+def test_background_requests_wait_for_rate_limit(monkeypatch):
+    sleeps = []
+    limits = {'key': (0, 1000)}
+
+    monkeypatch.setattr(remote.time, 'time', lambda: 1000)
+    monkeypatch.setattr(remote.time, 'sleep', sleeps.append)
+    monkeypatch.setattr(remote, '_read_rate_limit', limits.get)
+    monkeypatch.setitem(remote.app.config, 'GITHUB_RATE_LIMIT_RESERVE', 100)
+    monkeypatch.setitem(remote.app.config, 'GITHUB_BACKGROUND_MAX_WAIT', 60)
+
+    # Plenty left or rate limit already reset
+    remote._wait_for_rate_limit('missing')
+    remote._wait_for_rate_limit('key')
+    limits['key'] = (1000, 2000)
+    remote._wait_for_rate_limit('key')
+    assert not sleeps
+
+    # Spread out over the time left once close to the reserve
+    limits['key'] = (150, 1100)
+    remote._wait_for_rate_limit('key')
+    assert sleeps == [2]
+
+    # Wait for reset when it's soon enough and defer otherwise
+    limits['key'] = (100, 1030)
+    remote._wait_for_rate_limit('key')
+    assert sleeps[-1] == 30
+
+    limits['key'] = (100, 2000)
+    try:
+        remote._wait_for_rate_limit('key')
+    except remote.RateLimitExceeded as err:
+        assert err.wait == 1000
+    else:
+        assert False, 'Expected RateLimitExceeded'
+
+
+def test_request_priority_shared_with_request_context():
+    assert remote.request_priority() == remote.BACKGROUND
+
+    with remote.app.test_request_context():
+        assert remote.request_priority() == remote.INTERACTIVE
+
+        with remote.background_priority():
+            assert remote.request_priority() == remote.BACKGROUND
+
+            # Copies made by concurrent_map share the environment
+            with remote.flask._request_ctx_stack.top.copy():
+                assert remote.request_priority() == remote.BACKGROUND
+
+        assert remote.request_priority() == remote.INTERACTIVE
+
+
+def test_degraded_after_failures_until_success(monkeypatch):
+    monkeypatch.setattr(remote.time, 'time', lambda: 1000)
+    monkeypatch.setattr(remote, '_read_rate_limit', lambda key: None)
+    monkeypatch.setattr(remote.mirror, 'can_read', lambda repo: False)
+    monkeypatch.setitem(remote.app.config, 'GITHUB_FAILURE_THRESHOLD', 2)
+    monkeypatch.setitem(remote.app.config, 'GITHUB_UNHEALTHY_TIMEOUT', 60)
+    monkeypatch.setattr(remote, '_health', {'failures': 0,
+                                            'unhealthy_until': 0})
+
+    remote._record_failure()
+    assert not remote.is_degraded()
+
+    remote._record_failure()
+    assert remote.is_degraded()
+    assert remote._health['unhealthy_until'] == 1060
+
+    # Recovers on its own
+    monkeypatch.setattr(remote.time, 'time', lambda: 1061)
+    assert not remote.is_degraded()
+
+    # Or with the next successful request
+    remote._record_failure()
+    assert remote.is_degraded()
+    remote._record_success()
+    assert not remote.is_degraded()
+
+
+def test_degraded_when_rate_limit_low(monkeypatch):
+    limits = {}
+
+    monkeypatch.setattr(remote.time, 'time', lambda: 1000)
+    monkeypatch.setattr(remote, '_read_rate_limit', lambda key: limits.get('owner'))
+    monkeypatch.setattr(remote.mirror, 'can_read', lambda repo: repo == 'o/mirror')
+    monkeypatch.setitem(remote.app.config, 'GITHUB_DEGRADED_RATE_LIMIT', 10)
+
+    assert not remote.is_degraded()
+
+    limits['owner'] = (5, 2000)
+    assert remote.is_degraded()
+    assert remote.is_degraded('o/r')
+    assert not remote.is_degraded('o/mirror')
+
+    # Rate limit already reset
+    limits['owner'] = (5, 900)
+    assert not remote.is_degraded()
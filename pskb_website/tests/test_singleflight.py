@@ -0,0 +1,132 @@
+"""
+Tests for singleflight module
+"""
+
+import threading
+
+from .. import singleflight
+
+
+def test_concurrent_calls_share_result():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def _read(path):
+        calls.append(path)
+        started.set()
+        release.wait()
+        return path.upper()
+
+    def _call():
+        results.append(singleflight.run('read:a', _read, 'a'))
+
+    coalesced = singleflight.stats()['coalesced']
+
+    leader = threading.Thread(target=_call)
+    leader.start()
+    started.wait()
+
+    followers = [threading.Thread(target=_call) for _ in xrange(3)]
+    for thread in followers:
+        thread.start()
+
+    # Wait for followers to find the call in progress
+    while singleflight.stats()['coalesced'] < coalesced + 3:
+        threading.Event().wait(0.01)
+
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert calls == ['a']
+    assert results == ['A'] * 4
+
+    # Nothing running so next call runs again
+    assert singleflight.run('read:a', _read, 'a') == 'A'
+    assert calls == ['a', 'a']
+
+
+def test_errors_raised_in_every_caller():
+    @singleflight.single_flight('fail')
+    def _fail(value):
+        raise ValueError(value)
+
+    try:
+        _fail(1)
+    except ValueError as err:
+        assert err.args == (1, )
+    else:
+        assert False, 'Expected ValueError'
+
+
+def test_caller_errors_not_shared():
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    class _Deferred(singleflight.CallerError):
+        pass
+
+    def _read(path, deferred):
+        if deferred:
+            started.set()
+            release.wait()
+            raise _Deferred(path)
+
+        return path.upper()
+
+    def _lead():
+        try:
+            singleflight.run('read:b', _read, 'b', True)
+        except _Deferred:
+            results.append('deferred')
+
+    leader = threading.Thread(target=_lead)
+    leader.start()
+    started.wait()
+
+    # Follower would run its own call differently, i.e. at another priority
+    coalesced = singleflight.stats()['coalesced']
+    follower = threading.Thread(
+            target=lambda: results.append(singleflight.run('read:b', _read,
+                                                           'b', False)))
+    follower.start()
+
+    while singleflight.stats()['coalesced'] < coalesced + 1:
+        threading.Event().wait(0.01)
+
+    release.set()
+    for thread in (leader, follower):
+        thread.join()
+
+    assert sorted(results) == ['B', 'deferred']
+
+
+def test_lease_waits_on_other_process(monkeypatch):
+    leases = ['other']
+    released = []
+
+    def _acquire(key, token, timeout):
+        # Other process releases lease after first try
+        if leases:
+            leases.pop()
+            return False
+
+        return True
+
+    monkeypatch.setattr(singleflight.cache, 'acquire_lease', _acquire)
+    monkeypatch.setattr(singleflight.cache, 'release_lease',
+                        lambda key, token: released.append(key))
+    monkeypatch.setattr(singleflight, 'LEASE_POLL_INTERVAL', 0)
+
+    @singleflight.single_flight('leased', lease=True)
+    def _read(value):
+        return value
+
+    waits = singleflight.stats()['lease_waits']
+
+    assert _read(1) == 1
+    assert singleflight.stats()['lease_waits'] == waits + 1
+    assert len(released) == 1
@@ -0,0 +1,138 @@
+"""
+Tests for celery tasks
+"""
+
+import json
+import os
+import subprocess
+
+from .. import tasks
+
+
+def _git(cwd, *args):
+    subprocess.check_call(('git', '-c', 'user.name=a', '-c', 'user.email=a@b') + args,
+                          cwd=cwd)
+
+
+def test_move_article_in_clone_pushes_from_temporary_branch(tmpdir):
+    origin = str(tmpdir.join('origin.git'))
+    seed = str(tmpdir.join('seed'))
+    work = str(tmpdir.join('work'))
+
+    subprocess.check_call(['git', 'init', '-q', '--bare', '-b', 'master', origin])
+    subprocess.check_call(['git', 'clone', '-q', origin, seed])
+
+    os.makedirs(os.path.join(seed, 'draft', 'python', 'foo'))
+    with open(os.path.join(seed, 'draft', 'python', 'foo', 'details.json'), 'w') as file_obj:
+        file_obj.write(json.dumps({'_publish_status': 'draft'}))
+
+    _git(seed, 'add', '.')
+    _git(seed, 'commit', '-q', '-m', 'init')
+    _git(seed, 'push', '-q', 'origin', 'master')
+    subprocess.check_call(['git', 'clone', '-q', origin, work])
+
+    tasks._move_article_in_clone(work, u'draft/python/foo',
+                                 u'published/python/foo', u'Foo', u'Jane',
+                                 u'jane@example.com', tasks.PUBLISHED)
+
+    details = subprocess.check_output(
+            ['git', 'show', 'master:published/python/foo/details.json'],
+            cwd=origin)
+    assert json.loads(details)['_publish_status'] == tasks.PUBLISHED
+
+    # Temporary branch is removed so the clone is ready for the next move
+    branches = subprocess.check_output(['git', 'branch'], cwd=work)
+    assert 'move-' not in branches
+
+
+def test_warm_cache_refreshes_what_expires_soon(monkeypatch):
+    files = {tasks.file_mod.PUB_FILENAME: 1000,
+             tasks.file_mod.IN_REVIEW_FILENAME: 10}
+    articles = {u'published/python/hot': 10, u'published/python/warm': 1000}
+    refreshed = []
+
+    monkeypatch.setattr(tasks.cache, 'file_expires_in',
+                        lambda path, branch: files.get(path))
+    monkeypatch.setattr(tasks.cache, 'read_popular_articles',
+                        lambda count: [(path, u'master') for path in sorted(articles)])
+    monkeypatch.setattr(tasks.cache, 'computed_expires_in', lambda key: 1000)
+    monkeypatch.setattr(tasks.article_mod, 'article_expires_in',
+                        lambda path, branch: articles[path])
+    monkeypatch.setattr(tasks.file_mod, 'refresh_file',
+                        lambda path, rendered_text: refreshed.append(path))
+    monkeypatch.setattr(tasks.article_mod, 'refresh_article',
+                        lambda path, branch: refreshed.append(path))
+    monkeypatch.setattr(tasks.article_mod, 'rebuild_article_index',
+                        lambda: None)
+
+    tasks._warm_cache(100, 10)
+
+    # Draft listing isn't cached at all
+    assert refreshed == [tasks.file_mod.IN_REVIEW_FILENAME,
+                         tasks.file_mod.DRAFT_FILENAME,
+                         u'published/python/hot']
+
+
+def test_recache_articles_retries_rest_after_rate_limit(monkeypatch):
+    refreshed = []
+    retries = []
+
+    def _refresh_article(path, branch):
+        if len(refreshed) == 1:
+            raise tasks.remote.RateLimitExceeded('No requests left', 30)
+
+        refreshed.append(path)
+
+    def _retry(**kwargs):
+        retries.append(kwargs)
+        return RuntimeError('retry')
+
+    monkeypatch.setattr(tasks.article_mod, 'refresh_article', _refresh_article)
+    monkeypatch.setattr(tasks.recache_articles, 'retry', _retry)
+
+    paths = [u'published/python/a', u'published/python/b',
+             u'published/python/c']
+    try:
+        tasks.recache_articles(paths, u'master')
+    except RuntimeError:
+        pass
+    else:
+        assert False, 'Expected retry'
+
+    assert refreshed == [u'published/python/a']
+    assert retries[0]['args'] == (paths[1:], u'master')
+    assert retries[0]['countdown'] == 30
+
+
+def test_move_article_uses_clone_only_on_conflict(monkeypatch):
+    results = []
+    clones = []
+
+    def _working_clone_path():
+        clones.append(True)
+        raise RuntimeError('clone')
+
+    monkeypatch.setattr(tasks.remote, 'move_directory_on_github',
+                        lambda *args, **kwargs: results[-1])
+    monkeypatch.setattr(tasks, 'working_clone_path', _working_clone_path)
+    monkeypatch.setattr(tasks.article_mod, 'move_article_in_index',
+                        lambda curr_path, new_path: None)
+
+    # Missing source, taken destination, API errors and such
+    results.append(None)
+    assert not tasks.move_article(u'draft/python/foo', u'published/python/foo',
+                                  u'Foo', u'Jane', u'jane@example.com')
+
+    results.append('commit')
+    assert tasks.move_article(u'draft/python/foo', u'published/python/foo',
+                              u'Foo', u'Jane', u'jane@example.com')
+    assert not clones
+
+    results.append(tasks.remote.COMMIT_CONFLICT)
+    try:
+        tasks.move_article(u'draft/python/foo', u'published/python/foo',
+                           u'Foo', u'Jane', u'jane@example.com')
+    except RuntimeError:
+        pass
+
+    assert clones == [True]
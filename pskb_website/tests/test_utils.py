@@ -0,0 +1,56 @@
+"""
+Tests for utils module
+"""
+
+import threading
+import time
+
+import flask
+
+from .. import app
+from .. import utils
+
+
+def test_concurrent_map_preserves_order():
+    def _slow_double(value):
+        # Make earlier items finish last
+        time.sleep((5 - value) * 0.01)
+        return value * 2
+
+    assert utils.concurrent_map(_slow_double, range(5)) == [0, 2, 4, 6, 8]
+    assert utils.concurrent_map(_slow_double, []) == []
+
+
+def test_concurrent_map_respects_max_workers():
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def _track(value):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+
+        time.sleep(0.02)
+
+        with lock:
+            running[0] -= 1
+
+        return value
+
+    assert utils.concurrent_map(_track, range(6), max_workers=2) == range(6)
+    assert peak[0] <= 2
+
+
+def test_concurrent_map_copies_request_context():
+    with app.test_request_context('/?name=guide'):
+        results = utils.concurrent_map(
+                lambda _: flask.request.args['name'], range(3))
+
+    assert results == ['guide'] * 3
+
+
+def test_no_gevent_pool_without_monkey_patching():
+    # Tests don't run under gevent so the standard library isn't patched,
+    # whichever version of gevent is installed, if any
+    assert utils._gevent_pool(2) is None
@@ -2,12 +2,26 @@
 Generic functions for global use
 """
 
+import contextlib
+import errno
+import fcntl
+from multiprocessing.pool import ThreadPool
 import re
+import socket
+import threading
+import time
 from unicodedata import normalize
 import urlparse
 
+import flask
+
 from . import app
 
+DEFAULT_MAX_CONCURRENCY = 8
+
+# Seconds to sleep between attempts to grab a lock file
+LOCK_POLL_INTERVAL = 0.1
+
 _punct_re = re.compile(r'[\t !"#$%&\'()*\-/<=>?@\[\\\]^_`{|},.:]+')
 
 
@@ -60,3 +74,203 @@ def configure_redis_from_url(url):
         app.logger.error('Failed creating redis instance: err: %s', err)
         app.logger.debug('Trace:', exc_info=True)
         return None
+
+
+def int_config(name, default):
+    """
+    Read integer value from app config
+
+    :param name: Name of config value
+    :param default: Value to use if config value is missing or empty
+    :returns: Integer
+
+    Values can come from the environment on heroku, which means they are
+    strings and unset values are empty strings so we handle both here.
+    """
+
+    value = app.config.get(name)
+    if value is None or value == '':
+        return default
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        app.logger.warning('Invalid integer for %s: "%s", using %s', name,
+                           value, default)
+        return default
+
+
+def bool_config(name, default):
+    """
+    Read boolean value from app config
+
+    :param name: Name of config value
+    :param default: Value to use if config value is missing or empty
+    :returns: True or False
+    """
+
+    value = app.config.get(name)
+    if value is None or value == '':
+        return default
+
+    if isinstance(value, basestring):
+        return value.lower() in ('true', 'yes', '1')
+
+    return bool(value)
+
+
+@contextlib.contextmanager
+def file_lock(path, timeout):
+    """
+    Context manager to hold an exclusive lock file shared between processes
+
+    :param path: Path to lock file, created if it doesn't exist
+    :param timeout: Seconds to wait on lock
+    :returns: True if lock was acquired or False otherwise
+    """
+
+    try:
+        lock_file = open(path, 'a')
+    except IOError:
+        app.logger.error('Failed opening lock file "%s"', path, exc_info=True)
+        yield False
+        return
+
+    # Poll instead of blocking so we don't block every greenlet in the
+    # process while waiting.
+    locked = False
+    deadline = time.time() + timeout
+
+    try:
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError as err:
+                if err.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+
+                if time.time() > deadline:
+                    break
+
+                time.sleep(LOCK_POLL_INTERVAL)
+            else:
+                locked = True
+                break
+
+        yield locked
+    finally:
+        if locked:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        lock_file.close()
+
+
+def _gevent_pool(size):
+    """
+    Get gevent pool if the standard library is monkey patched by gevent, i.e.
+    running in a gunicorn gevent worker
+
+    :param size: Max number of greenlets in pool
+    :returns: gevent.pool.Pool object or None if gevent isn't in use
+    """
+
+    try:
+        from gevent import socket as gevent_socket
+        from gevent.pool import Pool
+    except ImportError:
+        return None
+
+    # monkey.is_module_patched() doesn't exist in gevent 1.0 so check what
+    # patching does instead
+    if socket.socket is not gevent_socket.socket:
+        return None
+
+    return Pool(size)
+
+
+def concurrent_map(func, items, max_workers=None):
+    """
+    Call function for each item concurrently
+
+    :param func: Function to call with each item
+    :param items: Iterable of items
+    :param max_workers: Max number of concurrent calls, defaults to the
+                        MAX_CONCURRENCY config value
+    :returns: List of results in the same order as items
+
+    Calls run in greenlets when gevent is in use and threads otherwise.  Each
+    call gets a copy of the current request context, if any, so it can use
+    the session, etc. like the caller.  Exceptions raised by func are
+    re-raised in the caller.
+    """
+
+    items = list(items)
+    if not items:
+        return []
+
+    if max_workers is None:
+        max_workers = int_config('MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY)
+
+    size = max(1, min(max_workers, len(items)))
+    if size == 1:
+        return [func(item) for item in items]
+
+    # Each call needs its own copy of the context b/c contexts keep track of
+    # their own pushes and pops.  The copies must be made here while the
+    # caller's context is active.
+    if flask.has_request_context():
+        calls = [flask.copy_current_request_context(func) for _ in items]
+    elif flask.has_app_context():
+        calls = [_with_app_context(func) for _ in items]
+    else:
+        calls = [func] * len(items)
+
+    def _call(args):
+        return args[0](args[1])
+
+    pool = _gevent_pool(size)
+    if pool is not None:
+        return pool.map(_call, zip(calls, items))
+
+    pool = ThreadPool(size)
+    try:
+        return pool.map(_call, zip(calls, items))
+    finally:
+        pool.close()
+
+
+def spawn(func, *args, **kwargs):
+    """
+    Call function in the background without waiting on it
+
+    :param func: Function to call
+    :param args: Arguments to call function with
+    :param kwargs: Keyword arguments to call function with
+    :returns: None
+
+    The function runs in a daemon thread, which is a greenlet when gevent has
+    monkey patched the standard library.  It gets a new app context and any
+    exception it raises is logged.
+    """
+
+    def _run():
+        try:
+            with app.app_context():
+                func(*args, **kwargs)
+        except Exception:
+            app.logger.exception('Failed running %s in the background',
+                                 getattr(func, '__name__', func))
+
+    thread = threading.Thread(target=_run)
+    thread.daemon = True
+    thread.start()
+
+
+def _with_app_context(func):
+    """Wrap function to run inside a new app context"""
+
+    def _wrapper(*args, **kwargs):
+        with app.app_context():
+            return func(*args, **kwargs)
+
+    return _wrapper
@@ -252,8 +252,11 @@ def my_drafts():
     """Users drafts"""
 
     g.drafts_active = True
-    articles = models.get_articles_for_author(session['login'],
-                                              status=DRAFT)
+    articles = list(models.get_articles_for_author(session['login'],
+                                                   status=DRAFT))
+    if app.config.get('ENABLE_HEARTING'):
+        models.load_heart_counts(articles)
+
     return render_template('drafts.html', articles=articles)
 
 
@@ -419,7 +422,10 @@ def render_article_list_view(status):
     :param status: PUBLISHED, IN_REVIEW, or DRAFT
     """
 
-    articles = models.get_available_articles(status=status)
+    articles = list(models.get_available_articles(status=status))
+    if app.config.get('ENABLE_HEARTING'):
+        models.load_heart_counts(articles)
+
     return render_template('review.html', articles=articles,
                            stacks=forms.STACK_OPTIONS)
 
@@ -809,6 +815,9 @@ def render_published_articles(status_code=200):
     # FIXME: This should only fetch the most recent x number.
     articles = list(models.get_available_articles(status=PUBLISHED))
 
+    if app.config.get('ENABLE_HEARTING'):
+        models.load_heart_counts(articles)
+
     featured_article = models.get_featured_article(articles)
     if featured_article:
         articles.remove(featured_article)
@@ -14,7 +14,9 @@ from . import app
 from . import DRAFT
 from . import PUBLISHED
 from . import cache
+from . import mirror
 from . import models
+from . import tasks
 from .lib import read_article
 from .utils import slugify_stack
 from .models import article as article_mod
@@ -71,8 +73,12 @@ def validate_webhook_source():
 @app.route('/github_push', methods=['POST'])
 def push_event():
     """
-    Detect if any of the pushed commits dealt with a guide and invalidate the
-    cache for those guides.
+    Detect if any of the pushed commits added or modified a guide and
+    invalidate the cache for those guides.  Pushes to master also update the
+    index of where guides are.
+
+    Force pushes can drop commits that aren't listed in the event so they
+    invalidate everything cached for the branch instead.
     """
 
     validate_webhook_source()
@@ -91,36 +97,62 @@ def push_event():
     branch = ref.split('/')[-1]
     cleared = set()
 
+    # Let every process know their mirror is out of date and update ours now
+    # so the guides we re-cache below are read from the new commits.
+    mirror.mark_stale()
+    mirror.refresh()
+
+    if request.json.get('forced'):
+        app.logger.debug('Invalidating branch: "%s" from forced push event',
+                         branch)
+        cache.bump_generation(cache.branch_namespace(branch))
+
+    recache = []
+
     for commit in commits:
         mod_files = _safe_index_json(commit, 'modified',
                                      'No modified found in push event')
         if mod_files is None:
             continue
 
-        for path in _articles(mod_files):
+        # Added guides may have been looked up and remembered as missing
+        added_files = commit.get('added', [])
+        removed_files = commit.get('removed', [])
+
+        # Only guides on master are indexed.  Removals go first so guides
+        # moved within the commit end up indexed at their new path.
+        if branch == u'master':
+            for path in _articles(removed_files):
+                models.unindex_article(path)
+
+            for path in _articles(added_files + mod_files):
+                models.index_article(path)
+
+        for path in _articles(added_files + mod_files):
             if (path, branch) in cleared:
                 continue
 
             app.logger.debug('Invalidating path: "%s", branch: "%s" from push event',
                              path, branch)
 
+            # Also drops the file from memory of every other process
             cache.delete_file(path, branch)
             cleared.add((path, branch))
 
             tokens = path.split('/')
-            try:
-                status = tokens[0]
-                stack = tokens[1]
-                title = tokens[2]
-            except IndexError:
+            if len(tokens) < 3:
                 app.logger.warning('Failing parsing %s to re-cache after push event', path)
                 continue
 
-            # Force a read to cache guide again but only for published guides
-            # to save on space
-            if status == PUBLISHED:
-                article = read_article(stack, title, branch, status,
-                                       rendered_text=False)
+            # Cache guide again but only for published guides to save on
+            # space.
+            if tokens[0] == PUBLISHED:
+                recache.append(path)
+
+    # Reads are background priority so they can wait on the rate limit for
+    # a while, which must not hold up the response to github.
+    if recache:
+        tasks.recache_articles.delay(recache, branch)
 
     return finished
 
@@ -148,6 +180,12 @@ def delete_event():
 
     branch = ref.split('/')[-1]
 
+    # Fetch will prune the deleted branch from any mirrors
+    mirror.mark_stale()
+
+    # Nothing cached for the branch can be read anymore
+    cache.bump_generation(cache.branch_namespace(branch))
+
     # There are '-' separating the components.
     match = re.match(r'([a-zA-Z_-]+?)-(%s{1})-(.+)' % (STACKS_OR), ref)
     if match is None: